@@ -0,0 +1,2 @@
+# Imported first so STARTUP_PROFILE can time every import that follows.
+from app.utils.profiling import startup  # noqa: F401
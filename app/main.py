@@ -1,62 +1,113 @@
 from contextlib import asynccontextmanager
-from datetime import date
-from typing import Any, cast
-from uuid import uuid4
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated, Any, cast
 
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import Field
 from slowapi import Limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
-
-from app.middleware.auth import auth_middleware
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app.middleware.admission import AdmissionControlMiddleware
+from app.middleware.auth import (
+    AUTH,
+    PROBE,
+    PUBLIC,
+    AuthError,
+    access,
+    auth_problem,
+    authenticate,
+    authorize,
+    compile_access_policies,
+)
+from app.middleware.compression import CompressionMiddleware
 from app.middleware.correlation import CorrelationIdMiddleware
+from app.middleware.read_routing import ReadYourWritesMiddleware
 from app.utils import http_client
+from app.utils.change_feed import change_feed, sse_stream
 from app.utils.db import (
-    create_key_result_db,
+    close_pool,
     create_objective_db,
     create_user_db,
-    get_objective_db,
+    get_objective_version_db,
+    get_objective_with_version_db,
+    get_objectives_by_ids_db,
+    get_objectives_version_db,
     get_user_db,
     init_db,
-    list_objectives_for_user_db,
+    iter_objective_tree_db,
+    key_result_series_db,
+    list_objectives_with_version_db,
+    objective_series_db,
+    search_db,
+    update_owned_progress_db,
 )
+from app.utils.etag import check_not_modified, etag_headers, versions
+from app.utils.export import EXPORT_FORMATS
+from app.utils.group_commit import create_owned_key_result, key_result_writer
+from app.utils.idempotency import idempotent
 from app.utils.logger import audit_log
+from app.utils.metrics import metrics
+from app.utils.profiling import startup
+from app.utils.progress import (
+    DEFAULT_WINDOW_DAYS,
+    GRAINS,
+    MAX_SERIES_POINTS,
+    bucket_starts,
+    key_result_points,
+    objective_points,
+)
+from app.utils.readiness import readiness
+from app.utils.responses import FastJSONResponse, problem
+from app.utils.tracing import TracedRoute, correlation_id, traced_middleware
+
+MAX_BIGINT = 2**63 - 1
+# every id that reaches the database is a bigint parameter: one out of range
+# is answered with a 422 here rather than failing in the query
+RowId = Annotated[int, Field(ge=-MAX_BIGINT - 1, le=MAX_BIGINT)]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    with startup.step("init_db"):
+        init_db()
+    startup.log_report()
+    readiness.start()
     yield
+    readiness.close()
+    change_feed.close()
+    key_result_writer.close()
     http_client.close()
+    close_pool()
 
 
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="SecDev Course App", version="0.1.0", lifespan=lifespan)
-app.add_middleware(cast(Any, CorrelationIdMiddleware))
+app = FastAPI(
+    title="SecDev Course App",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+    dependencies=[Depends(authorize)],
+)
+app.router.route_class = TracedRoute
+app.add_middleware(cast(Any, traced_middleware(ReadYourWritesMiddleware)))
 app.state.limiter = limiter  # type: ignore[attr-defined]
-app.add_middleware(SlowAPIMiddleware)  # type: ignore[arg-type]
-app.middleware("http")(auth_middleware)
-
-
-def problem(status: int, title: str, detail: str, type_: str = "about:blank"):
-    cid = str(uuid4())
-    return JSONResponse(
-        {
-            "type": type_,
-            "title": title,
-            "status": status,
-            "detail": detail,
-            "correlation_id": cid,
-        },
-        status_code=status,
-    )
+app.add_middleware(cast(Any, traced_middleware(SlowAPIMiddleware)))
+app.add_middleware(cast(Any, traced_middleware(AdmissionControlMiddleware)))
+app.add_middleware(cast(Any, traced_middleware(CompressionMiddleware)))
+# added last so it runs first: every response, a shed one included, gets
+# the id, and the root span covers the whole stack
+app.add_middleware(cast(Any, CorrelationIdMiddleware))
 
 
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    cid = str(uuid4())
+    cid = correlation_id()
     audit_log(request, "system", f"rate_limit_exceeded cid={cid}", "deny")
     return problem(
         429,
@@ -75,7 +126,7 @@ class ApiError(Exception):
 
 @app.exception_handler(ApiError)
 async def api_error_handler(request: Request, exc: ApiError):
-    cid = str(uuid4())
+    cid = correlation_id()
     type_map = {
         "validation_error": "https://example.com/problems/validation-error",
         "not_found": "https://example.com/problems/not-found",
@@ -96,25 +147,69 @@ async def api_error_handler(request: Request, exc: ApiError):
     )
 
 
+@app.exception_handler(AuthError)
+async def auth_error_handler(request: Request, exc: AuthError):
+    return auth_problem(401, exc.title, exc.detail)
+
+
+@app.exception_handler(StarletteHTTPException)
+async def unknown_route_handler(request: Request, exc: StarletteHTTPException):
+    if exc.status_code == 404 and "route" not in request.scope:
+        # no route matched: treated as protected, so paths cannot be probed
+        # without a token
+        try:
+            authenticate(request)
+        except AuthError as err:
+            return await auth_error_handler(request, err)
+    return await http_exception_handler(request, exc)
+
+
 @app.get("/")
+@access(PUBLIC)
 def root(request: Request):
     return {"status": "ok"}
 
 
 @app.get("/robots.txt", response_class=PlainTextResponse)
+@access(PUBLIC)
 def robots():
     return "User-agent: *\nDisallow:\n"
 
 
 @app.get("/sitemap.xml")
+@access(PUBLIC)
 def sitemap():
     return Response(status_code=404)
 
 
+LIVE_BODY = b'{"status":"ok"}'
+
+
+# probes are not audited: at one every few seconds per pod they would drown
+# everything else in the log
+@app.get("/livez")
 @app.get("/health")
-def health(request: Request):
-    audit_log(request, "system", "health_check", "allow")
-    return {"status": "ok"}
+@access(PROBE)
+async def livez():
+    # no I/O and no threadpool hop: answers as long as the event loop runs
+    return Response(LIVE_BODY, media_type="application/json")
+
+
+@app.get("/readyz")
+@access(PROBE)
+async def readyz():
+    await run_in_threadpool(readiness.start)
+    state = readiness.current()
+    return FastJSONResponse(
+        {"status": "ready" if state.ready else "unready", "checks": state.checks},
+        status_code=200 if state.ready else 503,
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+@access(PUBLIC)
+def metrics_endpoint():
+    return metrics.render()
 
 
 def get_current_user(request: Request):
@@ -127,6 +222,7 @@ def get_current_user(request: Request):
 
 
 @app.post("/users")
+@access(PUBLIC)
 def create_user(request: Request, name: str):
     if not name or len(name) > 100:
         audit_log(request, "system", "create_user_invalid_name", "error")
@@ -135,20 +231,23 @@ def create_user(request: Request, name: str):
         )
     row = create_user_db(name)
     audit_log(request, "system", f"create_user_db_{row['id']}", "allow")
-    return row
+    return FastJSONResponse(row)
 
 
 @app.get("/users/{user_id}")
-def get_user(request: Request, user_id: int):
+@access(PUBLIC)
+def get_user(request: Request, user_id: RowId):
     row = get_user_db(user_id)
     if not row:
         audit_log(request, "system", f"get_user_{user_id}", "not_found")
         raise ApiError(code="not_found", message="user not found", status=404)
     audit_log(request, "system", f"get_user_{user_id}", "allow")
-    return row
+    return FastJSONResponse(row)
 
 
 @app.post("/objectives")
+@idempotent
+@access(AUTH)
 def create_objective(
     request: Request, title: str, period: date, user=Depends(get_current_user)
 ):
@@ -169,37 +268,157 @@ def create_objective(
         )
 
     obj = create_objective_db(user_id, title, period)
+    versions.invalidate(("user-objectives", user_id))
     audit_log(request, str(user_id), f"create_objective_{obj['id']}", "allow")
-    return obj
+    return FastJSONResponse(obj)
 
 
 @app.get("/users/{user_id}/objectives")
-def get_user_objectives(request: Request, user_id: int):
-    user_row = get_user_db(user_id)
-    if not user_row:
+@access(PUBLIC)
+def get_user_objectives(request: Request, user_id: RowId):
+    key = ("user-objectives", user_id)
+    cached = check_not_modified(
+        request, key, lambda: get_objectives_version_db(user_id)
+    )
+    if cached:
+        audit_log(request, "system", f"get_user_objectives_{user_id}", "not_modified")
+        return cached
+
+    found = list_objectives_with_version_db(user_id)
+    if not found:
         audit_log(request, "system", f"get_user_objectives_{user_id}", "not_found")
         raise ApiError(code="not_found", message="user not found", status=404)
 
-    objectives = list_objectives_for_user_db(user_id)
+    objectives, version = found
     audit_log(request, "system", f"get_user_objectives_{user_id}", "allow")
-    return objectives
+    return FastJSONResponse(objectives, headers=etag_headers(key, version))
+
+
+@app.get("/users/{user_id}/objectives/export")
+@access(PUBLIC)
+def export_user_objectives(
+    request: Request, user_id: RowId, format_: str = Query("ndjson", alias="format")
+):
+    if format_ not in EXPORT_FORMATS:
+        audit_log(request, "system", "export_objectives_invalid_format", "error")
+        raise ApiError(
+            code="validation_error",
+            message=f"format must be one of {', '.join(EXPORT_FORMATS)}",
+            status=422,
+        )
+    # checked up front: once streaming starts the status is already sent
+    if not get_user_db(user_id):
+        audit_log(request, "system", f"export_objectives_{user_id}", "not_found")
+        raise ApiError(code="not_found", message="user not found", status=404)
+
+    media_type, render = EXPORT_FORMATS[format_]
+    audit_log(request, "system", f"export_objectives_{user_id}", "allow")
+    return StreamingResponse(
+        render(iter_objective_tree_db(user_id)),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="objectives-{user_id}.{format_}"'
+            )
+        },
+    )
+
+
+MAX_BATCH_IDS = 200
+
+
+@app.get("/objectives")
+@access(PUBLIC)
+def get_objectives_batch(request: Request, ids: str):
+    # counted before anything is parsed, however long the list
+    if ids.count(",") >= MAX_BATCH_IDS:
+        audit_log(request, "system", "get_objectives_batch_invalid_size", "error")
+        raise ApiError(
+            code="validation_error",
+            message=f"ids must contain 1..{MAX_BATCH_IDS} values",
+            status=422,
+        )
+    try:
+        requested = [int(part) for part in ids.split(",") if part.strip()]
+        if any(not -MAX_BIGINT - 1 <= obj_id <= MAX_BIGINT for obj_id in requested):
+            raise ValueError("id out of range")
+    except ValueError:
+        audit_log(request, "system", "get_objectives_batch_invalid_ids", "error")
+        raise ApiError(
+            code="validation_error",
+            message="ids must be a comma-separated list of integers",
+            status=422,
+        )
+    # keep first occurrence so the response follows the caller's order
+    requested = list(dict.fromkeys(requested))
+    if not requested or len(requested) > MAX_BATCH_IDS:
+        audit_log(request, "system", "get_objectives_batch_invalid_size", "error")
+        raise ApiError(
+            code="validation_error",
+            message=f"ids must contain 1..{MAX_BATCH_IDS} values",
+            status=422,
+        )
+
+    found = get_objectives_by_ids_db(requested)
+    items = [found[obj_id] for obj_id in requested if obj_id in found]
+    missing = [obj_id for obj_id in requested if obj_id not in found]
+    audit_log(request, "system", f"get_objectives_batch_{len(requested)}", "allow")
+    return FastJSONResponse({"items": items, "missing": missing})
 
 
 @app.get("/objectives/{obj_id}")
-def get_objective(request: Request, obj_id: int):
-    obj = get_objective_db(obj_id)
-    if not obj:
+@access(PUBLIC)
+def get_objective(request: Request, obj_id: RowId):
+    key = ("objective", obj_id)
+    cached = check_not_modified(request, key, lambda: get_objective_version_db(obj_id))
+    if cached:
+        audit_log(request, "system", f"get_objective_{obj_id}", "not_modified")
+        return cached
+
+    found = get_objective_with_version_db(obj_id)
+    if not found:
         audit_log(request, "system", f"get_objective_{obj_id}", "not_found")
         raise ApiError(code="not_found", message="objective not found", status=404)
+
+    obj, version = found
     audit_log(request, "system", f"get_objective_{obj_id}", "allow")
-    return obj
+    return FastJSONResponse(obj, headers=etag_headers(key, version))
+
+
+@app.get("/changes")
+@access(AUTH)
+async def stream_changes(
+    request: Request,
+    user_id: RowId | None = None,
+    objective_id: RowId | None = None,
+    user=Depends(get_current_user),
+):
+    if user_id is None and objective_id is None:
+        audit_log(request, user["id"], "stream_changes_no_filter", "error")
+        raise ApiError(
+            code="validation_error",
+            message="user_id or objective_id is required",
+            status=422,
+        )
+    await run_in_threadpool(change_feed.start)
+    sub, replay = change_feed.subscribe(
+        user_id, objective_id, request.headers.get("Last-Event-ID")
+    )
+    audit_log(request, user["id"], "stream_changes", "allow")
+    return StreamingResponse(
+        sse_stream(change_feed, sub, replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/key-results")
 @limiter.limit("100/minute")
+@idempotent
+@access(AUTH)
 def create_key_result(
     request: Request,
-    objective_id: int,
+    objective_id: RowId,
     title: str,
     metric: str,
     progress: float = 0.0,
@@ -216,17 +435,163 @@ def create_key_result(
             code="validation_error", message="progress must be 0..1", status=422
         )
 
-    obj = get_objective_db(objective_id)
-    if not obj:
+    owner_id, kr = create_owned_key_result(
+        objective_id, int(user["id"]), title, metric, progress
+    )
+    if owner_id is None:
         audit_log(
             request, user["id"], f"create_key_result_obj_{objective_id}", "not_found"
         )
         raise ApiError(code="not_found", message="objective not found", status=404)
 
-    if int(obj["user_id"]) != int(user["id"]):
+    if kr is None:
         audit_log(request, user["id"], "create_key_result_forbidden", "deny")
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    kr = create_key_result_db(objective_id, title, metric, progress)
     audit_log(request, user["id"], f"create_key_result_{kr['id']}", "allow")
-    return kr
+    return FastJSONResponse(kr)
+
+
+@app.post("/key-results/{kr_id}/progress")
+@limiter.limit("100/minute")
+@access(AUTH)
+def update_key_result_progress(
+    request: Request, kr_id: RowId, progress: float, user=Depends(get_current_user)
+):
+    if progress < 0 or progress > 1:
+        audit_log(request, user["id"], "update_progress_invalid_progress", "error")
+        raise ApiError(
+            code="validation_error", message="progress must be 0..1", status=422
+        )
+
+    owner_id, kr = update_owned_progress_db(kr_id, int(user["id"]), progress)
+    if owner_id is None:
+        audit_log(request, user["id"], f"update_progress_kr_{kr_id}", "not_found")
+        raise ApiError(code="not_found", message="key result not found", status=404)
+
+    if kr is None:
+        audit_log(request, user["id"], "update_progress_forbidden", "deny")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    audit_log(request, user["id"], f"update_progress_kr_{kr_id}", "allow")
+    return FastJSONResponse(kr)
+
+
+def series_window(
+    request: Request, grain: str, since: date | None, until: date | None
+) -> tuple[date, date, list[date]]:
+    # rollup buckets are UTC days
+    until = until or datetime.now(timezone.utc).date()
+    since = since or until - timedelta(days=DEFAULT_WINDOW_DAYS)
+    if grain not in GRAINS:
+        audit_log(request, "system", "progress_series_invalid_grain", "error")
+        raise ApiError(
+            code="validation_error",
+            message=f"grain must be one of {', '.join(GRAINS)}",
+            status=422,
+        )
+    starts = bucket_starts(grain, since, until)
+    if since > until or len(starts) > MAX_SERIES_POINTS:
+        audit_log(request, "system", "progress_series_invalid_window", "error")
+        raise ApiError(
+            code="validation_error",
+            message=f"since..until must span 1..{MAX_SERIES_POINTS} {grain}s",
+            status=422,
+        )
+    return starts[0], until, starts
+
+
+@app.get("/key-results/{kr_id}/progress")
+@access(PUBLIC)
+def get_key_result_progress(
+    request: Request,
+    kr_id: RowId,
+    grain: str = "day",
+    since: date | None = None,
+    until: date | None = None,
+):
+    since, until, _ = series_window(request, grain, since, until)
+    rows = key_result_series_db(kr_id, grain, since, until)
+    if rows is None:
+        audit_log(request, "system", f"get_progress_kr_{kr_id}", "not_found")
+        raise ApiError(code="not_found", message="key result not found", status=404)
+
+    audit_log(request, "system", f"get_progress_kr_{kr_id}", "allow")
+    return FastJSONResponse(
+        {"key_result_id": kr_id, "grain": grain, "points": key_result_points(rows)}
+    )
+
+
+@app.get("/objectives/{obj_id}/progress")
+@access(PUBLIC)
+def get_objective_progress(
+    request: Request,
+    obj_id: RowId,
+    grain: str = "day",
+    since: date | None = None,
+    until: date | None = None,
+):
+    since, until, starts = series_window(request, grain, since, until)
+    rows = objective_series_db(obj_id, grain, since, until)
+    if rows is None:
+        audit_log(request, "system", f"get_progress_objective_{obj_id}", "not_found")
+        raise ApiError(code="not_found", message="objective not found", status=404)
+
+    audit_log(request, "system", f"get_progress_objective_{obj_id}", "allow")
+    return FastJSONResponse(
+        {
+            "objective_id": obj_id,
+            "grain": grain,
+            "points": objective_points(rows, starts),
+        }
+    )
+
+
+MAX_SEARCH_LIMIT = 50
+# every skipped row is still matched and sorted: deep pages cost as much as
+# all the pages before them, so search stops where a user would
+MAX_SEARCH_OFFSET = 1000
+
+
+@app.get("/search")
+@access(AUTH)
+def search(
+    request: Request,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    user=Depends(get_current_user),
+):
+    if not q.strip() or len(q) > 200:
+        audit_log(request, user["id"], "search_invalid_query", "error")
+        raise ApiError(
+            code="validation_error", message="q must be 1..200 chars", status=422
+        )
+    if not 1 <= limit <= MAX_SEARCH_LIMIT or not 0 <= offset <= MAX_SEARCH_OFFSET:
+        audit_log(request, user["id"], "search_invalid_page", "error")
+        raise ApiError(
+            code="validation_error",
+            message=(
+                f"limit must be 1..{MAX_SEARCH_LIMIT}"
+                f" and offset 0..{MAX_SEARCH_OFFSET}"
+            ),
+            status=422,
+        )
+
+    # one row past the page tells whether there is a next one
+    rows = search_db(int(user["id"]), q, limit + 1, offset)
+    audit_log(request, user["id"], "search", "allow")
+    next_offset = offset + limit
+    return FastJSONResponse(
+        {
+            "items": rows[:limit],
+            "next_offset": (
+                next_offset
+                if len(rows) > limit and next_offset <= MAX_SEARCH_OFFSET
+                else None
+            ),
+        }
+    )
+
+
+app.state.access_policies = compile_access_policies(app.routes)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.middleware.read_routing import WRITE_METHODS
+from app.utils import db
+from app.utils.metrics import metrics
+from app.utils.responses import problem
+from app.utils.tracing import span
+
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", str(db.DB_POOL_MAX)))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", str(4 * db.DB_POOL_MAX)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1.0"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# no database work behind these (the change feed only holds a subscription)
+EXEMPT_PATHS = {
+    "/",
+    "/health",
+    "/livez",
+    "/readyz",
+    "/metrics",
+    "/robots.txt",
+    "/sitemap.xml",
+    "/changes",
+}
+
+
+def route_class(method: str, path: str) -> str | None:
+    if path in EXEMPT_PATHS:
+        return None
+    if path.endswith("/export"):
+        # holds a connection for the whole download
+        return "export"
+    return "write" if method in WRITE_METHODS else "read"
+
+
+# Concurrency limit steered by latency: a slow moving average of request
+# latency serves as the no-load baseline; when requests run slower than
+# tolerance times that baseline the limit shrinks in proportion, otherwise
+# it creeps up by sqrt(limit).
+class GradientLimit:
+    def __init__(
+        self,
+        initial: int = ADMISSION_INITIAL_LIMIT,
+        min_limit: int = ADMISSION_MIN_LIMIT,
+        max_limit: int = ADMISSION_MAX_LIMIT,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        window: int = 600,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.window = window
+        self.baseline = 0.0
+
+    def update(self, latency: float, in_flight: int) -> None:
+        latency = max(latency, 1e-6)
+        if not self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) / self.window
+        if self.baseline / latency > 2:
+            # load has gone away: let the baseline catch up with it quickly
+            self.baseline *= 0.95
+        if in_flight < self.limit / 2:
+            # an idle limit says nothing about what the database can take
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline / latency))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+
+class Gate:
+    # all state is touched from the event loop only
+    def __init__(
+        self,
+        limit: GradientLimit,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+
+    async def acquire(self) -> str | None:
+        # None once admitted, otherwise why the request is shed
+        if not self.waiters and self.in_flight < int(self.limit.limit):
+            self.in_flight += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # the slot may have been handed over just as the wait ran out
+            if not (waiter.done() and not waiter.cancelled()):
+                return "timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._free_slot()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        return None
+
+    def release(self, latency: float) -> None:
+        self.limit.update(latency, self.in_flight)
+        self._free_slot()
+
+    def _free_slot(self) -> None:
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < int(self.limit.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+
+
+gates = {name: Gate(GradientLimit()) for name in ("read", "write", "export")}
+
+metrics.counter("admission_shed_total", "Requests shed by admission control")
+for _name, _gate in gates.items():
+    metrics.gauge(
+        "admission_queue_depth",
+        "Requests waiting for admission",
+        lambda gate=_gate: len(gate.waiters),
+        route_class=_name,
+    )
+    metrics.gauge(
+        "admission_in_flight",
+        "Admitted requests not yet finished",
+        lambda gate=_gate: gate.in_flight,
+        route_class=_name,
+    )
+    metrics.gauge(
+        "admission_limit",
+        "Current adaptive concurrency limit",
+        lambda gate=_gate: int(gate.limit.limit),
+        route_class=_name,
+    )
+
+
+# Caps concurrent requests per route class so that a slow database sees a
+# steady load instead of an ever-growing pile of threads and connections;
+# whatever does not fit in the short queue is turned away at once.
+class AdmissionControlMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        name = (
+            route_class(scope["method"], scope["path"])
+            if scope["type"] == "http"
+            else None
+        )
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        gate = gates[name]
+        with span("admission", route_class=name) as waited:
+            reason = await gate.acquire()
+            waited.set(outcome=reason or "admitted")
+        if reason is not None:
+            metrics.inc("admission_shed_total", route_class=name, reason=reason)
+            response = problem(
+                503,
+                "Service Unavailable",
+                "The service is overloaded, retry shortly.",
+                type_="https://example.com/problems/overloaded",
+            )
+            response.headers["Retry-After"] = str(ADMISSION_RETRY_AFTER)
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - start)
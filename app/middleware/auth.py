@@ -1,13 +1,14 @@
 import os
 from datetime import datetime, timedelta, timezone
-from uuid import uuid4
+from typing import Any, Callable, Iterable, TypeVar
 
 import jwt
 from fastapi import Request
+from fastapi.routing import APIRoute
 from jwt import InvalidTokenError as JWTError
-from starlette.responses import JSONResponse
 
 from app.utils.logger import audit_log
+from app.utils.responses import problem
 from app.utils.secrets import get_jwt_secret
 
 JWT_SECRET = get_jwt_secret()
@@ -32,66 +33,69 @@ def make_jwt(sub: str = "1", minutes: int = 5, valid: bool = True):
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
-PUBLIC_PATHS = {
-    "/",
-    "/health",
-    "/robots.txt",
-    "/sitemap.xml",
-    "/openapi.json",
-    "/docs",
-    "/redoc",
-}
+# Access policies (ADR-003), declared on every route with @access():
+#   PROBE  - public and not audited (orchestrator probes)
+#   PUBLIC - public, every access audited
+#   AUTH   - a valid bearer token is required; ownership is the handler's job
+PROBE = "probe"
+PUBLIC = "public"
+AUTH = "auth"
+POLICIES = (PROBE, PUBLIC, AUTH)
 
+F = TypeVar("F", bound=Callable[..., Any])
 
-def auth_problem(status_code: int, title: str, detail: str):
-    return JSONResponse(
-        {
-            "type": "https://example.com/problems/auth-error",
-            "title": title,
-            "status": status_code,
-            "detail": detail,
-            "correlation_id": str(uuid4()),
-        },
-        status_code=status_code,
-    )
 
+def access(policy: str) -> Callable[[F], F]:
+    # goes below the route decorator so the route sees the marked function
+    if policy not in POLICIES:
+        raise ValueError(f"unknown access policy {policy!r}")
 
-async def auth_middleware(request: Request, call_next):
-    raw_path = request.url.path
-    path = raw_path.rstrip("/") or "/"
-    method = request.method.upper()
+    def mark(endpoint: F) -> F:
+        endpoint.access_policy = policy  # type: ignore[attr-defined]
+        return endpoint
 
-    if path in PUBLIC_PATHS:
-        response = await call_next(request)
-        audit_log(request, "public", "access", "allow")
-        return response
+    return mark
 
-    if path.startswith("/users"):
-        response = await call_next(request)
-        audit_log(request, "public", "access", "allow")
-        return response
 
-    if path.startswith("/users/") and path.endswith("/objectives") and method == "GET":
-        response = await call_next(request)
-        audit_log(request, "public", "access", "allow")
-        return response
+def compile_access_policies(routes: Iterable[Any]) -> dict[tuple[str, str], str]:
+    # (route template, method) -> policy; refuses to start with a route
+    # that does not say who may call it
+    table: dict[tuple[str, str], str] = {}
+    missing = []
+    for route in routes:
+        if not isinstance(route, APIRoute):
+            # FastAPI's own docs and schema routes: public, no dependencies
+            continue
+        policy = getattr(route.endpoint, "access_policy", None)
+        if policy is None:
+            missing.append(f"{','.join(sorted(route.methods))} {route.path}")
+            continue
+        for method in route.methods:
+            table[(route.path_format, method)] = policy
+    if missing:
+        raise RuntimeError(f"routes without an access policy: {'; '.join(missing)}")
+    return table
 
-    if (
-        path.startswith("/objectives/") or path.startswith("/key-results/")
-    ) and method == "GET":
-        return await call_next(request)
 
+class AuthError(Exception):
+    def __init__(self, title: str, detail: str | None = None) -> None:
+        self.title = title
+        self.detail = detail or title
+
+
+def auth_problem(status_code: int, title: str, detail: str):
+    return problem(
+        status_code, title, detail, type_="https://example.com/problems/auth-error"
+    )
+
+
+def authenticate(request: Request) -> dict[str, Any]:
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         audit_log(request, "anonymous", "auth_missing_header", "deny")
-        return auth_problem(
-            401,
-            "Missing or invalid Authorization header",
-            "Missing or invalid Authorization header",
-        )
+        raise AuthError("Missing or invalid Authorization header")
 
     token = auth_header.removeprefix("Bearer ").strip()
-
     try:
         payload = jwt.decode(
             token,
@@ -100,26 +104,33 @@ async def auth_middleware(request: Request, call_next):
             audience=JWT_AUDIENCE,
             issuer=JWT_ISSUER,
         )
-
-        now = datetime.now(timezone.utc).timestamp()
-        exp = payload.get("exp")
-        nbf = payload.get("nbf")
-        sub = payload.get("sub")
-
-        if not sub:
-            return auth_problem(
-                401, "Token missing sub claim", "Token missing sub claim"
-            )
-        if exp and now > exp:
-            return auth_problem(401, "Token expired", "Token expired")
-        if nbf and now < nbf:
-            return auth_problem(401, "Token not yet valid", "Token not yet valid")
-
-        request.state.user = {"id": sub, "claims": payload}
-
     except JWTError:
         audit_log(request, "anonymous", "auth_invalid_token", "deny")
-        return auth_problem(401, "Invalid token", "Invalid token")
-
-    request.state.user = {"id": sub, "claims": payload}
-    return await call_next(request)
+        raise AuthError("Invalid token")
+
+    now = datetime.now(timezone.utc).timestamp()
+    exp = payload.get("exp")
+    nbf = payload.get("nbf")
+    sub = payload.get("sub")
+    if not sub:
+        raise AuthError("Token missing sub claim")
+    if exp and now > exp:
+        raise AuthError("Token expired")
+    if nbf and now < nbf:
+        raise AuthError("Token not yet valid")
+
+    user = {"id": sub, "claims": payload}
+    request.state.user = user
+    return user
+
+
+def authorize(request: Request) -> None:
+    # app-wide dependency: runs once the router has matched, so the policy
+    # is a single lookup by route template and method
+    policy = request.app.state.access_policies[
+        (request.scope["route"].path_format, request.method)
+    ]
+    if policy == PUBLIC:
+        audit_log(request, "public", "access", "allow")
+    elif policy == AUTH:
+        authenticate(request)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Callable
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.etag import coded_etag
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "application/problem+json")
+# preferred first when the client weighs encodings equally
+SUPPORTED_ENCODINGS = ("br", "gzip")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _brotli(quality: int) -> Callable[[bytes, bool], bytes]:
+    compressor = brotli.Compressor(quality=quality)
+
+    def encode(body: bytes, more_body: bool) -> bytes:
+        data = compressor.process(body)
+        # flush so every streamed chunk reaches the client promptly
+        return data + (compressor.flush() if more_body else compressor.finish())
+
+    return encode
+
+
+def _gzip(level: int) -> Callable[[bytes, bool], bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def encode(body: bytes, more_body: bool) -> bytes:
+        flush = zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+        return compressor.compress(body) + compressor.flush(flush)
+
+    return encode
+
+
+def _compressible(message: Message) -> bool:
+    headers = Headers(raw=message["headers"])
+    # error bodies (RFC 7807 problems) are small and not worth the CPU
+    return not (
+        message["status"] >= 400
+        or message["status"] in (204, 304)
+        or "content-encoding" in headers
+        or headers.get("content-type", "").startswith(EXCLUDED_CONTENT_TYPES)
+    )
+
+
+class _Responder:
+    # holds back the response start until the first body chunk shows
+    # whether the body is worth compressing; coding None sends it as is
+    def __init__(
+        self,
+        send: Send,
+        minimum_size: int,
+        coding: str | None,
+        encode: Callable[[bytes, bool], bytes] | None,
+    ) -> None:
+        self.send = send
+        self.minimum_size = minimum_size
+        self.coding = coding
+        self.encode = encode
+        self.start: Message | None = None
+        self.compressing = False
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            if _compressible(message):
+                self.start = message
+            else:
+                await self.send(message)
+            return
+        if self.start is None:
+            if self.compressing and message["type"] == "http.response.body":
+                assert self.encode is not None
+                message["body"] = self.encode(
+                    message.get("body", b""), message.get("more_body", False)
+                )
+            await self.send(message)
+            return
+
+        start, self.start = self.start, None
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if message["type"] != "http.response.body" or (
+            len(body) < self.minimum_size and not more_body
+        ):
+            await self.send(start)
+            await self.send(message)
+            return
+
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if self.coding is not None and self.encode is not None:
+            self.compressing = True
+            message["body"] = self.encode(body, more_body)
+            headers["Content-Encoding"] = self.coding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            # a strong validator names one exact byte sequence: each coding
+            # of a resource gets its own (RFC 9110 8.8.3)
+            if "etag" in headers:
+                headers["ETag"] = coded_etag(headers["etag"], self.coding)
+        await self.send(start)
+        await self.send(message)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = choose_encoding(Headers(scope=scope).get("Accept-Encoding", ""))
+        encode = None
+        if coding == "br":
+            encode = _brotli(self.brotli_quality)
+        elif coding == "gzip":
+            encode = _gzip(self.gzip_level)
+        responder = _Responder(send, self.minimum_size, coding, encode)
+        await self.app(scope, receive, responder)
@@ -1,12 +1,40 @@
 import uuid
 
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import Message, Receive, Scope, Send
 
+from app.utils.tracing import CORRELATION_HEADER, request_trace
 
-class CorrelationIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        cid = request.headers.get("x-correlation-id") or str(uuid.uuid4())
-        request.state.correlation_id = cid
-        response = await call_next(request)
-        response.headers.setdefault("x-correlation-id", cid)
-        return response
+HEADER = CORRELATION_HEADER.encode()
+
+
+# Outermost middleware, so that every response (a shed request's included)
+# carries the id, and so that the root span lasts until the body is sent.
+class CorrelationIdMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cid = dict(scope["headers"]).get(HEADER, b"").decode("latin-1")
+        cid = cid or str(uuid.uuid4())
+        scope.setdefault("state", {})["correlation_id"] = cid
+
+        with request_trace(cid) as root:
+
+            async def send_with_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.set(status_code=message["status"])
+                    headers = list(message.get("headers", []))
+                    if not any(k.lower() == HEADER for k, _ in headers):
+                        headers.append((HEADER, cid.encode("latin-1")))
+                    message["headers"] = headers
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+            # the route template rather than the path keeps span names few
+            route = getattr(scope.get("route"), "path_format", scope["path"])
+            root.name = f"{scope['method']} {route}"
+            root.set(method=scope["method"], route=route)
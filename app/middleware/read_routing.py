@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import math
+import time
+from http.cookies import SimpleCookie
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils import db
+
+RYW_COOKIE = "okr_rw"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def _last_write(scope: Scope) -> float | None:
+    raw = Headers(scope=scope).get("cookie")
+    if not raw:
+        return None
+    morsel = SimpleCookie(raw).get(RYW_COOKIE)
+    if morsel is None:
+        return None
+    try:
+        written = float(morsel.value)
+    except ValueError:
+        return None
+    # the cookie is client-supplied: a write stamped further ahead than the
+    # window is forged, and would pin its reads to the primary for as long
+    if not math.isfinite(written) or written > time.time() + db.DB_RYW_WINDOW:
+        return None
+    return written
+
+
+# Remembers a client's last successful write in a short-lived cookie so its
+# next reads stay on the primary until the replica has caught up. A cookie
+# rather than server state keeps this correct across workers.
+class ReadYourWritesMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not db.has_replica():
+            await self.app(scope, receive, send)
+            return
+
+        is_write = scope["method"] in WRITE_METHODS
+
+        async def send_with_cookie(message: Message) -> None:
+            if (
+                is_write
+                and message["type"] == "http.response.start"
+                and message["status"] < 400
+            ):
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{RYW_COOKIE}={time.time():.3f}; "
+                    f"Max-Age={math.ceil(db.DB_RYW_WINDOW)}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        token = db.last_write_at.set(_last_write(scope))
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            db.last_write_at.reset(token)
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator
+
+import psycopg2
+
+from app.utils import db
+from app.utils.metrics import metrics
+from app.utils.responses import dumps
+
+FEED_BUFFER_SIZE = int(os.getenv("FEED_BUFFER_SIZE", "1000"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "100"))
+FEED_HEARTBEAT_SECONDS = float(os.getenv("FEED_HEARTBEAT_SECONDS", "15"))
+FEED_CONNECT_TIMEOUT = float(os.getenv("FEED_CONNECT_TIMEOUT", "5"))
+# how long a gap in the sequence is waited for before it is taken for a
+# rolled-back write; a transaction that commits later is still delivered
+# live, but not replayed to clients resuming past it
+FEED_SETTLE_SECONDS = float(os.getenv("FEED_SETTLE_SECONDS", "30"))
+
+# last value handed out by okr_change_seq, 0 before the first event
+CHANGE_SEQ_POSITION_SQL = """
+SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM okr_change_seq
+"""
+
+logger = logging.getLogger("change_feed")
+
+metrics.counter("change_feed_events_total", "Change notifications received")
+metrics.counter("change_feed_dropped_total", "Subscribers dropped for falling behind")
+
+
+# seq is drawn when a row is written but notifications arrive in commit
+# order, so a lower seq can follow a higher one. The resume point is the
+# shard's watermark instead: every seq at or below it has arrived (or was
+# given up on). Replaying from it can repeat an event, never skip one.
+@dataclass(frozen=True, slots=True)
+class Change:
+    shard: int
+    seq: int
+    type: str
+    data: dict[str, Any]
+    watermark: int = 0
+
+
+def _reset(shard: int, seq: int) -> Change:
+    return Change(shard, seq, "reset", {}, seq)
+
+
+def _settled(shard: int, watermark: int) -> Change:
+    # moves cursors along without being sent to anyone
+    return Change(shard, watermark, "settled", {}, watermark)
+
+
+def parse_cursor(raw: str | None, shards: int) -> list[int] | None:
+    # Last-Event-ID: one dot-separated sequence position per shard
+    if not raw:
+        return None
+    try:
+        cursor = [int(part) for part in raw.split(".")]
+    except ValueError:
+        return None
+    return cursor if len(cursor) == shards else None
+
+
+@dataclass(eq=False)
+class Subscriber:
+    user_id: int | None
+    objective_id: int | None
+    cursor: list[int]
+    loop: asyncio.AbstractEventLoop
+    limit: int = FEED_QUEUE_SIZE
+    pending: deque[tuple[Change, str]] = field(default_factory=deque)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    dropped: bool = False
+
+    def wants(self, change: Change) -> bool:
+        if change.type == "reset":
+            return True
+        if change.type == "settled":
+            return False
+        if self.user_id is not None and change.data.get("user_id") != self.user_id:
+            return False
+        if (
+            self.objective_id is not None
+            and change.data.get("objective_id") != self.objective_id
+        ):
+            return False
+        return True
+
+    def cursor_id(self) -> str:
+        return ".".join(map(str, self.cursor))
+
+    def advance(self, change: Change) -> bool:
+        self.cursor[change.shard] = max(self.cursor[change.shard], change.watermark)
+        return self.wants(change)
+
+    def push(self, change: Change) -> None:
+        # runs on the subscriber's event loop; every event moves the cursor
+        # so the resume token never lags behind what was filtered out
+        if self.dropped or not self.advance(change):
+            return
+        if len(self.pending) >= self.limit:
+            # a slow consumer is cut loose rather than buffered without
+            # bound; it resumes from its last event id on reconnect
+            self.dropped = True
+            self.pending.clear()
+            metrics.inc("change_feed_dropped_total")
+        else:
+            self.pending.append((change, self.cursor_id()))
+        self.wakeup.set()
+
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int = FEED_BUFFER_SIZE) -> None:
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers: set[Subscriber] = set()
+        self._buffers: list[deque[Change]] = []
+        # per shard: oldest position a client can still resume from
+        self._baselines: list[int] = []
+        self._watermarks: list[int] = []
+        # per shard: seqs arrived above the watermark, with when they did
+        self._early: list[dict[int, float]] = []
+        self._connected: list[threading.Event] = []
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        # one LISTEN connection per shard, shared by every subscriber of
+        # this worker; blocks until each has reported its starting position
+        with self._lock:
+            if not self._threads:
+                count = len(db.shards)
+                self._stopping.clear()
+                self._buffers = [deque() for _ in range(count)]
+                self._baselines = [0] * count
+                self._watermarks = [0] * count
+                self._early = [{} for _ in range(count)]
+                self._connected = [threading.Event() for _ in range(count)]
+                self._threads = [
+                    threading.Thread(
+                        target=self._listen,
+                        args=(index,),
+                        name=f"change-feed-{index}",
+                        daemon=True,
+                    )
+                    for index in range(count)
+                ]
+                for thread in self._threads:
+                    thread.start()
+        for connected in self._connected:
+            connected.wait(FEED_CONNECT_TIMEOUT)
+
+    def close(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    def subscribe(
+        self,
+        user_id: int | None,
+        objective_id: int | None,
+        last_event_id: str | None = None,
+        limit: int = FEED_QUEUE_SIZE,
+    ) -> tuple[Subscriber, list[tuple[Change, str]]]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            resume = parse_cursor(last_event_id, len(self._watermarks))
+            sub = Subscriber(
+                user_id, objective_id, resume or list(self._watermarks), loop, limit
+            )
+            replay: list[tuple[Change, str]] = []
+            # replay and registration happen under the publish lock, so no
+            # event falls between the two or is delivered twice
+            for shard, buffer in enumerate(self._buffers):
+                if resume is None:
+                    continue
+                if resume[shard] < self._baselines[shard]:
+                    # the buffer no longer reaches back that far
+                    gap = _reset(shard, self._watermarks[shard])
+                    sub.advance(gap)
+                    replay.append((gap, sub.cursor_id()))
+                    continue
+                for change in buffer:
+                    if change.seq > resume[shard] and sub.advance(change):
+                        replay.append((change, sub.cursor_id()))
+                sub.cursor[shard] = max(sub.cursor[shard], self._watermarks[shard])
+            self._subscribers.add(sub)
+        return sub, replay
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _settle(self, shard: int) -> int:
+        # under the lock: raises the watermark over every seq that has
+        # arrived in order, and over gaps open for longer than the grace
+        early = self._early[shard]
+        mark = self._watermarks[shard]
+        now = time.monotonic()
+        while early:
+            if mark + 1 in early:
+                mark += 1
+                del early[mark]
+            elif now - min(early.values()) >= FEED_SETTLE_SECONDS:
+                mark = min(early) - 1
+            else:
+                break
+        self._watermarks[shard] = mark
+        return mark
+
+    def _receive(self, change: Change) -> None:
+        metrics.inc("change_feed_events_total")
+        with self._lock:
+            if change.seq > self._watermarks[change.shard]:
+                self._early[change.shard][change.seq] = time.monotonic()
+            change = replace(change, watermark=self._settle(change.shard))
+            buffer = self._buffers[change.shard]
+            if len(buffer) >= self.buffer_size:
+                # the oldest to arrive is not necessarily the lowest seq
+                dropped = buffer.popleft().seq
+                self._baselines[change.shard] = max(
+                    self._baselines[change.shard], dropped
+                )
+            buffer.append(change)
+        self._publish(change)
+
+    def _tick(self, shard: int) -> None:
+        with self._lock:
+            before = self._watermarks[shard]
+            after = self._settle(shard)
+        if after != before:
+            self._publish(_settled(shard, after))
+
+    def _publish(self, change: Change) -> None:
+        with self._lock:
+            for sub in list(self._subscribers):
+                try:
+                    sub.loop.call_soon_threadsafe(sub.push, change)
+                except RuntimeError:
+                    # its event loop is gone without the stream having ended
+                    self._subscribers.discard(sub)
+
+    def _on_connect(self, shard: int, position: int) -> None:
+        with self._lock:
+            reconnect = self._connected[shard].is_set()
+            # anything between the last event heard and this position may
+            # have been missed: resuming from before it means starting over
+            self._buffers[shard].clear()
+            self._early[shard].clear()
+            self._baselines[shard] = position
+            self._watermarks[shard] = position
+        if reconnect:
+            self._publish(_reset(shard, position))
+        self._connected[shard].set()
+
+    def _listen(self, shard: int) -> None:
+        delay = 0.05
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(db.shards[shard].primary.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {db.CHANGES_CHANNEL}")
+                    cur.execute(CHANGE_SEQ_POSITION_SQL)
+                    position = cur.fetchone()[0]
+                self._on_connect(shard, position)
+                delay = 0.05
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        self._tick(shard)
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = json.loads(conn.notifies.pop(0).payload)
+                        seq = payload.pop("seq")
+                        self._receive(Change(shard, seq, payload.pop("type"), payload))
+            except psycopg2.Error:
+                logger.exception("change feed listener for shard %d failed", shard)
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def _frame(change: Change, event_id: str) -> bytes:
+    head = f"id: {event_id}\nevent: {change.type}\ndata: ".encode()
+    return head + dumps(change.data) + b"\n\n"
+
+
+async def sse_stream(
+    feed: ChangeFeed,
+    sub: Subscriber,
+    replay: list[tuple[Change, str]],
+    heartbeat: float = FEED_HEARTBEAT_SECONDS,
+) -> AsyncIterator[bytes]:
+    try:
+        for change, event_id in replay:
+            yield _frame(change, event_id)
+        while not sub.dropped:
+            try:
+                await asyncio.wait_for(sub.wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                # an id-only block is not dispatched by EventSource but does
+                # move its Last-Event-ID, and keeps proxies from timing out
+                yield f"id: {sub.cursor_id()}\n\n".encode()
+                continue
+            sub.wakeup.clear()
+            while sub.pending:
+                yield _frame(*sub.pending.popleft())
+    finally:
+        feed.unsubscribe(sub)
+
+
+change_feed = ChangeFeed()
@@ -1,171 +1,1483 @@
 from __future__ import annotations
 
+import json
 import os
+import random
+import threading
 import time
-from datetime import date
-from typing import Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Iterator, TypeVar
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import errors, pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extensions import connection as PgConnection
+from psycopg2.extensions import cursor as TupleCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+from app.utils.metrics import metrics
+from app.utils.tracing import annotate, traced
 
 DB_DSN = os.getenv("DB_DSN", "postgresql://app:app@db:5432/app")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5.0"))
+# optional streaming replica for read-only helpers
+DB_READ_DSN = os.getenv("DB_READ_DSN", "")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "1.0"))
+DB_REPLICA_LAG_TTL = float(os.getenv("DB_REPLICA_LAG_TTL", "1.0"))
+DB_RYW_WINDOW = float(os.getenv("DB_RYW_WINDOW", "5.0"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# monthly progress-history partitions kept ready beyond the current month
+PROGRESS_PARTITIONS_AHEAD = int(os.getenv("PROGRESS_PARTITIONS_AHEAD", "3"))
+# quarterly objective/key-result partitions kept ready beyond the current one
+PERIOD_PARTITIONS_AHEAD = int(os.getenv("PERIOD_PARTITIONS_AHEAD", "4"))
+# how long a stored response answers retries with the same Idempotency-Key,
+# and how long a retry waits for its original to finish
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+# comma-separated primaries (and, positionally, their replicas); when set,
+# every user lives on one of them together with all of its rows
+DB_SHARD_DSNS = [dsn for dsn in os.getenv("DB_SHARD_DSNS", "").split(",") if dsn]
+DB_SHARD_READ_DSNS = os.getenv("DB_SHARD_READ_DSNS", "").split(",")
+DB_SHARD_MAP_FILE = os.getenv("DB_SHARD_MAP_FILE", "")
+# fixed for the lifetime of the data: ids are seq * ID_BUCKETS + bucket, so
+# the bucket (and with it the shard) can be read off any id. Unsharded, this
+# is 1 and ids are plain sequence values.
+SHARD_BUCKETS = 1024
+ID_BUCKETS = SHARD_BUCKETS if DB_SHARD_DSNS else 1
+
+T = TypeVar("T")
+
 CREATE_USERS_SQL = """
 CREATE TABLE IF NOT EXISTS users (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL PRIMARY KEY,
     name TEXT NOT NULL
 );
 """
 
 
+# databases created before sharding have a SERIAL (integer) users.id, which
+# bucket-encoded ids outgrow once the sequence passes ~2.1M; widened in
+# place, and only when it is still narrow (the ALTER rewrites the table)
+WIDEN_USERS_ID_SQL = """
+DO $$
+DECLARE
+    seq TEXT := pg_get_serial_sequence('users', 'id');
+BEGIN
+    IF (SELECT atttypid FROM pg_attribute
+        WHERE attrelid = 'users'::regclass AND attname = 'id') <> 'bigint'::regtype
+    THEN
+        ALTER TABLE users ALTER COLUMN id TYPE bigint;
+    END IF;
+    IF (SELECT seqtypid FROM pg_sequence WHERE seqrelid = seq::regclass)
+        <> 'bigint'::regtype
+    THEN
+        EXECUTE format('ALTER SEQUENCE %s AS bigint', seq);
+    END IF;
+END
+$$;
+"""
+
+
+# per-user change counter backing the ETag of GET /users/{id}/objectives
+ALTER_USERS_VERSION_SQL = """
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS objectives_version BIGINT NOT NULL DEFAULT 0;
+"""
+
+
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END AS lag
+"""
+
+
+# objectives and their key results are range-partitioned by the quarter of
+# the objective's period: closed quarters can be detached wholesale and
+# indexes of active periods stay small. The partition key must be part of
+# every unique key, hence (id, period) and the composite foreign key.
 CREATE_OBJECTIVES_SQL = """
 CREATE TABLE IF NOT EXISTS objectives (
-    id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    id BIGSERIAL,
+    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     title TEXT NOT NULL,
-    period DATE NOT NULL
-);
+    period DATE NOT NULL,
+    PRIMARY KEY (id, period)
+) PARTITION BY RANGE (period);
+
+CREATE TABLE IF NOT EXISTS objectives_default PARTITION OF objectives DEFAULT;
+
+CREATE INDEX IF NOT EXISTS objectives_user_idx ON objectives (user_id, id);
 """
 
 CREATE_KEY_RESULTS_SQL = """
 CREATE TABLE IF NOT EXISTS key_results (
-    id SERIAL PRIMARY KEY,
-    objective_id INTEGER NOT NULL REFERENCES objectives(id) ON DELETE CASCADE,
+    id BIGSERIAL,
+    objective_id BIGINT NOT NULL,
+    period DATE NOT NULL,
     title TEXT NOT NULL,
     metric TEXT NOT NULL,
-    progress NUMERIC(5,2) NOT NULL DEFAULT 0
+    progress NUMERIC(5,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, period),
+    FOREIGN KEY (objective_id, period)
+        REFERENCES objectives (id, period) ON DELETE CASCADE
+) PARTITION BY RANGE (period);
+
+CREATE TABLE IF NOT EXISTS key_results_default PARTITION OF key_results DEFAULT;
+
+CREATE INDEX IF NOT EXISTS key_results_objective_idx
+    ON key_results (objective_id, id);
+"""
+
+# full-text search over the caller's OKRs. The 'simple' configuration does
+# no stemming or stop-word removal, so titles in any language match as
+# written; each partition gets its own GIN index. Adding the columns
+# rewrites every partition: init only does so for tables it has just
+# created, existing ones get them from tools/maintain_partitions.py migrate.
+SEARCH_CONFIG = "simple"
+
+ADD_SEARCH_SQL = f"""
+ALTER TABLE objectives ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', title)) STORED;
+ALTER TABLE key_results ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('{SEARCH_CONFIG}', title || ' ' || metric)
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS objectives_search_idx
+    ON objectives USING gin (search);
+CREATE INDEX IF NOT EXISTS key_results_search_idx
+    ON key_results USING gin (search);
+"""
+
+# held for the rest of the transaction by whatever changes the schema (init
+# on every worker start, the partition migration): they run one at a time
+SCHEMA_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('okr_schema'))"
+
+IS_PARTITIONED_SQL = """
+SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = to_regclass(%s)
+"""
+
+HAS_SEARCH_SQL = """
+SELECT count(*) = 2 AS searchable FROM pg_attribute
+WHERE attrelid IN ('objectives'::regclass, 'key_results'::regclass)
+    AND attname = 'search' AND NOT attisdropped
+"""
+
+# one-off move of pre-partitioning tables into the partitioned layout, run
+# offline by tools/maintain_partitions.py migrate; ids, and the sequence
+# positions they were drawn from, carry over unchanged
+MIGRATE_TO_PARTITIONED_SQL = """
+ALTER TABLE IF EXISTS key_result_progress
+    DROP CONSTRAINT IF EXISTS key_result_progress_key_result_id_fkey;
+ALTER TABLE IF EXISTS progress_rollups
+    DROP CONSTRAINT IF EXISTS progress_rollups_key_result_id_fkey;
+
+ALTER TABLE key_results RENAME TO key_results_unpartitioned;
+ALTER TABLE key_results_unpartitioned
+    RENAME CONSTRAINT key_results_pkey TO key_results_unpartitioned_pkey;
+ALTER TABLE objectives RENAME TO objectives_unpartitioned;
+ALTER TABLE objectives_unpartitioned
+    RENAME CONSTRAINT objectives_pkey TO objectives_unpartitioned_pkey;
+"""
+
+COPY_UNPARTITIONED_SQL = """
+INSERT INTO objectives (id, user_id, title, period)
+SELECT id, user_id, title, period FROM objectives_unpartitioned;
+
+INSERT INTO key_results (id, objective_id, period, title, metric, progress)
+SELECT k.id, k.objective_id, o.period, k.title, k.metric, k.progress
+FROM key_results_unpartitioned k
+JOIN objectives_unpartitioned o ON o.id = k.objective_id;
+
+DO $$
+DECLARE
+    tbl TEXT;
+    pos BIGINT;
+    called BOOLEAN;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['objectives', 'key_results'] LOOP
+        EXECUTE format(
+            'SELECT last_value, is_called FROM %s',
+            pg_get_serial_sequence(tbl || '_unpartitioned', 'id')
+        ) INTO pos, called;
+        PERFORM setval(pg_get_serial_sequence(tbl, 'id'), pos, called);
+    END LOOP;
+END
+$$;
+
+DROP TABLE key_results_unpartitioned;
+DROP TABLE objectives_unpartitioned;
+"""
+
+LEGACY_QUARTERS_SQL = """
+SELECT DISTINCT date_trunc('quarter', period)::date AS quarter
+FROM objectives_unpartitioned
+"""
+
+
+# every insert into objectives/key_results is announced on CHANGES_CHANNEL;
+# seq orders the events of one shard and is the change feed's resume point.
+# Ids only: a NOTIFY payload is capped at 8000 bytes and one over it fails
+# the write itself, so consumers read the row for its content.
+CHANGES_CHANNEL = "okr_changes"
+
+CREATE_CHANGE_NOTIFY_SQL = """
+CREATE SEQUENCE IF NOT EXISTS okr_change_seq;
+
+CREATE OR REPLACE FUNCTION okr_notify_change() RETURNS trigger AS $$
+DECLARE
+    owner BIGINT;
+BEGIN
+    -- TG_TABLE_NAME is the partition the row landed in, so the trigger
+    -- names the entity it is attached for
+    IF TG_ARGV[0] = 'objective' THEN
+        PERFORM pg_notify('okr_changes', json_build_object(
+            'seq', nextval('okr_change_seq'),
+            'type', 'objective.created',
+            'id', NEW.id,
+            'user_id', NEW.user_id,
+            'objective_id', NEW.id
+        )::text);
+    ELSE
+        SELECT user_id INTO owner FROM objectives
+        WHERE id = NEW.objective_id AND period = NEW.period;
+        PERFORM pg_notify('okr_changes', json_build_object(
+            'seq', nextval('okr_change_seq'),
+            'type', CASE TG_OP
+                WHEN 'INSERT' THEN 'key_result.created'
+                ELSE 'key_result.progress'
+            END,
+            'id', NEW.id,
+            'user_id', owner,
+            'objective_id', NEW.objective_id
+        )::text);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER objectives_notify_change
+    AFTER INSERT ON objectives
+    FOR EACH ROW EXECUTE FUNCTION okr_notify_change('objective');
+
+CREATE OR REPLACE TRIGGER key_results_notify_change
+    AFTER INSERT OR UPDATE OF progress ON key_results
+    FOR EACH ROW EXECUTE FUNCTION okr_notify_change('key_result');
+"""
+
+
+# append-only progress history, one monthly partition per calendar month
+# (UTC) plus a default one so an insert never fails for want of a partition.
+# No foreign key: history outlives the key results archived with their
+# quarter. Rows are neither updated nor deleted: old months are detached,
+# which keeps progress_rollups in step with the history it sums.
+CREATE_PROGRESS_HISTORY_SQL = """
+CREATE TABLE IF NOT EXISTS key_result_progress (
+    key_result_id BIGINT NOT NULL,
+    objective_id BIGINT NOT NULL,
+    progress NUMERIC(5,2) NOT NULL,
+    recorded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+) PARTITION BY RANGE (recorded_at);
+
+CREATE TABLE IF NOT EXISTS key_result_progress_default
+    PARTITION OF key_result_progress DEFAULT;
+
+CREATE INDEX IF NOT EXISTS key_result_progress_kr_idx
+    ON key_result_progress (key_result_id, recorded_at);
+
+CREATE OR REPLACE FUNCTION okr_reject_change() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION '% is append-only', TG_TABLE_NAME;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER key_result_progress_append_only
+    BEFORE UPDATE OR DELETE ON key_result_progress
+    FOR EACH ROW EXECUTE FUNCTION okr_reject_change();
+
+CREATE TABLE IF NOT EXISTS progress_rollups (
+    key_result_id BIGINT NOT NULL,
+    objective_id BIGINT NOT NULL,
+    grain TEXT NOT NULL CHECK (grain IN ('day', 'week')),
+    bucket_start DATE NOT NULL,
+    samples INTEGER NOT NULL,
+    progress_sum NUMERIC NOT NULL,
+    progress_min NUMERIC(5,2) NOT NULL,
+    progress_max NUMERIC(5,2) NOT NULL,
+    progress_last NUMERIC(5,2) NOT NULL,
+    PRIMARY KEY (key_result_id, grain, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS progress_rollups_objective_idx
+    ON progress_rollups (objective_id, grain, bucket_start);
+
+-- every progress value a key result takes (including the one it is created
+-- with) lands in the history and in its day and week rollups, in the same
+-- transaction as the write itself
+CREATE OR REPLACE FUNCTION okr_record_progress() RETURNS trigger AS $$
+DECLARE
+    today DATE := (now() AT TIME ZONE 'UTC')::date;
+BEGIN
+    INSERT INTO key_result_progress (key_result_id, objective_id, progress)
+    VALUES (NEW.id, NEW.objective_id, NEW.progress);
+
+    INSERT INTO progress_rollups AS r (
+        key_result_id, objective_id, grain, bucket_start, samples,
+        progress_sum, progress_min, progress_max, progress_last
+    )
+    SELECT NEW.id, NEW.objective_id, g.grain, date_trunc(g.grain, today)::date,
+           1, NEW.progress, NEW.progress, NEW.progress, NEW.progress
+    FROM (VALUES ('day'), ('week')) AS g (grain)
+    ON CONFLICT (key_result_id, grain, bucket_start) DO UPDATE SET
+        samples = r.samples + 1,
+        progress_sum = r.progress_sum + EXCLUDED.progress_sum,
+        progress_min = LEAST(r.progress_min, EXCLUDED.progress_min),
+        progress_max = GREATEST(r.progress_max, EXCLUDED.progress_max),
+        progress_last = EXCLUDED.progress_last;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER key_results_record_progress
+    AFTER INSERT OR UPDATE OF progress ON key_results
+    FOR EACH ROW EXECUTE FUNCTION okr_record_progress();
+"""
+
+
+# responses of POSTs sent with an Idempotency-Key, per user (the token's
+# sub); status is NULL only inside the transaction that claimed the key
+CREATE_IDEMPOTENCY_SQL = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id BIGINT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status INTEGER,
+    media_type TEXT,
+    body BYTEA,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, key)
 );
+
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_idx
+    ON idempotency_keys (expires_at);
+"""
+
+# an expired key is taken over as if it were new
+CLAIM_IDEMPOTENCY_KEY_SQL = """
+INSERT INTO idempotency_keys AS i (user_id, key, fingerprint, expires_at)
+VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+ON CONFLICT (user_id, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint,
+        status = NULL,
+        media_type = NULL,
+        body = NULL,
+        expires_at = EXCLUDED.expires_at
+    WHERE i.expires_at < now()
+RETURNING true AS claimed
 """
 
 
-def get_conn():
-    return psycopg2.connect(DB_DSN, cursor_factory=RealDictCursor)
+PREPARED_SQL: dict[str, str] = {
+    "okr_get_user": "SELECT id, name FROM users WHERE id = $1",
+    "okr_create_user": """
+        INSERT INTO users (id, name)
+        VALUES (nextval(pg_get_serial_sequence('users', 'id')) * $2::bigint + $3::bigint, $1)
+        RETURNING id, name
+    """,
+    "okr_get_objective": """
+        SELECT id, user_id, title, period
+        FROM objectives
+        WHERE id = $1
+    """,
+    "okr_get_objectives_by_ids": """
+        SELECT id, user_id, title, period
+        FROM objectives
+        WHERE id = ANY($1::bigint[])
+    """,
+    "okr_get_objective_version": "SELECT xmin::text AS version FROM objectives WHERE id = $1",
+    "okr_get_objective_versioned": """
+        SELECT id, user_id, title, period, xmin::text AS version
+        FROM objectives
+        WHERE id = $1
+    """,
+    "okr_get_objectives_version": "SELECT objectives_version FROM users WHERE id = $1",
+    "okr_list_objectives_versioned": """
+        SELECT u.objectives_version, o.id, o.user_id, o.title, o.period
+        FROM users u
+        LEFT JOIN objectives o ON o.user_id = u.id
+        WHERE u.id = $1
+        ORDER BY o.id
+    """,
+    "okr_create_objective": """
+        WITH ins AS (
+            INSERT INTO objectives (id, user_id, title, period)
+            VALUES (
+                nextval(pg_get_serial_sequence('objectives', 'id')) * $4::bigint
+                    + mod($1::bigint, $4::bigint),
+                $1, $2, $3
+            )
+            RETURNING id, user_id, title, period
+        ), bump AS (
+            UPDATE users SET objectives_version = objectives_version + 1
+            WHERE id = $1
+        )
+        SELECT id, user_id, title, period FROM ins
+    """,
+    "okr_list_objectives": """
+        SELECT id, user_id, title, period
+        FROM objectives
+        WHERE user_id = $1
+        ORDER BY id
+    """,
+    "okr_create_key_result": """
+        INSERT INTO key_results (id, objective_id, period, title, metric, progress)
+        SELECT nextval(pg_get_serial_sequence('key_results', 'id')) * $5::bigint
+                   + mod(o.id, $5::bigint),
+               o.id, o.period, $2::text, $3::text, $4::numeric
+        FROM objectives o
+        WHERE o.id = $1
+        RETURNING id, objective_id, title, metric, progress
+    """,
+    "okr_create_owned_key_result": """
+        WITH obj AS (
+            SELECT id, user_id, period FROM objectives WHERE id = $1
+        ), ins AS (
+            INSERT INTO key_results (id, objective_id, period, title, metric, progress)
+            SELECT nextval(pg_get_serial_sequence('key_results', 'id')) * $6::bigint
+                       + mod(obj.id, $6::bigint),
+                   obj.id, obj.period, $3::text, $4::text, $5::numeric
+            FROM obj
+            WHERE obj.user_id = $2
+            RETURNING id, objective_id, title, metric, progress
+        )
+        SELECT obj.user_id AS owner_id,
+               ins.id, ins.objective_id, ins.title, ins.metric, ins.progress
+        FROM obj
+        LEFT JOIN ins ON true
+    """,
+    "okr_update_owned_progress": """
+        WITH kr AS (
+            SELECT k.id, k.period, o.user_id
+            FROM key_results k
+            JOIN objectives o ON o.id = k.objective_id AND o.period = k.period
+            WHERE k.id = $1
+        ), upd AS (
+            UPDATE key_results
+            SET progress = $3
+            FROM kr
+            WHERE key_results.id = kr.id
+                AND key_results.period = kr.period
+                AND kr.user_id = $2
+            RETURNING key_results.id, key_results.objective_id, key_results.title,
+                      key_results.metric, key_results.progress
+        )
+        SELECT kr.user_id AS owner_id,
+               upd.id, upd.objective_id, upd.title, upd.metric, upd.progress
+        FROM kr
+        LEFT JOIN upd ON true
+    """,
+    "okr_key_result_series": """
+        SELECT k.id AS key_result_id, r.bucket_start, r.samples,
+               r.progress_sum / r.samples AS progress_avg,
+               r.progress_min, r.progress_max, r.progress_last
+        FROM key_results k
+        LEFT JOIN progress_rollups r
+            ON r.key_result_id = k.id
+            AND r.grain = $2
+            AND r.bucket_start BETWEEN $3 AND $4
+        WHERE k.id = $1
+        ORDER BY r.bucket_start
+    """,
+    "okr_objective_series": """
+        SELECT o.id AS objective_id, r.key_result_id, r.bucket_start, r.progress_last
+        FROM objectives o
+        LEFT JOIN LATERAL (
+            SELECT key_result_id, bucket_start, progress_last
+            FROM progress_rollups
+            WHERE objective_id = o.id AND grain = $2
+                AND bucket_start BETWEEN $3 AND $4
+            UNION ALL
+            (
+                SELECT DISTINCT ON (key_result_id)
+                       key_result_id, bucket_start, progress_last
+                FROM progress_rollups
+                WHERE objective_id = o.id AND grain = $2 AND bucket_start < $3
+                ORDER BY key_result_id, bucket_start DESC
+            )
+        ) r ON true
+        WHERE o.id = $1
+        ORDER BY r.bucket_start
+    """,
+    # objective and key-result hits of one user, best first; both halves
+    # start from the user's objectives, so the work grows with the caller's
+    # rows rather than with the tables
+    "okr_search": f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('{SEARCH_CONFIG}', $2) AS query
+        )
+        SELECT type, id, objective_id, title, metric, period
+        FROM (
+            SELECT 'objective' AS type, o.id, o.id AS objective_id, o.title,
+                   NULL::text AS metric, o.period,
+                   ts_rank(o.search, q.query) AS rank
+            FROM objectives o, q
+            WHERE o.user_id = $1 AND o.search @@ q.query
+            UNION ALL
+            SELECT 'key_result', k.id, k.objective_id, k.title, k.metric,
+                   k.period, ts_rank(k.search, q.query)
+            FROM objectives o
+            JOIN key_results k ON k.objective_id = o.id AND k.period = o.period,
+                 q
+            WHERE o.user_id = $1 AND k.search @@ q.query
+        ) hits
+        ORDER BY rank DESC, type, id
+        LIMIT $3 OFFSET $4
+    """,
+    "okr_list_key_results": """
+        SELECT id, objective_id, title, metric, progress
+        FROM key_results
+        WHERE objective_id = $1
+        ORDER BY id
+    """,
+}
 
 
-def init_db(retries: int = 10, delay: float = 1.0):
+class PreparingConnection(PgConnection):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # names PREPAREd on this server session; a reconnect starts empty
+        self.prepared: set[str] = set()
+        # set while helpers write inside an idempotency claim: their commits
+        # are left to the claim
+        self.commit_deferred = False
+
+    def commit(self) -> None:
+        if not self.commit_deferred:
+            super().commit()
+
+
+class PgPool:
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self._pool: pool.ThreadedConnectionPool | None = None
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool raises instead of waiting when exhausted
+        self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+    def _get(self) -> pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(
+                        DB_POOL_MIN,
+                        DB_POOL_MAX,
+                        self.dsn,
+                        connection_factory=PreparingConnection,
+                        cursor_factory=RealDictCursor,
+                    )
+        return self._pool
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    @contextmanager
+    def connection(self, transaction: bool = False) -> Iterator[PreparingConnection]:
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise pool.PoolError("connection pool exhausted")
+        try:
+            conn_pool = self._get()
+            conn = conn_pool.getconn()
+            broken = False
+            try:
+                conn.autocommit = not transaction
+                yield conn
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+                raise
+            finally:
+                conn_pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+
+# set per request from the read-your-writes cookie (epoch seconds)
+last_write_at: ContextVar[float | None] = ContextVar("last_write_at", default=None)
+
+metrics.counter("db_read_routing_total", "Read helper calls by target and reason")
+
+
+class ReplicaLag:
+    def __init__(self, ttl: float, replica: PgPool | None = None) -> None:
+        self.ttl = ttl
+        self.replica = replica
+        self._value: float | None = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def seconds(self) -> float | None:
+        if time.monotonic() - self._checked_at > self.ttl and self._lock.acquire(
+            blocking=False
+        ):
+            # one caller refreshes, everyone else keeps using the last value
+            try:
+                self._value = self._measure()
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self._value
+
+    def mark_failed(self) -> None:
+        self._value = None
+        self._checked_at = time.monotonic()
+
+    def _measure(self) -> float | None:
+        if self.replica is None:
+            return None
+        try:
+            with self.replica.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(REPLICA_LAG_SQL)
+                    return float(cur.fetchone()["lag"])
+        except (psycopg2.Error, pool.PoolError):
+            return None
+
+
+class Shard:
+    def __init__(self, dsn: str, read_dsn: str = "") -> None:
+        self.primary = PgPool(dsn)
+        self.replica = PgPool(read_dsn) if read_dsn else None
+        self.replica_lag = ReplicaLag(DB_REPLICA_LAG_TTL, self.replica)
+
+    def close(self) -> None:
+        self.primary.close()
+        if self.replica is not None:
+            self.replica.close()
+
+
+def _build_shards() -> list[Shard]:
+    if not DB_SHARD_DSNS:
+        return [Shard(DB_DSN, DB_READ_DSN)]
+    reads = DB_SHARD_READ_DSNS + [""] * len(DB_SHARD_DSNS)
+    return [Shard(dsn, read) for dsn, read in zip(DB_SHARD_DSNS, reads)]
+
+
+def load_shard_map(path: str) -> dict[int, int]:
+    # written by tools/rebalance_shards.py; buckets it does not list keep
+    # their default placement
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return {int(bucket): int(index) for bucket, index in json.load(fh).items()}
+
+
+shards = _build_shards()
+shard_map = load_shard_map(DB_SHARD_MAP_FILE)
+
+
+def bucket_of(ident: int) -> int:
+    return ident % ID_BUCKETS
+
+
+def shard_index(bucket: int) -> int:
+    return shard_map.get(bucket, bucket % len(shards))
+
+
+def shard_for(ident: int) -> Shard:
+    # users, objectives and key results of one user share a bucket, so any
+    # of their ids names the shard without asking the others
+    return shards[shard_index(bucket_of(ident))]
+
+
+def has_replica() -> bool:
+    return any(shard.replica is not None for shard in shards)
+
+
+def close_pool() -> None:
+    for shard in shards:
+        shard.close()
+
+
+@traced
+def ping_db() -> None:
+    # raises unless every primary hands out a working connection in time
+    for shard in shards:
+        with get_conn(shard=shard) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+
+
+# the connection of the idempotency claim the current request holds, see
+# idempotency_key_db
+claim_conn: ContextVar[tuple[Shard, PreparingConnection] | None] = ContextVar(
+    "claim_conn", default=None
+)
+
+
+@contextmanager
+def _joined(conn: PreparingConnection) -> Iterator[PreparingConnection]:
+    # no commit and no rollback of its own: an exception unwinds the claim
+    conn.commit_deferred = True
+    try:
+        yield conn
+    finally:
+        conn.commit_deferred = False
+
+
+def get_conn(transaction: bool = False, shard: Shard | None = None):
+    # single-statement helpers run in autocommit: psycopg2 would otherwise
+    # spend a BEGIN and a COMMIT round trip around every statement
+    shard = shard or shards[0]
+    claim = claim_conn.get()
+    if claim is not None and claim[0] is shard:
+        return _joined(claim[1])
+    return shard.primary.connection(transaction)
+
+
+def _read_route(shard: Shard) -> tuple[bool, str]:
+    if shard.replica is None:
+        return False, "no_replica"
+    lag = shard.replica_lag.seconds()
+    if lag is None:
+        return False, "replica_unavailable"
+    if lag > DB_REPLICA_MAX_LAG:
+        return False, "replica_lag"
+    written = last_write_at.get()
+    if written is not None:
+        since = time.time() - written
+        if since < DB_RYW_WINDOW and since <= lag:
+            return False, "read_your_writes"
+    return True, "replica"
+
+
+def run_read(
+    work: Callable[[Any], T], shard: Shard | None = None, cursor_factory: Any = None
+) -> T:
+    shard = shard or shards[0]
+    use_replica, reason = _read_route(shard)
+    if use_replica and shard.replica is not None:
+        try:
+            with shard.replica.connection() as conn:
+                with conn.cursor(cursor_factory=cursor_factory) as cur:
+                    result = work(cur)
+            metrics.inc("db_read_routing_total", target="replica", reason=reason)
+            annotate(read_target="replica")
+            return result
+        except (psycopg2.OperationalError, pool.PoolError):
+            shard.replica_lag.mark_failed()
+            reason = "replica_error"
+    metrics.inc("db_read_routing_total", target="primary", reason=reason)
+    annotate(read_target="primary", read_reason=reason)
+    with shard.primary.connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            return work(cur)
+
+
+def _prepare(cur, name: str) -> None:
+    cur.execute(f"PREPARE {name} AS {PREPARED_SQL[name]}")
+    cur.connection.prepared.add(name)
+
+
+def execute_prepared(cur, name: str, params: tuple[Any, ...]) -> None:
+    conn = cur.connection
+    starts_tx = conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+    if name not in conn.prepared:
+        _prepare(cur, name)
+    annotate(statement=name)
+    placeholders = ", ".join(["%s"] * len(params))
+    statement = f"EXECUTE {name} ({placeholders})"
+    try:
+        cur.execute(statement, params)
+    except (errors.InvalidSqlStatementName, errors.FeatureNotSupported) as exc:
+        # the handle was dropped server-side (DISCARD ALL, pooler) or the
+        # cached plan no longer matches the schema; only transparent when
+        # nothing else in the transaction would be lost by the rollback
+        if not starts_tx:
+            raise
+        conn.rollback()
+        conn.prepared.discard(name)
+        if isinstance(exc, errors.FeatureNotSupported):
+            cur.execute(f"DEALLOCATE {name}")
+        _prepare(cur, name)
+        cur.execute(statement, params)
+
+
+def init_db(retries: int = 14, delay: float = 0.05, max_delay: float = 1.0):
+    for shard in shards:
+        _init_shard(shard, retries, delay, max_delay)
+
+
+def _init_shard(shard: Shard, retries: int, delay: float, max_delay: float) -> None:
+    # exponential backoff: a DB that comes up quickly is picked up quickly,
+    # a slow one is still polled for roughly the same total time as before
     for _ in range(retries):
         try:
-            with get_conn() as conn:
+            with get_conn(transaction=True, shard=shard) as conn:
                 with conn.cursor() as cur:
+                    cur.execute(SCHEMA_LOCK_SQL)
                     cur.execute(CREATE_USERS_SQL)
-                    cur.execute(CREATE_OBJECTIVES_SQL)
-                    cur.execute(CREATE_KEY_RESULTS_SQL)
+                    cur.execute(WIDEN_USERS_ID_SQL)
+                    cur.execute(ALTER_USERS_VERSION_SQL)
+                    _create_period_tables(cur)
+                    cur.execute(CREATE_CHANGE_NOTIFY_SQL)
+                    cur.execute(CREATE_PROGRESS_HISTORY_SQL)
+                    cur.execute(CREATE_IDEMPOTENCY_SQL)
+                    ensure_progress_partitions(cur)
                 conn.commit()
             return
         except psycopg2.OperationalError:
             time.sleep(delay)
+            delay = min(delay * 2, max_delay)
     raise RuntimeError("DB is not ready")
 
 
-def get_user_by_id(cur, user_id: Any) -> dict[str, Any] | None:
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def quarter_start(day: date) -> date:
+    return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+
+
+def _ensure_partition(
+    cur, parent: str, name: str, column: str, start: Any, end: Any
+) -> None:
+    # rows already caught by the default partition would make the attach
+    # fail; that range stays in the default partition until
+    # split_default_partitions moves it out
     cur.execute(
-        "SELECT id, name FROM users WHERE id = %s",
-        (user_id,),
+        f"SELECT 1 FROM {parent}_default WHERE {column} >= %s AND {column} < %s LIMIT 1",
+        (start, end),
     )
+    if cur.fetchone():
+        return
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} "
+        f"PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)",
+        (start, end),
+    )
+
+
+def ensure_progress_partitions(
+    cur, today: date | None = None, ahead: int = PROGRESS_PARTITIONS_AHEAD
+) -> None:
+    first = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    for offset in range(ahead + 1):
+        start, end = add_months(first, offset), add_months(first, offset + 1)
+        _ensure_partition(
+            cur,
+            "key_result_progress",
+            f"key_result_progress_p{start:%Y%m}",
+            "recorded_at",
+            f"{start} 00:00+00",
+            f"{end} 00:00+00",
+        )
+
+
+# rows a copy has to name: generated columns are recomputed on insert
+STORED_COLUMNS_SQL = """
+SELECT attname AS name FROM pg_attribute
+WHERE attrelid = %s::regclass AND attnum > 0
+    AND NOT attisdropped AND attgenerated = ''
+ORDER BY attnum
+"""
+
+DEFAULT_QUARTERS_SQL = """
+SELECT date_trunc('quarter', period)::date AS start FROM objectives_default
+UNION
+SELECT date_trunc('quarter', period)::date FROM key_results_default
+ORDER BY 1
+"""
+
+DEFAULT_MONTHS_SQL = """
+SELECT DISTINCT date_trunc('month', recorded_at AT TIME ZONE 'UTC')::date AS start
+FROM key_result_progress_default
+ORDER BY 1
+"""
+
+KEY_RESULTS_OBJECTIVE_FK = "key_results_objective_id_period_fkey"
+
+
+def _split_default(
+    cur, parent: str, column: str, ranges: list[tuple[str, Any, Any]]
+) -> None:
+    # the default partition is detached while its rows are moved, so that
+    # the new partitions can be created over the ranges they fall in
+    default = f"{parent}_default"
+    cur.execute(STORED_COLUMNS_SQL, (parent,))
+    columns = ", ".join(row["name"] for row in cur.fetchall())
+    cur.execute(f"ALTER TABLE {parent} DETACH PARTITION {default}")
+    # moved rows are neither new nor changed: no events, no second history
+    cur.execute(f"ALTER TABLE {parent} DISABLE TRIGGER USER")
+    cur.execute(f"ALTER TABLE {default} DISABLE TRIGGER USER")
+    for name, start, end in ranges:
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} "
+            f"PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)",
+            (start, end),
+        )
+        cur.execute(
+            f"INSERT INTO {parent} ({columns}) SELECT {columns} FROM {default} "
+            f"WHERE {column} >= %s AND {column} < %s",
+            (start, end),
+        )
+        cur.execute(
+            f"DELETE FROM {default} WHERE {column} >= %s AND {column} < %s",
+            (start, end),
+        )
+    cur.execute(f"ALTER TABLE {default} ENABLE TRIGGER USER")
+    cur.execute(f"ALTER TABLE {parent} ENABLE TRIGGER USER")
+    cur.execute(f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT")
+
+
+def split_default_partitions(cur) -> int:
+    # gives every quarter and month with rows in a default partition its
+    # own partition, under ACCESS EXCLUSIVE locks: for the offline tools,
+    # not app startup. Returns the number of ranges split out.
+    cur.execute(SCHEMA_LOCK_SQL)
+    cur.execute(DEFAULT_QUARTERS_SQL)
+    quarters = [row["start"] for row in cur.fetchall()]
+    if quarters:
+        # detaching objectives_default is refused while key results
+        # reference its rows; the key is checked again once they have moved
+        cur.execute(
+            f"ALTER TABLE key_results DROP CONSTRAINT {KEY_RESULTS_OBJECTIVE_FK}"
+        )
+        for parent in ("objectives", "key_results"):
+            ranges = [
+                (period_partition_name(parent, q), q, add_months(q, 3))
+                for q in quarters
+            ]
+            _split_default(cur, parent, "period", ranges)
+        cur.execute(
+            f"ALTER TABLE key_results ADD CONSTRAINT {KEY_RESULTS_OBJECTIVE_FK} "
+            "FOREIGN KEY (objective_id, period) "
+            "REFERENCES objectives (id, period) ON DELETE CASCADE"
+        )
+    cur.execute(DEFAULT_MONTHS_SQL)
+    months = [row["start"] for row in cur.fetchall()]
+    if months:
+        ranges = [
+            (
+                f"key_result_progress_p{m:%Y%m}",
+                f"{m} 00:00+00",
+                f"{add_months(m, 1)} 00:00+00",
+            )
+            for m in months
+        ]
+        _split_default(cur, "key_result_progress", "recorded_at", ranges)
+    return len(quarters) + len(months)
+
+
+def period_partition_name(parent: str, quarter: date) -> str:
+    return f"{parent}_p{quarter.year}q{(quarter.month - 1) // 3 + 1}"
+
+
+def ensure_period_partitions(cur, quarters: list[date]) -> None:
+    for quarter in quarters:
+        for parent in ("objectives", "key_results"):
+            _ensure_partition(
+                cur,
+                parent,
+                period_partition_name(parent, quarter),
+                "period",
+                quarter,
+                add_months(quarter, 3),
+            )
+
+
+def upcoming_quarters(
+    today: date | None = None, ahead: int = PERIOD_PARTITIONS_AHEAD
+) -> list[date]:
+    first = quarter_start(today or date.today())
+    return [add_months(first, 3 * offset) for offset in range(ahead + 1)]
+
+
+def has_unpartitioned_tables(cur) -> bool:
+    cur.execute(IS_PARTITIONED_SQL, ("objectives",))
+    row = cur.fetchone()
+    return row is not None and not row["partitioned"]
+
+
+def migrate_to_partitioned(cur) -> bool:
+    # copies every row under an ACCESS EXCLUSIVE lock: not for app startup.
+    # False when there was nothing to migrate, e.g. another run got there
+    # first
+    cur.execute(SCHEMA_LOCK_SQL)
+    if not has_unpartitioned_tables(cur):
+        return False
+    cur.execute(MIGRATE_TO_PARTITIONED_SQL)
+    cur.execute(CREATE_OBJECTIVES_SQL)
+    cur.execute(CREATE_KEY_RESULTS_SQL)
+    # while the tables are still empty
+    cur.execute(ADD_SEARCH_SQL)
+    cur.execute(LEGACY_QUARTERS_SQL)
+    ensure_period_partitions(cur, [r["quarter"] for r in cur.fetchall()])
+    ensure_period_partitions(cur, upcoming_quarters())
+    cur.execute(COPY_UNPARTITIONED_SQL)
+    return True
+
+
+def has_search_columns(cur) -> bool:
+    cur.execute(HAS_SEARCH_SQL)
+    return cur.fetchone()["searchable"]
+
+
+def add_search_columns(cur) -> bool:
+    # rewrites every objectives and key_results partition: offline only.
+    # False when the columns were already there
+    cur.execute(SCHEMA_LOCK_SQL)
+    if has_search_columns(cur):
+        return False
+    cur.execute(ADD_SEARCH_SQL)
+    return True
+
+
+def _create_period_tables(cur) -> None:
+    if has_unpartitioned_tables(cur):
+        raise RuntimeError(
+            "objectives are not partitioned yet: stop the application and run "
+            "python -m tools.maintain_partitions migrate"
+        )
+    cur.execute(IS_PARTITIONED_SQL, ("objectives",))
+    fresh = cur.fetchone() is None
+    cur.execute(CREATE_OBJECTIVES_SQL)
+    cur.execute(CREATE_KEY_RESULTS_SQL)
+    if fresh:
+        cur.execute(ADD_SEARCH_SQL)
+    elif not has_search_columns(cur):
+        raise RuntimeError(
+            "objectives have no search column yet: stop the application and "
+            "run python -m tools.maintain_partitions migrate"
+        )
+    ensure_period_partitions(cur, upcoming_quarters())
+
+
+def get_user_by_id(cur, user_id: Any) -> dict[str, Any] | None:
+    execute_prepared(cur, "okr_get_user", (user_id,))
     return cur.fetchone()
 
 
+@traced
 def create_user_db(name: str) -> dict[str, Any]:
-    with get_conn() as conn:
+    # a new user's bucket is drawn at random: placement is uniform and the
+    # bucket is then fixed by the id itself
+    bucket = random.randrange(ID_BUCKETS)
+    with get_conn(shard=shards[shard_index(bucket)]) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users (name)
-                VALUES (%s)
-                RETURNING id, name
-                """,
-                (name,),
-            )
+            execute_prepared(cur, "okr_create_user", (name, ID_BUCKETS, bucket))
             row = cur.fetchone()
         conn.commit()
     return row
 
 
+def _read_one(
+    shard: Shard, name: str, params: tuple[Any, ...]
+) -> dict[str, Any] | None:
+    def work(cur) -> dict[str, Any] | None:
+        execute_prepared(cur, name, params)
+        return cur.fetchone()
+
+    return run_read(work, shard)
+
+
+def _read_all(shard: Shard, name: str, params: tuple[Any, ...]) -> list[dict[str, Any]]:
+    def work(cur) -> list[dict[str, Any]]:
+        execute_prepared(cur, name, params)
+        return cur.fetchall()
+
+    return run_read(work, shard)
+
+
+# Rows of the list helpers. A slotted record takes about a third of the
+# memory of a RealDictRow, whose every row is a dict repeating the column
+# names, and orjson encodes dataclasses natively, so a list of them goes to
+# JSON without a dict per row in between. row["column"] still works.
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, column: str) -> Any:
+        return getattr(self, column)
+
+
+@dataclass(frozen=True, slots=True)
+class ObjectiveRow(Record):
+    id: int
+    user_id: int
+    title: str
+    period: date
+
+
+@dataclass(frozen=True, slots=True)
+class KeyResultRow(Record):
+    id: int
+    objective_id: int
+    title: str
+    metric: str
+    progress: Decimal
+
+
+R = TypeVar("R", bound=Record)
+
+
+def _read_records(
+    shard: Shard, name: str, params: tuple[Any, ...], record: type[R]
+) -> list[R]:
+    # plain tuple rows, never a dict: the statement's columns are the
+    # record's fields, in order
+    def work(cur) -> list[R]:
+        execute_prepared(cur, name, params)
+        return [record(*row) for row in cur.fetchall()]
+
+    return run_read(work, shard, TupleCursor)
+
+
+@traced
 def get_user_db(user_id: int) -> dict[str, Any] | None:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, name FROM users WHERE id = %s",
-                (user_id,),
-            )
-            return cur.fetchone()
+    return run_read(lambda cur: get_user_by_id(cur, user_id), shard_for(user_id))
 
 
+@traced
 def create_objective_db(user_id: int, title: str, period: date) -> dict[str, Any]:
-    with get_conn() as conn:
+    with get_conn(shard=shard_for(user_id)) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO objectives (user_id, title, period)
-                VALUES (%s, %s, %s)
-                RETURNING id, user_id, title, period
-                """,
-                (user_id, title, period),
+            execute_prepared(
+                cur, "okr_create_objective", (user_id, title, period, ID_BUCKETS)
             )
             row = cur.fetchone()
         conn.commit()
     return row
 
 
-def list_objectives_for_user_db(user_id: int) -> list[dict[str, Any]]:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, user_id, title, period
-                FROM objectives
-                WHERE user_id = %s
-                ORDER BY id
-                """,
-                (user_id,),
-            )
-            return cur.fetchall()
+@traced
+def list_objectives_for_user_db(user_id: int) -> list[ObjectiveRow]:
+    return _read_records(
+        shard_for(user_id), "okr_list_objectives", (user_id,), ObjectiveRow
+    )
 
 
+@traced
+def get_objectives_version_db(user_id: int) -> int | None:
+    row = _read_one(shard_for(user_id), "okr_get_objectives_version", (user_id,))
+    return row["objectives_version"] if row else None
+
+
+@traced
+def list_objectives_with_version_db(
+    user_id: int,
+) -> tuple[list[ObjectiveRow], int] | None:
+    # existence check, ETag version and listing in one statement (and so
+    # one snapshot); a user without objectives yields a single NULL row
+    def work(cur) -> list[tuple[Any, ...]]:
+        execute_prepared(cur, "okr_list_objectives_versioned", (user_id,))
+        return cur.fetchall()
+
+    rows = run_read(work, shard_for(user_id), TupleCursor)
+    if not rows:
+        return None
+    # (objectives_version, id, user_id, title, period)
+    objectives = [ObjectiveRow(*row[1:]) for row in rows if row[1] is not None]
+    return objectives, rows[0][0]
+
+
+@traced
+def get_objective_version_db(obj_id: int) -> str | None:
+    row = _read_one(shard_for(obj_id), "okr_get_objective_version", (obj_id,))
+    return row["version"] if row else None
+
+
+@traced
+def get_objective_with_version_db(obj_id: int) -> tuple[dict[str, Any], str] | None:
+    row = _read_one(shard_for(obj_id), "okr_get_objective_versioned", (obj_id,))
+    if not row:
+        return None
+    return row, row.pop("version")
+
+
+@traced
 def get_objective_db(obj_id: int) -> dict[str, Any] | None:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, user_id, title, period
-                FROM objectives
-                WHERE id = %s
-                """,
-                (obj_id,),
-            )
-            return cur.fetchone()
+    return _read_one(shard_for(obj_id), "okr_get_objective", (obj_id,))
+
+
+def _group_by_shard(idents: list[int]) -> dict[int, list[int]]:
+    groups: dict[int, list[int]] = {}
+    for ident in idents:
+        groups.setdefault(shard_index(bucket_of(ident)), []).append(ident)
+    return groups
+
+
+@traced
+def get_objectives_by_ids_db(obj_ids: list[int]) -> dict[int, dict[str, Any]]:
+    # one query per shard that holds any of the ids, never a fan-out
+    found: dict[int, dict[str, Any]] = {}
+    for index, ids in _group_by_shard(obj_ids).items():
+        rows = _read_all(shards[index], "okr_get_objectives_by_ids", (ids,))
+        found.update((row["id"], row) for row in rows)
+    return found
 
 
+@traced
 def create_key_result_db(
     objective_id: int,
     title: str,
     metric: str,
     progress: float,
-) -> dict[str, Any]:
-    with get_conn() as conn:
+) -> dict[str, Any] | None:
+    # None when there is no such objective
+    with get_conn(shard=shard_for(objective_id)) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO key_results (objective_id, title, metric, progress)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, objective_id, title, metric, progress
-                """,
-                (objective_id, title, metric, progress),
+            execute_prepared(
+                cur,
+                "okr_create_key_result",
+                (objective_id, title, metric, progress, ID_BUCKETS),
             )
             row = cur.fetchone()
         conn.commit()
     return row
 
 
-def list_key_results_for_objective_db(obj_id: int) -> list[dict[str, Any]]:
-    with get_conn() as conn:
+@traced
+def create_owned_key_result_db(
+    objective_id: int,
+    user_id: int,
+    title: str,
+    metric: str,
+    progress: float,
+) -> tuple[int | None, dict[str, Any] | None]:
+    # (None, None): no such objective; (owner, None): owned by someone else
+    with get_conn(shard=shard_for(objective_id)) as conn:
+        with conn.cursor() as cur:
+            execute_prepared(
+                cur,
+                "okr_create_owned_key_result",
+                (objective_id, user_id, title, metric, progress, ID_BUCKETS),
+            )
+            row = cur.fetchone()
+    if not row:
+        return None, None
+    owner_id = row.pop("owner_id")
+    return owner_id, (row if row["id"] is not None else None)
+
+
+CREATE_OWNED_KEY_RESULTS_BATCH_SQL = """
+WITH v AS MATERIALIZED (
+    SELECT nextval(pg_get_serial_sequence('key_results', 'id')) * %(buckets)s
+               + mod(x.objective_id, %(buckets)s) AS new_id,
+           x.*
+    FROM (VALUES %(values)s) AS x (slot, objective_id, user_id, title, metric, progress)
+), ins AS (
+    INSERT INTO key_results (id, objective_id, period, title, metric, progress)
+    SELECT v.new_id, v.objective_id, o.period, v.title, v.metric, v.progress
+    FROM v
+    JOIN objectives o ON o.id = v.objective_id AND o.user_id = v.user_id
+    RETURNING id, objective_id, title, metric, progress
+)
+SELECT v.slot, o.user_id AS owner_id,
+       ins.id, ins.objective_id, ins.title, ins.metric, ins.progress
+FROM v
+LEFT JOIN objectives o ON o.id = v.objective_id
+LEFT JOIN ins ON ins.id = v.new_id
+"""
+
+
+@traced
+def create_owned_key_results_batch_db(
+    items: list[tuple[int, int, str, str, float]],
+) -> list[tuple[int | None, dict[str, Any] | None] | Exception]:
+    # multi-row variant of create_owned_key_result_db: one statement and one
+    # commit per shard; ids are drawn up front so each result maps back to
+    # its slot. A shard that fails does not stop the others: its slots hold
+    # the error, and only those items are left uncommitted.
+    by_shard: dict[int, list[tuple[Any, ...]]] = {}
+    for slot, item in enumerate(items):
+        by_shard.setdefault(shard_index(bucket_of(item[0])), []).append((slot, *item))
+    sql = CREATE_OWNED_KEY_RESULTS_BATCH_SQL % {
+        "buckets": f"{ID_BUCKETS}::bigint",
+        "values": "%s",
+    }
+    results: list[tuple[int | None, dict[str, Any] | None] | Exception]
+    results = [(None, None)] * len(items)
+    for index, values in by_shard.items():
+        try:
+            with get_conn(shard=shards[index]) as conn:
+                with conn.cursor() as cur:
+                    rows = execute_values(
+                        cur,
+                        sql,
+                        values,
+                        template="(%s, %s::bigint, %s::bigint, %s::text, %s::text, %s::numeric)",
+                        page_size=len(values),
+                        fetch=True,
+                    )
+        except Exception as exc:
+            for slot, *_ in values:
+                results[slot] = exc
+            continue
+        for row in rows:
+            slot = row.pop("slot")
+            owner_id = row.pop("owner_id")
+            results[slot] = (owner_id, row if row["id"] is not None else None)
+    return results
+
+
+@traced
+def list_key_results_for_objective_db(obj_id: int) -> list[KeyResultRow]:
+    return _read_records(
+        shard_for(obj_id), "okr_list_key_results", (obj_id,), KeyResultRow
+    )
+
+
+@traced
+def search_db(
+    user_id: int, query: str, limit: int, offset: int
+) -> list[dict[str, Any]]:
+    return _read_all(shard_for(user_id), "okr_search", (user_id, query, limit, offset))
+
+
+@contextmanager
+@traced
+def idempotency_key_db(
+    user_id: int, key: str, fingerprint: str
+) -> Iterator[tuple[dict[str, Any] | None, Any]]:
+    # yields (stored response, None) for a key that was already answered,
+    # or (None, cursor) when this request now owns the key. The claimed row
+    # stays uncommitted until the caller is done, so a concurrent duplicate
+    # blocks on it and then replays the result, or takes over if the owner
+    # rolled back. Raises LockNotAvailable after IDEMPOTENCY_WAIT.
+    #
+    # While the key is owned, the request's own writes to the same shard
+    # (get_conn) run in the claim's transaction: the result and its stored
+    # response commit together or not at all. Writes elsewhere (another
+    # shard, the group-commit writer thread) commit on their own, and a
+    # crash before the claim commits lets a retry repeat them.
+    shard = shard_for(user_id)
+    with shard.primary.connection(transaction=True) as conn:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT id, objective_id, title, metric, progress
-                FROM key_results
-                WHERE objective_id = %s
-                ORDER BY id
-                """,
-                (obj_id,),
+                "SELECT set_config('lock_timeout', %s, true)",
+                (f"{int(IDEMPOTENCY_WAIT * 1000)}ms",),
+            )
+            cur.execute(
+                CLAIM_IDEMPOTENCY_KEY_SQL, (user_id, key, fingerprint, IDEMPOTENCY_TTL)
+            )
+            if cur.fetchone():
+                token = claim_conn.set((shard, conn))
+                try:
+                    yield None, cur
+                finally:
+                    claim_conn.reset(token)
+                return
+            cur.execute(
+                "SELECT fingerprint, status, media_type, body FROM idempotency_keys "
+                "WHERE user_id = %s AND key = %s",
+                (user_id, key),
+            )
+            yield cur.fetchone(), None
+
+
+def store_idempotent_response(
+    cur, user_id: int, key: str, status: int, media_type: str | None, body: bytes
+) -> None:
+    cur.execute(
+        "UPDATE idempotency_keys SET status = %s, media_type = %s, body = %s "
+        "WHERE user_id = %s AND key = %s",
+        (status, media_type, body, user_id, key),
+    )
+
+
+@traced
+def purge_idempotency_keys_db() -> int:
+    purged = 0
+    for shard in shards:
+        with get_conn(shard=shard) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM idempotency_keys WHERE expires_at < now()")
+                purged += cur.rowcount
+    return purged
+
+
+# objectives with their key results, one row per key result (or a single
+# NULL-padded row for an objective without any), tree order
+EXPORT_TREE_SQL = """
+SELECT o.id, o.user_id, o.title, o.period,
+       k.id AS kr_id, k.title AS kr_title, k.metric AS kr_metric,
+       k.progress AS kr_progress
+FROM objectives o
+LEFT JOIN key_results k ON k.objective_id = o.id AND k.period = o.period
+WHERE o.user_id = %s
+ORDER BY o.id, k.id
+"""
+
+
+@traced
+def iter_objective_tree_db(
+    user_id: int, batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[list[dict[str, Any]]]:
+    # a named (server-side) cursor hands rows over batch_size at a time, so
+    # the export starts at once and memory stays flat however big the tree
+    with get_conn(transaction=True, shard=shard_for(user_id)) as conn:
+        with conn.cursor(name="okr_export") as cur:
+            cur.itersize = batch_size
+            cur.execute(EXPORT_TREE_SQL, (user_id,))
+            while rows := cur.fetchmany(batch_size):
+                yield rows
+
+
+@traced
+def update_owned_progress_db(
+    kr_id: int, user_id: int, progress: float
+) -> tuple[int | None, dict[str, Any] | None]:
+    # same contract as create_owned_key_result_db; history and rollups are
+    # written by the key_results_record_progress trigger
+    with get_conn(shard=shard_for(kr_id)) as conn:
+        with conn.cursor() as cur:
+            execute_prepared(
+                cur, "okr_update_owned_progress", (kr_id, user_id, progress)
             )
-            return cur.fetchall()
+            row = cur.fetchone()
+    if not row:
+        return None, None
+    owner_id = row.pop("owner_id")
+    return owner_id, (row if row["id"] is not None else None)
+
+
+@traced
+def key_result_series_db(
+    kr_id: int, grain: str, since: date, until: date
+) -> list[dict[str, Any]] | None:
+    rows = _read_all(
+        shard_for(kr_id), "okr_key_result_series", (kr_id, grain, since, until)
+    )
+    if not rows:
+        return None
+    return [row for row in rows if row["bucket_start"] is not None]
+
+
+@traced
+def objective_series_db(
+    obj_id: int, grain: str, since: date, until: date
+) -> list[dict[str, Any]] | None:
+    # rollups inside the window plus each key result's last one before it,
+    # which carries its progress into the window
+    rows = _read_all(
+        shard_for(obj_id), "okr_objective_series", (obj_id, grain, since, until)
+    )
+    if not rows:
+        return None
+    return [row for row in rows if row["bucket_start"] is not None]
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+from fastapi import Request
+from fastapi.responses import Response
+
+ETAG_CACHE_TTL = float(os.getenv("ETAG_CACHE_TTL", "5"))
+ETAG_CACHE_SIZE = int(os.getenv("ETAG_CACHE_SIZE", "10000"))
+# bump when the JSON representation of cached resources changes
+REPRESENTATION = "v1"
+
+
+class VersionCache:
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[Hashable, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key: Hashable, etag: str) -> str:
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.maxsize:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + self.ttl, etag)
+        return etag
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+versions = VersionCache(ETAG_CACHE_TTL, ETAG_CACHE_SIZE)
+
+
+def make_etag(key: tuple[str, Any], version: Any) -> str:
+    kind, ident = key
+    return f'"{REPRESENTATION}-{kind}-{ident}-{version}"'
+
+
+def remember(key: tuple[str, Any], version: Any) -> str:
+    return versions.put(key, make_etag(key, version))
+
+
+# content codings the compression middleware tags onto the ETag of a
+# compressed body, "v1-objective-7-123" becoming "v1-objective-7-123-br"
+CODINGS = ("br", "gzip")
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    return f'{etag[:-1]}-{coding}"' if etag.endswith('"') else etag
+
+
+def _uncoded(tag: str) -> str:
+    for coding in CODINGS:
+        suffix = f'-{coding}"'
+        if tag.endswith(suffix):
+            return tag.removesuffix(suffix) + '"'
+    return tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> str | None:
+    # the client's tag that matches, coding suffix included, so a 304 can
+    # repeat the validator of the representation the client holds
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    # If-None-Match uses weak comparison (RFC 9110 13.1.2)
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if _uncoded(tag) == etag:
+            return tag
+    return None
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+def check_not_modified(
+    request: Request,
+    key: tuple[str, Any],
+    load_version: Callable[[], Any | None],
+) -> Response | None:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    etag = versions.get(key)
+    if etag is None:
+        version = load_version()
+        if version is None:
+            return None
+        etag = remember(key, version)
+    matched = etag_matches(header, etag)
+    if matched:
+        return not_modified(matched)
+    return None
+
+
+def etag_headers(key: tuple[str, Any], version: Any) -> dict[str, str]:
+    return {"ETag": remember(key, version), "Cache-Control": "no-cache"}
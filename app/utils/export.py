@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import csv
+import io
+from typing import Any, Iterable, Iterator
+
+from app.utils.responses import dumps
+
+CSV_COLUMNS = (
+    "objective_id",
+    "objective_title",
+    "period",
+    "key_result_id",
+    "key_result_title",
+    "metric",
+    "progress",
+)
+# spreadsheet apps evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def objective_trees(
+    batches: Iterable[list[dict[str, Any]]],
+) -> Iterator[list[dict[str, Any]]]:
+    # folds joined rows into objectives with nested key results; an
+    # objective split across two batches is held back until it is complete
+    current: dict[str, Any] | None = None
+    for rows in batches:
+        done: list[dict[str, Any]] = []
+        for row in rows:
+            if current is None or current["id"] != row["id"]:
+                if current is not None:
+                    done.append(current)
+                current = {
+                    "id": row["id"],
+                    "user_id": row["user_id"],
+                    "title": row["title"],
+                    "period": row["period"],
+                    "key_results": [],
+                }
+            if row["kr_id"] is not None:
+                current["key_results"].append(
+                    {
+                        "id": row["kr_id"],
+                        "title": row["kr_title"],
+                        "metric": row["kr_metric"],
+                        "progress": row["kr_progress"],
+                    }
+                )
+        if done:
+            yield done
+    if current is not None:
+        yield [current]
+
+
+def ndjson_stream(batches: Iterable[list[dict[str, Any]]]) -> Iterator[bytes]:
+    for trees in objective_trees(batches):
+        yield b"".join(dumps(tree) + b"\n" for tree in trees)
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(batches: Iterable[list[dict[str, Any]]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    # the header goes out before the first row is fetched
+    yield buf.getvalue().encode()
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        for row in rows:
+            writer.writerow(
+                _cell(value)
+                for value in (
+                    row["id"],
+                    row["title"],
+                    row["period"],
+                    row["kr_id"],
+                    row["kr_title"],
+                    row["kr_metric"],
+                    row["kr_progress"],
+                )
+            )
+        yield buf.getvalue().encode()
+
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_stream),
+    "csv": ("text/csv; charset=utf-8", csv_stream),
+}
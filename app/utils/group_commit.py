@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generic, TypeVar
+
+from app.utils.db import (
+    DB_POOL_TIMEOUT,
+    create_owned_key_result_db,
+    create_owned_key_results_batch_db,
+)
+
+GROUP_COMMIT_ENABLED = os.getenv("KR_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("KR_GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("KR_GROUP_COMMIT_MAX_BATCH", "100"))
+
+logger = logging.getLogger("group_commit")
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class _Pending(Generic[T]):
+    params: tuple[Any, ...]
+    future: Future[T] = field(default_factory=Future)
+
+
+class GroupCommitWriter(Generic[T]):
+    def __init__(
+        self,
+        flush_batch: Callable[[list[tuple[Any, ...]]], list[T | Exception]],
+        flush_one: Callable[..., T],
+        *,
+        window: float,
+        max_batch: int,
+        timeout: float = 2 * DB_POOL_TIMEOUT,
+    ) -> None:
+        # flush_batch returns an outcome per item, the error for each item
+        # it did not commit; raising means it committed none of them
+        self.flush_batch = flush_batch
+        self.flush_one = flush_one
+        self.window = window
+        self.max_batch = max_batch
+        # how long a submitter waits for its flush: long enough for the
+        # writer to get a connection and retry a failed batch singly. On
+        # expiry the item may still be written afterwards.
+        self.timeout = timeout
+        # one queue per writer thread: a sentinel left by close() is only
+        # ever read by the thread it was meant for
+        self._queue: queue.SimpleQueue[_Pending[T] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, *params: Any) -> T:
+        pending: _Pending[T] = _Pending(params)
+        # under the lock, so that nothing is queued behind close()'s sentinel
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="group-commit",
+                    daemon=True,
+                )
+                self._thread.start()
+            self._queue.put(pending)
+        return pending.future.result(timeout=self.timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _run(self, pending: queue.SimpleQueue[_Pending[T] | None]) -> None:
+        stopping = False
+        while not stopping:
+            first = pending.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: list[_Pending[T]]) -> None:
+        results: list[T | Exception]
+        try:
+            results = self.flush_batch([p.params for p in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.error(
+                "group commit of %d of %d items failed, retrying them singly",
+                len(failed),
+                len(batch),
+                exc_info=failed[0],
+            )
+        for pending, result in zip(batch, results):
+            if not isinstance(result, Exception):
+                pending.future.set_result(result)
+                continue
+            # only what was not committed, and one bad item must not fail
+            # its neighbours
+            try:
+                pending.future.set_result(self.flush_one(*pending.params))
+            except Exception as exc:
+                pending.future.set_exception(exc)
+
+
+key_result_writer: GroupCommitWriter[tuple[int | None, dict[str, Any] | None]] = (
+    GroupCommitWriter(
+        create_owned_key_results_batch_db,
+        create_owned_key_result_db,
+        window=GROUP_COMMIT_WINDOW_MS / 1000,
+        max_batch=GROUP_COMMIT_MAX_BATCH,
+    )
+)
+
+
+def create_owned_key_result(
+    objective_id: int, user_id: int, title: str, metric: str, progress: float
+) -> tuple[int | None, dict[str, Any] | None]:
+    if GROUP_COMMIT_ENABLED:
+        return key_result_writer.submit(objective_id, user_id, title, metric, progress)
+    return create_owned_key_result_db(objective_id, user_id, title, metric, progress)
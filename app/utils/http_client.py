@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import httpx
+from app.utils import tracing
+
+if TYPE_CHECKING:
+    import httpx
 
 
 class HttpClientError(Exception):
@@ -17,6 +22,11 @@ class HttpClientTimeout(HttpClientError):
         super().__init__(message)
 
 
+class HttpClientCircuitOpen(HttpClientError):
+    def __init__(self, message: str = "circuit open") -> None:
+        super().__init__(message)
+
+
 @dataclass(slots=True)
 class SafeHttpClientConfig:
     base_url: str | None = None
@@ -24,6 +34,50 @@ class SafeHttpClientConfig:
     retries: int = 2
     max_connections: int = 10
     max_keepalive_connections: int = 5
+    breaker_threshold: int = 5
+    breaker_reset: float = 30.0
+
+
+class CircuitBreaker:
+    # opens after `threshold` failed calls in a row; once `reset_after` has
+    # passed, a single trial call decides whether it closes again
+    def __init__(self, threshold: int, reset_after: float) -> None:
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_after:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_after:
+                return False
+            # re-armed, so concurrent callers keep failing fast meanwhile
+            self.opened_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
 
 
 class SafeHttpClient:
@@ -33,6 +87,9 @@ class SafeHttpClient:
         *,
         transport: httpx.BaseTransport | None = None,
     ) -> None:
+        # httpx is deferred until the first client is built
+        import httpx
+
         self.config = config or SafeHttpClientConfig()
 
         limits = httpx.Limits(
@@ -50,6 +107,9 @@ class SafeHttpClient:
             kwargs["base_url"] = self.config.base_url
 
         self._client = httpx.Client(**kwargs)
+        self.breaker = CircuitBreaker(
+            self.config.breaker_threshold, self.config.breaker_reset
+        )
 
     def get_json(self, url: str, **kwargs: Any) -> Any:
         resp = self._request("GET", url, **kwargs)
@@ -60,11 +120,39 @@ class SafeHttpClient:
         return resp.json()
 
     def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        if not self.breaker.allow():
+            raise HttpClientCircuitOpen()
+        try:
+            resp = self._attempts(method, url, **kwargs)
+        except HttpClientError as exc:
+            # a 4xx is the caller's problem, not a sign of a sick upstream
+            if exc.status_code is not None and exc.status_code < 500:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return resp
+
+    def _attempts(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        import httpx
+
         last_exc: Exception | None = None
 
         for attempt in range(self.config.retries + 1):
             try:
-                resp = self._client.request(method, url, **kwargs)
+                with tracing.span(
+                    f"upstream {method}", url=str(url), attempt=attempt
+                ) as span:
+                    # each attempt is the upstream's parent, not the call
+                    headers = {
+                        **(kwargs.get("headers") or {}),
+                        **tracing.propagation_headers(span),
+                    }
+                    resp = self._client.request(
+                        method, url, **{**kwargs, "headers": headers}
+                    )
+                    span.set(status_code=resp.status_code)
 
                 if 500 <= resp.status_code < 600 and attempt < self.config.retries:
                     continue
@@ -103,6 +191,12 @@ def get_http_client() -> SafeHttpClient:
     return _http_client
 
 
+def breaker_state() -> str:
+    if _http_client is None:
+        return "closed"
+    return _http_client.breaker.state
+
+
 def close() -> None:
     global _http_client
     if _http_client is not None:
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import threading
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from psycopg2 import errors
+
+from app.utils import db
+from app.utils.logger import audit_log
+from app.utils.responses import problem
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# an owner holds one connection for its claim and needs another for the
+# work itself: capped so that claims alone can never drain the pool
+_claims = threading.BoundedSemaphore(max(1, db.DB_POOL_MAX // 2))
+
+
+def fingerprint(request: Request) -> str:
+    # the API takes its input as query parameters
+    query = "&".join(sorted(request.url.query.split("&")))
+    raw = f"{request.method} {request.url.path}?{query}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _replay(stored: dict[str, Any]) -> Response:
+    return Response(
+        bytes(stored["body"]),
+        status_code=stored["status"],
+        media_type=stored["media_type"],
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _problem(request: Request, user_id: int, action: str, status: int, detail: str):
+    audit_log(request, str(user_id), action, "error")
+    return problem(
+        status,
+        "Idempotency error",
+        detail,
+        type_="https://example.com/problems/idempotency",
+    )
+
+
+def idempotent(endpoint: Callable[..., Response]) -> Callable[..., Response]:
+    # For POST handlers taking `request` and `user`: with an Idempotency-Key
+    # header the first successful response is stored for the caller and
+    # returned as-is to every retry, without running the handler again.
+    # Errors are not stored; a retry after one executes afresh.
+    @functools.wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Response:
+        request: Request = kwargs["request"]
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return endpoint(*args, **kwargs)
+
+        user_id = int(kwargs["user"]["id"])
+        if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            return _problem(
+                request,
+                user_id,
+                "idempotency_invalid_key",
+                422,
+                f"{IDEMPOTENCY_HEADER} must be 1..{MAX_KEY_LENGTH} printable chars",
+            )
+
+        request_fingerprint = fingerprint(request)
+        with _claims:
+            try:
+                with db.idempotency_key_db(user_id, key, request_fingerprint) as (
+                    stored,
+                    cur,
+                ):
+                    if stored is not None:
+                        if stored["fingerprint"] != request_fingerprint:
+                            return _problem(
+                                request,
+                                user_id,
+                                "idempotency_key_reused",
+                                422,
+                                f"{IDEMPOTENCY_HEADER} was used for a different request",
+                            )
+                        audit_log(request, str(user_id), "idempotent_replay", "allow")
+                        return _replay(stored)
+
+                    response = endpoint(*args, **kwargs)
+                    if 200 <= response.status_code < 300:
+                        db.store_idempotent_response(
+                            cur,
+                            user_id,
+                            key,
+                            response.status_code,
+                            response.media_type,
+                            bytes(response.body),
+                        )
+                    else:
+                        cur.connection.rollback()
+                    return response
+            except errors.LockNotAvailable:
+                return _problem(
+                    request,
+                    user_id,
+                    "idempotency_in_progress",
+                    409,
+                    "A request with this key is still being processed",
+                )
+
+    return wrapper
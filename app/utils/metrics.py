@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+LabelSet = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._counters: dict[str, dict[LabelSet, float]] = {}
+        self._gauges: dict[str, dict[LabelSet, Callable[[], float]]] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_: str) -> None:
+        with self._lock:
+            self._counters.setdefault(name, {})
+            self._help[name] = help_
+
+    def gauge(
+        self, name: str, help_: str, read: Callable[[], float], **labels: str
+    ) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = read
+            self._help[name] = help_
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def value(self, name: str, **labels: str) -> float:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name][key]()
+            return self._counters.get(name, {}).get(key, 0)
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines: list[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, readers in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, read in sorted(readers.items()):
+                lines.append(f"{name}{_format_labels(labels)} {read():g}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+metrics = Metrics()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import builtins
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+PROFILE_ENV = "STARTUP_PROFILE"
+TIME_TO_FIRST_REQUEST_BUDGET = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.0"))
+
+logger = logging.getLogger("startup")
+handler = logging.StreamHandler()
+handler.setFormatter(logging.Formatter("%(message)s"))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+_original_import = builtins.__import__
+_started_at = time.perf_counter()
+
+
+def enabled() -> bool:
+    return os.getenv(PROFILE_ENV, "") not in ("", "0")
+
+
+class StartupProfile:
+    def __init__(self) -> None:
+        self.imports: dict[str, float] = {}
+        self.steps: list[tuple[str, float]] = []
+
+    def install_import_timer(self) -> None:
+        if builtins.__import__ is not _original_import:
+            return
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            top = name.partition(".")[0]
+            if level or top in sys.modules:
+                return _original_import(name, globals, locals, fromlist, level)
+            start = time.perf_counter()
+            try:
+                return _original_import(name, globals, locals, fromlist, level)
+            finally:
+                # cumulative: a package's time includes everything it imports
+                self.imports.setdefault(top, time.perf_counter() - start)
+
+        builtins.__import__ = timed_import
+
+    def uninstall_import_timer(self) -> None:
+        builtins.__import__ = _original_import
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def report(self, top: int = 15) -> dict[str, Any]:
+        imports = sorted(self.imports.items(), key=lambda kv: kv[1], reverse=True)
+        ready_after = time.perf_counter() - _started_at
+        return {
+            "imports_ms": {name: round(sec * 1000, 2) for name, sec in imports[:top]},
+            "steps_ms": {name: round(sec * 1000, 2) for name, sec in self.steps},
+            "ready_after_ms": round(ready_after * 1000, 2),
+            "budget_ms": round(TIME_TO_FIRST_REQUEST_BUDGET * 1000, 2),
+            "within_budget": ready_after <= TIME_TO_FIRST_REQUEST_BUDGET,
+        }
+
+    def log_report(self) -> None:
+        if enabled():
+            self.uninstall_import_timer()
+            logger.info(json.dumps({"startup_profile": self.report()}))
+
+
+startup = StartupProfile()
+if enabled():
+    startup.install_import_timer()
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any
+
+GRAINS = ("day", "week")
+MAX_SERIES_POINTS = 400
+DEFAULT_WINDOW_DAYS = 90
+
+
+def bucket_start(grain: str, day: date) -> date:
+    # weeks start on Monday, as date_trunc('week', ...) does
+    return day if grain == "day" else day - timedelta(days=day.weekday())
+
+
+def bucket_starts(grain: str, since: date, until: date) -> list[date]:
+    step = timedelta(days=1 if grain == "day" else 7)
+    start, last = bucket_start(grain, since), bucket_start(grain, until)
+    starts = []
+    while start <= last:
+        starts.append(start)
+        start += step
+    return starts
+
+
+def key_result_points(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    return [
+        {
+            "start": row["bucket_start"],
+            "samples": row["samples"],
+            "avg": row["progress_avg"],
+            "min": row["progress_min"],
+            "max": row["progress_max"],
+            "last": row["progress_last"],
+        }
+        for row in rows
+    ]
+
+
+def objective_points(
+    rows: list[dict[str, Any]], starts: list[date]
+) -> list[dict[str, Any]]:
+    # an objective's progress in a bucket is the mean of its key results'
+    # closing values, each carried forward until it changes again
+    latest: dict[int, Decimal] = {}
+    points = []
+    pos = 0
+    for start in starts:
+        while pos < len(rows) and rows[pos]["bucket_start"] <= start:
+            latest[rows[pos]["key_result_id"]] = rows[pos]["progress_last"]
+            pos += 1
+        if latest:
+            mean = sum(latest.values(), Decimal(0)) / len(latest)
+            points.append(
+                {
+                    "start": start,
+                    "progress": mean.quantize(Decimal("0.01")),
+                    "key_results": len(latest),
+                }
+            )
+    return points
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from app.utils import db, http_client
+from app.utils.secrets import secret_is_loaded
+
+READINESS_INTERVAL = float(os.getenv("READINESS_INTERVAL", "2"))
+# a result older than this (the checker is stuck) no longer counts as ready
+READINESS_TTL = float(os.getenv("READINESS_TTL", "10"))
+
+logger = logging.getLogger("readiness")
+
+
+def check_database() -> None:
+    db.ping_db()
+
+
+def check_secrets() -> None:
+    if not secret_is_loaded():
+        raise RuntimeError("JWT secret is not loaded")
+
+
+def check_upstream() -> None:
+    if http_client.breaker_state() == "open":
+        raise RuntimeError("upstream circuit breaker is open")
+
+
+CHECKS: dict[str, Callable[[], None]] = {
+    "database": check_database,
+    "secrets": check_secrets,
+    "upstream": check_upstream,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Readiness:
+    ready: bool
+    checks: dict[str, str]
+    checked_at: float
+
+
+# Runs the checks on a background thread every `interval` seconds; probes
+# only read the last result, so however often they come the database sees
+# one SELECT 1 per interval and worker.
+class ReadinessProbe:
+    def __init__(
+        self,
+        checks: dict[str, Callable[[], None]] | None = None,
+        interval: float = READINESS_INTERVAL,
+        ttl: float = READINESS_TTL,
+    ) -> None:
+        self.checks = CHECKS if checks is None else checks
+        self.interval = interval
+        self.ttl = ttl
+        self._result: Readiness | None = None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        # the first result is computed before returning
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self.refresh()
+            self._thread = threading.Thread(
+                target=self._run, name="readiness", daemon=True
+            )
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def refresh(self) -> Readiness:
+        results = {}
+        for name, check in self.checks.items():
+            try:
+                check()
+                results[name] = "ok"
+            except Exception as exc:
+                logger.warning("readiness check %s failed: %s", name, exc)
+                results[name] = "failed"
+        result = Readiness(
+            all(v == "ok" for v in results.values()), results, time.monotonic()
+        )
+        self._result = result
+        return result
+
+    def current(self) -> Readiness:
+        result = self._result
+        if result is None or time.monotonic() - result.checked_at > self.ttl:
+            return Readiness(False, {"probe": "stale"}, 0.0)
+        return result
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.refresh()
+
+
+readiness = ReadinessProbe()
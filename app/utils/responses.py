@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Any
+from uuid import uuid4
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from app.utils.tracing import correlation_id
+
+
+def _default(obj: Any) -> Any:
+    # NUMERIC columns (progress) arrive as Decimal; same rule as
+    # fastapi.encoders.decimal_encoder so the wire format does not change
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    # date/datetime/UUID and dict subclasses (RealDictRow) are native to orjson
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Returning this from a handler also skips FastAPI's jsonable_encoder walk,
+# which otherwise copies every row before it is encoded.
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# RFC 7807 problem document
+def problem(
+    status: int, title: str, detail: str, type_: str = "about:blank"
+) -> FastJSONResponse:
+    # the request's own id, so a report can be matched to logs and traces
+    cid = correlation_id() or str(uuid4())
+    return FastJSONResponse(
+        {
+            "type": type_,
+            "title": title,
+            "status": status,
+            "detail": detail,
+            "correlation_id": cid,
+        },
+        status_code=status,
+    )
@@ -1,17 +1,21 @@
 import os
 import time
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import hvac
+if TYPE_CHECKING:
+    import hvac
 
 MOUNT_POINT = "kv"
 SECRET_PATH = "jwt"
 SECRET_KEY = "JWT_SECRET"
 RETRY_SECONDS = 30
 SLEEP_STEP = 1
+# the secret is read once, at import of the auth middleware, and never
+# reloaded: readiness can only tell whether that read succeeded
+_secret_loaded = False
 
 
-def _read_from_vault(client: hvac.Client) -> str:
+def _read_from_vault(client: "hvac.Client") -> str:
     res = client.secrets.kv.v2.read_secret_version(
         mount_point=MOUNT_POINT,
         path=SECRET_PATH,
@@ -25,10 +29,20 @@ def _read_from_vault(client: hvac.Client) -> str:
     return data[SECRET_KEY]
 
 
+def _loaded(secret: str) -> str:
+    global _secret_loaded
+    _secret_loaded = True
+    return secret
+
+
+def secret_is_loaded() -> bool:
+    return _secret_loaded
+
+
 def get_jwt_secret() -> str:
     env_secret = os.getenv(SECRET_KEY)
     if env_secret:
-        return env_secret
+        return _loaded(env_secret)
 
     vault_addr = os.getenv("VAULT_ADDR")
     vault_token = os.getenv("VAULT_TOKEN")
@@ -41,6 +55,9 @@ def get_jwt_secret() -> str:
             "Missing VAULT_TOKEN (required to fetch JWT secret from Vault)"
         )
 
+    # hvac is only needed when the secret is not injected via env
+    import hvac
+
     client = hvac.Client(url=vault_addr, token=vault_token)
 
     deadline = time.time() + RETRY_SECONDS
@@ -49,7 +66,7 @@ def get_jwt_secret() -> str:
         try:
             if not client.is_authenticated():
                 raise RuntimeError("Not authenticated to Vault (bad token?)")
-            return _read_from_vault(client)
+            return _loaded(_read_from_vault(client))
         except Exception as err:
             last_err = err
             time.sleep(SLEEP_STEP)
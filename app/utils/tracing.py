@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine, Iterator, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+CORRELATION_HEADER = "x-correlation-id"
+# spans are only recorded when there is somewhere to export them to
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# requests at least this slow are exported whether sampled or not
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def trace_id_for(correlation_id: str) -> str:
+    # W3C trace ids are 32 hex digits, which a UUID correlation id already
+    # is; anything else a client sent is hashed into one
+    try:
+        return uuid.UUID(correlation_id).hex
+    except ValueError:
+        return hashlib.sha256(correlation_id.encode()).hexdigest()[:32]
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    span_id: str
+    parent_id: str | None
+    start: int
+    end: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class Trace:
+    def __init__(self, correlation_id: str, sampled: bool) -> None:
+        self.correlation_id = correlation_id
+        self.trace_id = trace_id_for(correlation_id)
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        # spans are timed with perf_counter and placed on the wall clock
+        # relative to the start of the trace
+        self.wall_start = time.time_ns()
+        self.perf_start = time.perf_counter_ns()
+
+    def export_rows(self) -> list[dict[str, Any]]:
+        offset = self.wall_start - self.perf_start
+        return [
+            {
+                "trace_id": self.trace_id,
+                "span_id": s.span_id,
+                "parent_span_id": s.parent_id,
+                "name": s.name,
+                "start_time_unix_nano": s.start + offset,
+                "end_time_unix_nano": s.end + offset,
+                "duration_ms": round((s.end - s.start) / 1e6, 3),
+                "attributes": s.attributes,
+            }
+            for s in self.spans
+        ]
+
+
+_correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def correlation_id() -> str | None:
+    return _correlation_id.get()
+
+
+@contextmanager
+def span(name: str, activate: bool = True, **attributes: Any) -> Iterator[Span]:
+    # activate=False records the span without making it the parent of what
+    # runs meanwhile: for generators, whose body runs between the caller's
+    # own steps
+    trace = _trace.get()
+    parent = _span.get()
+    current = Span(
+        name,
+        _span_id(),
+        parent.span_id if parent else None,
+        time.perf_counter_ns(),
+        attributes=attributes,
+    )
+    token = _span.set(current) if activate else None
+    try:
+        yield current
+    except BaseException as exc:
+        current.set(error=type(exc).__name__)
+        raise
+    finally:
+        current.end = time.perf_counter_ns()
+        if token is not None:
+            _span.reset(token)
+        if trace is not None:
+            trace.spans.append(current)
+
+
+def annotate(**attributes: Any) -> None:
+    # adds to the innermost active span, if any
+    current = _span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def traced(fn: F) -> F:
+    # a span per call, named after the function; a generator's span runs
+    # from its first step until it is exhausted or closed
+    name = f"{fn.__module__.rpartition('.')[2]}.{fn.__name__}"
+    if inspect.isgeneratorfunction(fn):
+
+        @functools.wraps(fn)
+        def generator(*args: Any, **kwargs: Any) -> Any:
+            with span(name, activate=False):
+                return (yield from fn(*args, **kwargs))
+
+        return generator  # type: ignore[return-value]
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def propagation_headers(current: Span | None = None) -> dict[str, str]:
+    # for outgoing calls: the correlation id as is, plus a traceparent so
+    # that a traced upstream joins the same trace
+    cid = _correlation_id.get()
+    if cid is None:
+        return {}
+    trace = _trace.get()
+    parent = current or _span.get()
+    flags = "01" if trace is not None and trace.sampled else "00"
+    parent_id = parent.span_id if parent else _span_id()
+    return {
+        CORRELATION_HEADER: cid,
+        "traceparent": f"00-{trace_id_for(cid)}-{parent_id}-{flags}",
+    }
+
+
+class JsonlExporter:
+    # one OTLP-shaped JSON object per span and line; a trace is written in
+    # a single call so that concurrent requests do not interleave
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, rows: list[dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(row, default=str) + "\n" for row in rows)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+exporter: JsonlExporter | None = JsonlExporter(TRACE_FILE) if TRACE_FILE else None
+
+
+def _finish(trace: Trace, root: Span) -> None:
+    slow = (root.end - root.start) / 1e6 >= TRACE_SLOW_MS
+    if exporter is not None and (trace.sampled or slow):
+        exporter.export(trace.export_rows())
+
+
+@contextmanager
+def request_trace(cid: str) -> Iterator[Span]:
+    # the request's root span; everything below it, in this task or in the
+    # threads it hands work to, lands in the same trace
+    cid_token = _correlation_id.set(cid)
+    trace = None
+    if exporter is not None:
+        trace = Trace(cid, random.random() < TRACE_SAMPLE_RATE)
+    trace_token = _trace.set(trace)
+    try:
+        with span("request") as root:
+            yield root
+    finally:
+        _trace.reset(trace_token)
+        _correlation_id.reset(cid_token)
+        if trace is not None:
+            _finish(trace, root)
+
+
+class TracedRoute(APIRoute):
+    # dependencies (authentication included), validation, the endpoint and
+    # serialisation of its result
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        name = f"handler {self.name}"
+
+        async def traced_handler(request: Request) -> Response:
+            with span(name):
+                return await handler(request)
+
+        return traced_handler
+
+
+def traced_middleware(cls: Callable[..., ASGIApp]) -> Callable[..., ASGIApp]:
+    # for app.add_middleware: the middleware's span includes everything
+    # inside it, so its own cost is its duration less its child's
+    name = f"middleware {getattr(cls, '__name__', cls)}"
+
+    def build(app: ASGIApp, *args: Any, **kwargs: Any) -> ASGIApp:
+        inner = cls(app, *args, **kwargs)
+
+        async def call(scope: Scope, receive: Receive, send: Send) -> None:
+            if scope["type"] != "http":
+                await inner(scope, receive, send)
+                return
+            with span(name):
+                await inner(scope, receive, send)
+
+        return call
+
+    return build
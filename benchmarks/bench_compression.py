@@ -0,0 +1,59 @@
+"""CPU vs bytes for gzip levels and brotli qualities on a
+GET /users/{id}/objectives sized payload.
+
+    python -m benchmarks.bench_compression [rows] [repeat]
+"""
+
+import gzip
+import sys
+import time
+from datetime import date, timedelta
+
+import brotli
+
+from app.utils.responses import dumps
+
+
+def payload(rows: int) -> bytes:
+    start = date.today()
+    return dumps(
+        [
+            {
+                "id": i,
+                "user_id": 42,
+                "title": f"Grow weekly active users in region {i % 17}",
+                "period": start + timedelta(days=i % 365),
+            }
+            for i in range(rows)
+        ]
+    )
+
+
+def timed(compress, body: bytes, repeat: int) -> tuple[float, int]:
+    out = compress(body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compress(body)
+    return (time.perf_counter() - start) / repeat * 1000, len(out)
+
+
+def main(rows: int, repeat: int) -> None:
+    body = payload(rows)
+    print(f"identity: {len(body):>10} bytes")
+    cases = [
+        (f"gzip -{lvl}", lambda b, lvl=lvl: gzip.compress(b, lvl)) for lvl in (1, 6, 9)
+    ]
+    cases += [
+        (f"br q{q}", lambda b, q=q: brotli.compress(b, quality=q))
+        for q in (1, 4, 5, 6, 11)
+    ]
+    for label, compress in cases:
+        ms, size = timed(compress, body, repeat)
+        print(
+            f"{label:<8}: {size:>10} bytes  {100 * size / len(body):5.1f}%  {ms:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [10_000, 5][len(args) :]))
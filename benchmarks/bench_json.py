@@ -0,0 +1,62 @@
+"""Old (jsonable_encoder + JSONResponse) vs FastJSONResponse rendering of
+list responses shaped like objective and key-result rows.
+
+    python -m benchmarks.bench_json [repeat]
+"""
+
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.utils.responses import FastJSONResponse
+
+
+def make_rows(n: int) -> list[dict]:
+    start = date.today()
+    return [
+        {
+            "id": i,
+            "objective_id": i // 4,
+            "title": f"key result {i}",
+            "metric": "%",
+            "progress": Decimal(f"0.{i % 100:02d}"),
+            "period": start + timedelta(days=i % 365),
+        }
+        for i in range(n)
+    ]
+
+
+def old_path(rows):
+    return JSONResponse(jsonable_encoder(rows)).body
+
+
+def fast_path(rows):
+    return FastJSONResponse(rows).body
+
+
+def timed(fn, rows, repeat: int) -> float:
+    fn(rows)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(repeat: int) -> None:
+    for n in (1_000, 10_000):
+        rows = make_rows(n)
+        assert old_path(rows) == fast_path(rows)
+        old = timed(old_path, rows, repeat)
+        fast = timed(fast_path, rows, repeat)
+        print(
+            f"{n:>6} rows: jsonable_encoder+json {old:8.2f} ms  orjson {fast:7.2f} ms"
+            f"  x{old / fast:5.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
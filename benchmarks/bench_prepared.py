@@ -0,0 +1,75 @@
+"""Plain vs prepared execution of the SQL behind GET /objectives/{id} and
+POST /key-results.
+
+    DB_DSN=... python -m benchmarks.bench_prepared [iterations]
+"""
+
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+from app.utils.db import (
+    ID_BUCKETS,
+    PREPARED_SQL,
+    create_objective_db,
+    create_user_db,
+    execute_prepared,
+    get_conn,
+    init_db,
+    shard_for,
+)
+
+
+def plain_sql(name: str) -> str:
+    return re.sub(r"\$(\d+)", r"%(p\1)s", PREPARED_SQL[name])
+
+
+def plain_params(params: tuple) -> dict:
+    return {f"p{i}": value for i, value in enumerate(params, start=1)}
+
+
+def bench(label: str, iterations: int, run, shard=None) -> float:
+    # one transaction, rolled back at the end: no benchmark rows are kept
+    with get_conn(transaction=True, shard=shard) as conn:
+        with conn.cursor() as cur:
+            run(cur)  # warm up (and PREPARE once for the prepared path)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                run(cur)
+            elapsed = time.perf_counter() - start
+        conn.rollback()
+    per_call = elapsed / iterations * 1e6
+    print(f"{label:<40} {per_call:8.1f} us/call")
+    return per_call
+
+
+def main(iterations: int) -> None:
+    init_db()
+    user = create_user_db("bench")
+    obj = create_objective_db(user["id"], "bench", date.today() + timedelta(days=30))
+    get_sql = plain_sql("okr_get_objective")
+    insert_sql = plain_sql("okr_create_owned_key_result")
+    kr = (obj["id"], user["id"], "bench kr", "%", 0.5, ID_BUCKETS)
+
+    for endpoint, name, sql, params in (
+        ("GET /objectives/{id}", "okr_get_objective", get_sql, (obj["id"],)),
+        ("POST /key-results", "okr_create_owned_key_result", insert_sql, kr),
+    ):
+        plain = bench(
+            f"{endpoint} plain",
+            iterations,
+            lambda c: c.execute(sql, plain_params(params)),
+            shard_for(obj["id"]),
+        )
+        prepared = bench(
+            f"{endpoint} prepared",
+            iterations,
+            lambda c: execute_prepared(c, name, params),
+            shard_for(obj["id"]),
+        )
+        print(f"{endpoint:<40} saving {100 * (1 - prepared / plain):6.1f}%")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
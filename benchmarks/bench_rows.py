@@ -0,0 +1,70 @@
+"""RealDictRow vs slotted record rows for the list helpers: memory held per
+100k key-result rows (tracemalloc), fetch time and JSON encoding time.
+
+    DB_DSN=... python -m benchmarks.bench_rows [rows]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from psycopg2.extras import RealDictCursor
+
+from app.utils.db import KeyResultRow, TupleCursor, get_conn
+from app.utils.responses import dumps
+
+# shaped like okr_list_key_results, without needing the rows to exist
+ROWS_SQL = """
+SELECT g AS id, g / 4 AS objective_id, 'key result ' || g AS title,
+       '%%' AS metric, ((g %% 100) / 100.0)::numeric(5,2) AS progress
+FROM generate_series(1, %s) g
+"""
+
+
+def fetch_dicts(conn, n: int) -> list:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(ROWS_SQL, (n,))
+        return cur.fetchall()
+
+
+def fetch_records(conn, n: int) -> list:
+    with conn.cursor(cursor_factory=TupleCursor) as cur:
+        cur.execute(ROWS_SQL, (n,))
+        return [KeyResultRow(*row) for row in cur.fetchall()]
+
+
+def measure(fetch, conn, n: int) -> tuple[list, float, int, int]:
+    fetch(conn, n)  # warm up
+    start = time.perf_counter()
+    rows = fetch(conn, n)
+    elapsed = time.perf_counter() - start
+    del rows
+    # timed apart: tracing every allocation slows the fetch down severalfold
+    tracemalloc.start()
+    rows = fetch(conn, n)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, elapsed, held, peak
+
+
+def main(n: int) -> None:
+    per = 100_000 / n
+    with get_conn() as conn:
+        results = {}
+        for label, fetch in (("RealDictRow", fetch_dicts), ("record", fetch_records)):
+            rows, elapsed, held, peak = measure(fetch, conn, n)
+            start = time.perf_counter()
+            body = dumps(rows)
+            encode = time.perf_counter() - start
+            results[label] = body
+            print(
+                f"{label:>11}: held {held * per / 2**20:6.1f} MiB"
+                f"  peak {peak * per / 2**20:6.1f} MiB per 100k rows"
+                f"  fetch {elapsed * 1000:7.1f} ms  encode {encode * 1000:6.1f} ms"
+            )
+            del rows
+    assert results["RealDictRow"] == results["record"]
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
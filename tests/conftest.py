@@ -9,7 +9,7 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from app.middleware.auth import make_jwt  # noqa: E402
-from app.utils.db import init_db  # noqa: E402
+from app.utils.db import DB_DSN, init_db  # noqa: E402
 
 os.environ.setdefault("VAULT_ADDR", "http://localhost:8200")
 os.environ.setdefault("VAULT_TOKEN", "root")
@@ -22,3 +22,9 @@ def _init_db():
 
 
 make_jwt = make_jwt
+
+
+def schema_dsn(schema: str) -> str:
+    # a schema of the test database standing in for a separate server
+    sep = "&" if "?" in DB_DSN else "?"
+    return f"{DB_DSN}{sep}options=-csearch_path%3D{schema}"
@@ -0,0 +1,68 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.middleware import admission
+from app.middleware.admission import Gate, GradientLimit, route_class
+from app.utils.metrics import metrics
+
+client = TestClient(app)
+
+
+def test_route_classes():
+    assert route_class("GET", "/objectives/1") == "read"
+    assert route_class("POST", "/key-results") == "write"
+    assert route_class("GET", "/users/1/objectives/export") == "export"
+    assert route_class("GET", "/health") is None
+    assert route_class("GET", "/changes") is None
+
+
+def test_limit_shrinks_when_latency_rises_and_recovers():
+    limit = GradientLimit(initial=20, min_limit=2, max_limit=40)
+    for _ in range(50):
+        limit.update(0.01, in_flight=20)
+    grown = limit.limit
+    assert grown > 20
+    for _ in range(50):
+        limit.update(0.2, in_flight=int(limit.limit))
+    assert limit.limit < grown / 2
+    for _ in range(200):
+        limit.update(0.01, in_flight=int(limit.limit))
+    assert limit.limit > 20
+
+
+def test_queued_request_gets_the_released_slot_or_times_out():
+    async def scenario():
+        gate = Gate(GradientLimit(initial=1, min_limit=1, max_limit=1), 1, 0.2)
+        assert await gate.acquire() is None
+        waiting = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert await gate.acquire() == "queue_full"
+        gate.release(0.01)
+        assert await waiting is None and gate.in_flight == 1
+        assert await gate.acquire() == "timeout"
+        assert not gate.waiters
+
+    asyncio.run(scenario())
+
+
+def test_excess_requests_are_shed_with_a_problem(monkeypatch):
+    gate = Gate(GradientLimit(initial=1, min_limit=1, max_limit=1), 0)
+    gate.in_flight = 1
+    monkeypatch.setitem(admission.gates, "read", gate)
+    before = metrics.value(
+        "admission_shed_total", route_class="read", reason="queue_full"
+    )
+
+    r = client.get("/objectives/1")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    assert r.headers["content-type"] == "application/json"
+    assert r.json()["type"] == "https://example.com/problems/overloaded"
+    assert client.get("/health").status_code == 200
+    after = metrics.value(
+        "admission_shed_total", route_class="read", reason="queue_full"
+    )
+    assert after == before + 1
+    assert 'admission_queue_depth{route_class="write"} 0' in client.get("/metrics").text
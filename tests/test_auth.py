@@ -1,8 +1,12 @@
 from datetime import date
 
+import pytest
+from fastapi import APIRouter
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.middleware.auth import AUTH, PROBE, PUBLIC, compile_access_policies
+from tests.conftest import make_jwt
 
 client = TestClient(app)
 
@@ -51,3 +55,30 @@ def test_create_key_result_unauthorized():
     body = r.json()
     assert body["status"] == 401
     assert "Missing or invalid" in body["title"]
+
+
+def test_every_route_has_a_compiled_policy():
+    policies = app.state.access_policies
+    assert policies[("/users", "POST")] == PUBLIC
+    assert policies[("/users/{user_id}/objectives/export", "GET")] == PUBLIC
+    assert policies[("/search", "GET")] == AUTH
+    assert policies[("/changes", "GET")] == AUTH
+    assert policies[("/key-results/{kr_id}/progress", "POST")] == AUTH
+    assert policies[("/livez", "GET")] == PROBE
+
+
+def test_route_without_policy_fails_startup():
+    router = APIRouter()
+
+    @router.get("/users/{user_id}/secret")
+    def secret(user_id: int):
+        return {}
+
+    with pytest.raises(RuntimeError, match="/users/{user_id}/secret"):
+        compile_access_policies(router.routes)
+
+
+def test_unknown_paths_need_a_token_before_they_404():
+    assert client.get("/users/1/nothing-here").status_code == 401
+    headers = {"Authorization": f"Bearer {make_jwt(sub='1')}"}
+    assert client.get("/users/1/nothing-here", headers=headers).status_code == 404
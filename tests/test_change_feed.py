@@ -0,0 +1,172 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import change_feed
+from app.utils.change_feed import Change, ChangeFeed, Subscriber, sse_stream
+from app.utils.db import (
+    create_key_result_db,
+    create_objective_db,
+    create_user_db,
+    get_conn,
+    update_owned_progress_db,
+)
+from tests.conftest import make_jwt
+
+PERIOD = date.today() + timedelta(days=30)
+
+
+@pytest.fixture
+def feed():
+    feed = ChangeFeed(buffer_size=10)
+    feed.start()
+    yield feed
+    feed.close()
+
+
+async def next_change(sub: Subscriber) -> tuple[Change, str]:
+    while not sub.pending:
+        await asyncio.wait_for(sub.wakeup.wait(), 5)
+        sub.wakeup.clear()
+    return sub.pending.popleft()
+
+
+def test_inserts_reach_matching_subscribers(feed):
+    user = create_user_db("Watched")
+    other = create_user_db("Unwatched")
+
+    async def scenario():
+        by_user, _ = feed.subscribe(user["id"], None)
+        obj = await asyncio.to_thread(create_objective_db, user["id"], "Live", PERIOD)
+        change, _ = await next_change(by_user)
+        assert change.type == "objective.created" and change.data["id"] == obj["id"]
+
+        by_objective, _ = feed.subscribe(None, obj["id"])
+        await asyncio.to_thread(create_objective_db, other["id"], "Noise", PERIOD)
+        kr = await asyncio.to_thread(create_key_result_db, obj["id"], "KR", "%", 0.5)
+        change, _ = await next_change(by_user)
+        assert change.type == "key_result.created" and change.data["id"] == kr["id"]
+        assert change.data["user_id"] == user["id"]
+
+        change, _ = await next_change(by_objective)
+        assert change.data["id"] == kr["id"]
+        assert not by_objective.pending
+
+    asyncio.run(scenario())
+
+
+def test_long_columns_do_not_overflow_the_notify_payload(feed):
+    user = create_user_db("Verbose")
+
+    async def scenario():
+        sub, _ = feed.subscribe(user["id"], None)
+        obj = await asyncio.to_thread(create_objective_db, user["id"], "L", PERIOD)
+        change, _ = await next_change(sub)
+        assert change.type == "objective.created"
+        kr = await asyncio.to_thread(
+            create_key_result_db, obj["id"], "KR", "m" * 7900, 0.5
+        )
+        change, _ = await next_change(sub)
+        assert change.data == {
+            "id": kr["id"],
+            "user_id": user["id"],
+            "objective_id": obj["id"],
+        }
+        await asyncio.to_thread(update_owned_progress_db, kr["id"], user["id"], 0.7)
+        change, _ = await next_change(sub)
+        assert change.type == "key_result.progress"
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_replays_from_last_event_id(feed):
+    user = create_user_db("Resumer")
+
+    async def scenario():
+        # stays subscribed so the test knows when the listener has heard
+        watch, _ = feed.subscribe(user["id"], None, limit=100)
+        sub, _ = feed.subscribe(user["id"], None)
+        await asyncio.to_thread(create_objective_db, user["id"], "One", PERIOD)
+        _, last_id = await next_change(sub)
+        feed.unsubscribe(sub)
+        await next_change(watch)
+
+        second = await asyncio.to_thread(create_objective_db, user["id"], "Two", PERIOD)
+        await next_change(watch)
+        _, replay = feed.subscribe(user["id"], None, last_id)
+        assert [c.data["id"] for c, _ in replay] == [second["id"]]
+
+        # more than the buffer holds since the token: the client must refetch
+        for i in range(12):
+            await asyncio.to_thread(create_objective_db, user["id"], f"n{i}", PERIOD)
+            await next_change(watch)
+        _, replay = feed.subscribe(user["id"], None, last_id)
+        assert [c.type for c, _ in replay] == ["reset"]
+
+    asyncio.run(scenario())
+
+
+def test_resume_point_waits_for_writes_committed_out_of_order(feed, monkeypatch):
+    user = create_user_db("Overtaken")
+
+    def insert(conn, title):
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO objectives (user_id, title, period)"
+                " VALUES (%s, %s, %s) RETURNING id",
+                (user["id"], title, PERIOD),
+            )
+            return cur.fetchone()["id"]
+
+    async def scenario():
+        sub, _ = feed.subscribe(user["id"], None)
+        with get_conn(transaction=True) as slow:
+            # draws its seq first, commits last
+            first = await asyncio.to_thread(insert, slow, "First")
+            second = await asyncio.to_thread(
+                create_objective_db, user["id"], "2", PERIOD
+            )
+            change, token = await next_change(sub)
+            assert change.data["id"] == second["id"]
+            await asyncio.to_thread(slow.commit)
+        change, _ = await next_change(sub)
+        assert change.data["id"] == first
+
+        # a client that left after the second event still gets the first
+        _, replay = feed.subscribe(user["id"], None, token)
+        assert first in [c.data["id"] for c, _ in replay]
+
+        # a seq whose write rolled back is given up on after the grace
+        monkeypatch.setattr(change_feed, "FEED_SETTLE_SECONDS", 0.0)
+        with get_conn(transaction=True) as aborted:
+            await asyncio.to_thread(insert, aborted, "Never")
+            aborted.rollback()
+        third = await asyncio.to_thread(create_objective_db, user["id"], "3", PERIOD)
+        change, token = await next_change(sub)
+        assert change.data["id"] == third["id"]
+        _, replay = feed.subscribe(user["id"], None, token)
+        assert replay == []
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_dropped_and_stream_ends():
+    async def scenario():
+        feed = ChangeFeed()
+        sub = Subscriber(1, None, [0], asyncio.get_running_loop(), limit=1)
+        for seq in (1, 2):
+            sub.push(Change(0, seq, "objective.created", {"user_id": 1}))
+        assert sub.dropped and not sub.pending
+        return [chunk async for chunk in sse_stream(feed, sub, [])]
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_changes_endpoint_requires_auth_and_a_filter():
+    client = TestClient(app)
+    assert client.get("/changes", params={"user_id": 1}).status_code == 401
+    headers = {"Authorization": f"Bearer {make_jwt(sub='1')}"}
+    assert client.get("/changes", headers=headers).status_code == 422
@@ -0,0 +1,69 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.main import problem
+from app.middleware.compression import CompressionMiddleware, choose_encoding
+
+BIG = [{"id": i, "title": f"objective {i}"} for i in range(500)]
+
+demo = FastAPI()
+demo.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+
+@demo.get("/big")
+def big():
+    return BIG
+
+
+@demo.get("/small")
+def small():
+    return {"status": "ok"}
+
+
+@demo.get("/error")
+def error():
+    return problem(404, "Not Found", "x" * 4096)
+
+
+@demo.get("/stream")
+def stream():
+    return StreamingResponse(
+        (b'{"n": %d}\n' % i for i in range(2000)), media_type="application/x-ndjson"
+    )
+
+
+client = TestClient(demo)
+
+
+def test_negotiates_brotli_then_gzip():
+    r = client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+    assert r.headers["content-encoding"] == "br"
+    assert r.json() == BIG
+
+    r = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json() == BIG
+    assert "accept-encoding" in r.headers["vary"].lower()
+
+
+def test_small_and_error_bodies_are_not_compressed():
+    r = client.get("/small", headers={"Accept-Encoding": "br, gzip"})
+    assert "content-encoding" not in r.headers
+
+    r = client.get("/error", headers={"Accept-Encoding": "br, gzip"})
+    assert r.status_code == 404
+    assert "content-encoding" not in r.headers
+
+
+def test_streaming_response_is_compressed():
+    r = client.get("/stream", headers={"Accept-Encoding": "br"})
+    assert r.headers["content-encoding"] == "br"
+    assert len(r.text.splitlines()) == 2000
+
+
+def test_choose_encoding_respects_q_values():
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "br"
+    assert choose_encoding("br;q=0, *;q=0.1") == "gzip"
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+from app.utils.db import (
+    KeyResultRow,
+    ObjectiveRow,
+    create_key_result_db,
+    create_objective_db,
+    create_user_db,
+    get_conn,
+    get_user_db,
+    list_key_results_for_objective_db,
+    list_objectives_for_user_db,
+    list_objectives_with_version_db,
+)
+from app.utils.responses import dumps
+
+
+def test_statements_prepared_once_per_connection():
+    user = create_user_db("Prepared")
+    assert get_user_db(user["id"])["name"] == "Prepared"
+
+    with get_conn() as conn:
+        assert {"okr_create_user", "okr_get_user"} <= conn.prepared
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT count(*) AS n FROM pg_prepared_statements WHERE name = %s",
+                ("okr_get_user",),
+            )
+            assert cur.fetchone()["n"] == 1
+
+
+def test_reprepared_after_server_side_discard():
+    user = create_user_db("Discarded")
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DEALLOCATE ALL")
+
+    assert get_user_db(user["id"])["name"] == "Discarded"
+
+
+def test_list_helpers_return_records_that_encode_like_dict_rows():
+    user = create_user_db("Compact")
+    period = date.today() + timedelta(days=30)
+    obj = create_objective_db(user["id"], "Grow", period)
+    kr = create_key_result_db(obj["id"], "KR", "%", 0.25)
+
+    objectives = list_objectives_for_user_db(user["id"])
+    assert objectives == [ObjectiveRow(obj["id"], user["id"], "Grow", period)]
+    assert objectives[0]["title"] == "Grow"
+    assert dumps(objectives) == dumps([obj])
+    assert list_objectives_with_version_db(user["id"])[0] == objectives
+
+    key_results = list_key_results_for_objective_db(obj["id"])
+    assert isinstance(key_results[0], KeyResultRow)
+    expected = {k: kr[k] for k in ("id", "objective_id", "title", "metric")}
+    assert dumps(key_results) == dumps([{**expected, "progress": kr["progress"]}])
@@ -169,3 +169,57 @@ def test_create_key_result_error_validation_period_past():
     )
     body = assert_problem(r, 422)
     assert "validation" in body["type"] or body["type"].endswith("/validation-error")
+
+
+def test_get_objectives_batch_validation():
+    assert_problem(client.get("/objectives", params={"ids": "1,abc"}), 422)
+    assert_problem(client.get("/objectives", params={"ids": ","}), 422)
+    too_many = ",".join(str(i) for i in range(1, 202))
+    assert_problem(client.get("/objectives", params={"ids": too_many}), 422)
+    huge = "1" + ",1" * 5000
+    assert_problem(client.get("/objectives", params={"ids": huge}), 422)
+    for out_of_range in ("99999999999999999999", str(-(2**63) - 1)):
+        r = client.get("/objectives", params={"ids": f"1,{out_of_range}"})
+        assert_problem(r, 422)
+
+
+def test_out_of_range_ids_are_rejected():
+    headers = {"Authorization": f"Bearer {make_jwt(sub='1')}"}
+    for big in ("99999999999999999999", str(-(2**63) - 1)):
+        for method, url, params in (
+            ("GET", f"/users/{big}", {}),
+            ("GET", f"/users/{big}/objectives", {}),
+            ("GET", f"/users/{big}/objectives/export", {}),
+            ("GET", f"/objectives/{big}", {}),
+            ("GET", f"/objectives/{big}/progress", {}),
+            ("GET", f"/key-results/{big}/progress", {}),
+            ("POST", f"/key-results/{big}/progress", {"progress": 0.5}),
+            (
+                "POST",
+                "/key-results",
+                {"objective_id": big, "title": "t", "metric": "%"},
+            ),
+        ):
+            r = client.request(
+                method, url, params=params, headers={**headers, "If-None-Match": '"1"'}
+            )
+            assert r.status_code == 422, (method, url, r.text)
+
+
+def test_export_validation_and_unknown_user():
+    user = client.post("/users", params={"name": "Exporter"}).json()
+    r = client.get(f"/users/{user['id']}/objectives/export", params={"format": "xml"})
+    assert_problem(r, 422)
+    assert_problem(client.get("/users/999999/objectives/export"), 404)
+
+
+def test_search_requires_auth_and_valid_params():
+    assert client.get("/search", params={"q": "x"}).status_code == 401
+    headers = {"Authorization": f"Bearer {make_jwt(sub='1')}"}
+    assert_problem(client.get("/search", params={"q": " "}, headers=headers), 422)
+    r = client.get("/search", params={"q": "x", "limit": 51}, headers=headers)
+    assert_problem(r, 422)
+    r = client.get("/search", params={"q": "x", "offset": 1001}, headers=headers)
+    assert_problem(r, 422)
+    r = client.get("/search", params={"q": "x", "offset": 1000}, headers=headers)
+    assert r.status_code == 200
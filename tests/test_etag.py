@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.etag import etag_matches, versions
+from tests.conftest import make_jwt
+
+client = TestClient(app)
+
+
+def _user_with_objective():
+    user = client.post("/users", params={"name": "Poller"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    obj = client.post(
+        "/objectives",
+        params={"title": "Polled", "period": date.today() + timedelta(days=30)},
+        headers=headers,
+    ).json()
+    return user, obj, headers
+
+
+def test_objective_conditional_get():
+    _, obj, _ = _user_with_objective()
+
+    r = client.get(f"/objectives/{obj['id']}")
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+
+    r = client.get(f"/objectives/{obj['id']}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+
+    versions.clear()
+    r = client.get(f"/objectives/{obj['id']}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+
+def test_user_objectives_etag_changes_after_write():
+    user, _, headers = _user_with_objective()
+    url = f"/users/{user['id']}/objectives"
+
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.post(
+        "/objectives",
+        params={"title": "Another", "period": date.today() + timedelta(days=60)},
+        headers=headers,
+    )
+    r = client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert len(r.json()) == 2
+    assert r.headers["etag"] != etag
+
+
+def test_each_content_coding_has_its_own_etag():
+    user, _, headers = _user_with_objective()
+    for i in range(30):
+        client.post(
+            "/objectives",
+            params={"title": f"Bulk {i:02d}", "period": date.today()},
+            headers=headers,
+        )
+    url = f"/users/{user['id']}/objectives"
+
+    tags = {
+        coding: client.get(url, headers={"Accept-Encoding": coding}).headers["etag"]
+        for coding in ("identity", "gzip", "br")
+    }
+    assert len(set(tags.values())) == 3
+    assert tags["br"] == tags["identity"][:-1] + '-br"'
+
+    r = client.get(url, headers={"If-None-Match": tags["br"], "Accept-Encoding": "br"})
+    assert r.status_code == 304
+    assert r.headers["etag"] == tags["br"]
+
+
+def test_conditional_get_unknown_objective_is_not_found():
+    r = client.get("/objectives/999999", headers={"If-None-Match": '"stale"'})
+    assert r.status_code == 404
+
+
+def test_etag_matches_weak_and_lists():
+    assert etag_matches('W/"a", "b"', '"b"')
+    assert etag_matches("*", '"x"')
+    assert not etag_matches('"a"', '"b"')
@@ -0,0 +1,80 @@
+from datetime import date
+
+import pytest
+
+from app.utils import db
+from tests.conftest import schema_dsn
+from tools.generate_data import Options, generate
+
+SCHEMAS = ("generated_a", "generated_b")
+OPTS = Options(
+    seed=7,
+    skew=1.2,
+    max_objectives=50,
+    max_key_results=3,
+    first_period=date.today(),
+    last_period=date(date.today().year + 1, 12, 31),
+)
+
+
+@pytest.fixture
+def scratch_shards(monkeypatch):
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            for schema in SCHEMAS:
+                cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                cur.execute(f"CREATE SCHEMA {schema}")
+    shards = [db.Shard(schema_dsn(schema)) for schema in SCHEMAS]
+    for shard in shards:
+        monkeypatch.setattr(db, "shards", [shard])
+        db.init_db()
+    yield shards
+    for shard in shards:
+        shard.close()
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            for schema in SCHEMAS:
+                cur.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def dump(shard: db.Shard) -> list[tuple]:
+    with db.get_conn(shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT u.id AS user_id, u.name, o.id, o.title, o.period,
+                       k.title AS kr_title, k.period AS kr_period, k.progress
+                FROM users u
+                JOIN objectives o ON o.user_id = u.id
+                JOIN key_results k ON k.objective_id = o.id AND k.period = o.period
+                ORDER BY k.id
+                """
+            )
+            return [tuple(row.values()) for row in cur.fetchall()]
+
+
+def test_generated_rows_are_valid_skewed_and_reproducible(monkeypatch, scratch_shards):
+    dumps = []
+    for shard in scratch_shards:
+        monkeypatch.setattr(db, "shards", [shard])
+        users, objectives, key_results = generate(300, OPTS, chunk_size=100)
+        assert users == 300 and objectives > users
+        dumps.append(dump(shard))
+
+    assert dumps[0] == dumps[1]
+    rows = dumps[0]
+    assert len(rows) == key_results
+    assert all(OPTS.first_period <= row[4] <= OPTS.last_period for row in rows)
+    assert all(row[4] == row[6] and 0 <= row[7] <= 1 for row in rows)
+
+    per_user: dict[int, set[int]] = {}
+    for row in rows:
+        per_user.setdefault(row[0], set()).add(row[2])
+    sizes = sorted(len(ids) for ids in per_user.values())
+    # a long tail: the busiest user has many times the median
+    assert sizes[-1] >= 5 * sizes[len(sizes) // 2]
+    # the load left the app's triggers in place
+    user = db.create_user_db("After load")
+    obj = db.create_objective_db(user["id"], "Live", OPTS.first_period)
+    kr = db.create_key_result_db(obj["id"], "KR", "%", 0.5)
+    assert db.key_result_series_db(kr["id"], "day", date(2000, 1, 1), date(2100, 1, 1))
@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import psycopg2
+import pytest
+
+from app.utils import db
+from app.utils.group_commit import GroupCommitWriter, key_result_writer
+
+
+def test_concurrent_submits_are_flushed_together():
+    batches = []
+
+    def flush_batch(items):
+        batches.append(len(items))
+        return [a + b for a, b in items]
+
+    writer = GroupCommitWriter(flush_batch, None, window=0.2, max_batch=8)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: writer.submit(i, 100), range(8)))
+    writer.close()
+
+    assert results == [i + 100 for i in range(8)]
+    assert sum(batches) == 8
+    assert len(batches) < 8
+
+
+def test_failed_batch_is_retried_item_by_item():
+    def flush_batch(items):
+        raise RuntimeError("batch failed")
+
+    def flush_one(value):
+        if value < 0:
+            raise ValueError("bad item")
+        return value
+
+    writer = GroupCommitWriter(flush_batch, flush_one, window=0.05, max_batch=4)
+    barrier = threading.Barrier(2)
+
+    def submit(value):
+        barrier.wait()
+        return writer.submit(value)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        ok = pool.submit(submit, 1)
+        bad = pool.submit(submit, -1)
+        assert ok.result() == 1
+        with pytest.raises(ValueError):
+            bad.result()
+    writer.close()
+
+
+def test_only_uncommitted_items_are_retried():
+    retried = []
+
+    def flush_batch(items):
+        # the second item's shard failed, the others committed
+        return [a if a != 2 else RuntimeError("shard down") for (a,) in items]
+
+    def flush_one(value):
+        retried.append(value)
+        return value
+
+    writer = GroupCommitWriter(flush_batch, flush_one, window=0.2, max_batch=3)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(writer.submit, (1, 2, 3)))
+    writer.close()
+
+    assert results == [1, 2, 3]
+    assert retried == [2]
+
+
+def test_submit_racing_close_is_still_flushed():
+    writer = GroupCommitWriter(
+        lambda items: [a for (a,) in items], None, window=0.001, max_batch=4
+    )
+    writer.submit(0)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for round_ in range(50):
+            futures = [pool.submit(writer.submit, round_) for _ in range(3)]
+            writer.close()
+            assert [f.result(timeout=2) for f in futures] == [round_] * 3
+    writer.close()
+
+
+def test_submit_gives_up_on_a_stuck_writer():
+    release = threading.Event()
+
+    def flush_batch(items):
+        release.wait()
+        return [None for _ in items]
+
+    writer = GroupCommitWriter(
+        flush_batch, None, window=0.001, max_batch=4, timeout=0.1
+    )
+    with pytest.raises(TimeoutError):
+        writer.submit(1)
+    release.set()
+    writer.close()
+
+
+def test_key_result_batch_keeps_per_item_outcomes():
+    owner = db.create_user_db("Batch owner")
+    other = db.create_user_db("Batch other")
+    obj = db.create_objective_db(
+        owner["id"], "Batch", date.today() + timedelta(days=30)
+    )
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(id) + 1 AS id FROM objectives")
+            missing = cur.fetchone()["id"]
+
+    items = [
+        (obj["id"], owner["id"], "kr 1", "%", 0.1),
+        (obj["id"], other["id"], "kr 2", "%", 0.2),
+        (missing, owner["id"], "kr 3", "%", 0.3),
+        (obj["id"], owner["id"], "kr 4", "%", 0.4),
+    ]
+    results = db.create_owned_key_results_batch_db(items)
+    assert key_result_writer.submit(*items[0])[1]["title"] == "kr 1"
+    key_result_writer.close()
+
+    (owner1, kr1), (owner2, kr2), (owner3, kr3), (owner4, kr4) = results
+    assert owner1 == owner["id"] and kr1["title"] == "kr 1"
+    assert owner2 == owner["id"] and kr2 is None
+    assert owner3 is None and kr3 is None
+    assert kr4["title"] == "kr 4" and kr4["objective_id"] == obj["id"]
+
+    # a failing statement leaves its items to the caller, uncommitted
+    [failed] = db.create_owned_key_results_batch_db(
+        [(obj["id"], owner["id"], "kr 5", "%", 10**4)]
+    )
+    assert isinstance(failed, psycopg2.errors.NumericValueOutOfRange)
+    assert [kr.title for kr in db.list_key_results_for_objective_db(obj["id"])] == [
+        "kr 1",
+        "kr 4",
+        "kr 1",
+    ]
@@ -1,6 +1,11 @@
+import logging
+
+import pytest
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.utils import secrets
+from app.utils.readiness import ReadinessProbe, check_secrets
 
 client = TestClient(app)
 
@@ -9,3 +14,46 @@ def test_health_ok():
     r = client.get("/health")
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
+
+
+def test_liveness_is_not_audited(caplog):
+    with caplog.at_level(logging.INFO, logger="audit"):
+        assert client.get("/livez").json() == {"status": "ok"}
+        assert client.get("/health").status_code == 200
+    assert not [r for r in caplog.records if r.name == "audit"]
+
+
+def test_readiness_reports_each_check():
+    r = client.get("/readyz")
+    assert r.status_code == 200, r.text
+    assert r.json() == {
+        "status": "ready",
+        "checks": {"database": "ok", "secrets": "ok", "upstream": "ok"},
+    }
+
+
+def test_readiness_is_cached_between_refreshes():
+    calls = []
+
+    def database():
+        calls.append(1)
+        raise RuntimeError("down")
+
+    probe = ReadinessProbe({"database": database}, interval=60, ttl=60)
+    probe.start()
+    try:
+        for _ in range(5):
+            state = probe.current()
+            assert not state.ready and state.checks == {"database": "failed"}
+        assert len(calls) == 1
+    finally:
+        probe.close()
+    assert not ReadinessProbe({}, ttl=60).current().ready
+
+
+def test_secrets_check_reports_presence(monkeypatch):
+    # the secret is never reloaded, so its age must not make a pod unready
+    check_secrets()
+    monkeypatch.setattr(secrets, "_secret_loaded", False)
+    with pytest.raises(RuntimeError, match="not loaded"):
+        check_secrets()
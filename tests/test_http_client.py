@@ -2,6 +2,7 @@ import httpx
 import pytest
 
 from app.utils.http_client import (
+    HttpClientCircuitOpen,
     HttpClientError,
     HttpClientTimeout,
     SafeHttpClient,
@@ -109,3 +110,35 @@ def test_http_client_stores_limits():
     assert client._limits.max_connections == 10
     assert client._limits.max_keepalive_connections == 5
     client.close()
+
+
+def test_breaker_opens_after_repeated_failures_and_fails_fast():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        return httpx.Response(503, json={"error": "down"})
+
+    client = SafeHttpClient(
+        SafeHttpClientConfig(retries=0, breaker_threshold=2, breaker_reset=60),
+        transport=httpx.MockTransport(handler),
+    )
+    for _ in range(2):
+        with pytest.raises(HttpClientError):
+            client.get_json("http://upstream.local/api")
+    assert client.breaker.state == "open"
+
+    with pytest.raises(HttpClientCircuitOpen):
+        client.get_json("http://upstream.local/api")
+    assert calls["n"] == 2
+
+
+def test_breaker_closes_after_a_successful_trial():
+    client = SafeHttpClient(
+        SafeHttpClientConfig(retries=0, breaker_threshold=1, breaker_reset=0),
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})),
+    )
+    client.breaker.record_failure()
+    assert client.breaker.state == "half_open"
+    assert client.get_json("http://upstream.local/api") == {}
+    assert client.breaker.state == "closed"
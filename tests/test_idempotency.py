@@ -0,0 +1,106 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+import app.utils.idempotency as idempotency
+from app.main import app
+from tests.conftest import make_jwt
+
+client = TestClient(app)
+PERIOD = (date.today() + timedelta(days=30)).isoformat()
+
+
+def auth_headers(key: str | None = None) -> dict[str, str]:
+    user = client.post("/users", params={"name": "Retrier"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    return headers
+
+
+def test_retry_replays_the_stored_response():
+    headers = auth_headers("k-1")
+    params = {"title": "Once", "period": PERIOD}
+    first = client.post("/objectives", params=params, headers=headers)
+    again = client.post("/objectives", params=params, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    user_id = first.json()["user_id"]
+    assert len(client.get(f"/users/{user_id}/objectives").json()) == 1
+
+    # keys are per caller
+    other = client.post("/objectives", params=params, headers=auth_headers("k-1"))
+    assert other.json()["id"] != first.json()["id"]
+
+
+def test_key_reuse_with_other_params_and_failed_requests():
+    headers = auth_headers("k-2")
+    r = client.post(
+        "/objectives", params={"title": "", "period": PERIOD}, headers=headers
+    )
+    assert r.status_code == 422
+    # the failure was not stored: the retry runs
+    r = client.post(
+        "/objectives", params={"title": "Ok", "period": PERIOD}, headers=headers
+    )
+    assert r.status_code == 200
+    r = client.post(
+        "/objectives", params={"title": "Other", "period": PERIOD}, headers=headers
+    )
+    assert r.status_code == 422
+    assert r.json()["type"] == "https://example.com/problems/idempotency"
+
+
+def test_result_and_stored_response_commit_together(monkeypatch):
+    headers = auth_headers("k-4")
+    params = {"title": "Atomic", "period": PERIOD}
+
+    def lost(*args):
+        raise ConnectionError("connection lost before the response was stored")
+
+    monkeypatch.setattr(idempotency.db, "store_idempotent_response", lost)
+    with pytest.raises(ConnectionError):
+        client.post("/objectives", params=params, headers=headers)
+    monkeypatch.undo()
+
+    # the objective went with the claim: the retry creates it exactly once
+    r = client.post("/objectives", params=params, headers=headers)
+    assert r.status_code == 200
+    user_id = r.json()["user_id"]
+    objectives = client.get(f"/users/{user_id}/objectives").json()
+    assert [o["title"] for o in objectives] == ["Atomic"]
+
+
+def test_concurrent_duplicate_waits_for_the_original(monkeypatch):
+    calls = []
+    create = main.create_objective_db
+
+    def slow_create(*args):
+        calls.append(args)
+        time.sleep(0.3)
+        return create(*args)
+
+    monkeypatch.setattr(main, "create_objective_db", slow_create)
+    headers = auth_headers("k-3")
+    params = {"title": "Racy", "period": PERIOD}
+    results = []
+
+    def post():
+        results.append(client.post("/objectives", params=params, headers=headers))
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [r.status_code for r in results] == [200, 200]
+    assert results[0].json() == results[1].json()
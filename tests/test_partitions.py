@@ -0,0 +1,203 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.utils import db
+from tests.conftest import schema_dsn
+from tools import maintain_partitions
+from tools.maintain_partitions import ARCHIVE_SCHEMA, archive_quarter, closed_quarters
+
+SCHEMA = "partitions_scratch"
+
+# the schema as it was before sharding and partitioning
+LEGACY_SQL = """
+CREATE TABLE users (id SERIAL PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE objectives (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    period DATE NOT NULL
+);
+CREATE TABLE key_results (
+    id SERIAL PRIMARY KEY,
+    objective_id INTEGER NOT NULL REFERENCES objectives(id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    progress NUMERIC(5,2) NOT NULL DEFAULT 0
+);
+INSERT INTO users (name) VALUES ('Legacy');
+INSERT INTO objectives (user_id, title, period)
+VALUES (1, 'Old', '2019-05-01'), (1, 'Current', '2025-12-01');
+INSERT INTO key_results (objective_id, title, metric) VALUES (1, 'KR', '%');
+"""
+
+
+@pytest.fixture
+def scratch(monkeypatch):
+    def reset():
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                for schema in (SCHEMA, ARCHIVE_SCHEMA):
+                    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+    reset()
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    shard = db.Shard(schema_dsn(SCHEMA))
+    monkeypatch.setattr(db, "shards", [shard])
+    yield shard
+    shard.close()
+    reset()
+
+
+def partition_of(shard: db.Shard, table: str, row_id: int) -> str:
+    with db.get_conn(shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT tableoid::regclass::text AS part FROM {table} WHERE id = %s",
+                (row_id,),
+            )
+            return cur.fetchone()["part"]
+
+
+def test_rows_land_in_their_quarter(scratch):
+    db.init_db()
+    user = db.create_user_db("Quarterly")
+    period = date.today() + timedelta(days=30)
+    obj = db.create_objective_db(user["id"], "Grow", period)
+    kr = db.create_key_result_db(obj["id"], "KR", "%", 0.5)
+    name = f"p{period.year}q{(period.month - 1) // 3 + 1}"
+    assert partition_of(scratch, "objectives", obj["id"]) == f"objectives_{name}"
+    assert partition_of(scratch, "key_results", kr["id"]) == f"key_results_{name}"
+    assert db.create_key_result_db(obj["id"] + 10**6, "KR", "%", 0.5) is None
+
+    far = db.create_objective_db(user["id"], "Someday", date(2999, 1, 1))
+    assert partition_of(scratch, "objectives", far["id"]) == "objectives_default"
+
+
+def test_ensure_splits_rows_out_of_the_default_partitions(scratch):
+    db.init_db()
+    user = db.create_user_db("Far-sighted")
+    far = db.create_objective_db(user["id"], "Someday", date(2999, 1, 1))
+    kr = db.create_key_result_db(far["id"], "KR", "%", 0.5)
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO key_result_progress"
+                " (key_result_id, objective_id, progress, recorded_at)"
+                " VALUES (%s, %s, 0.1, '2001-02-03 04:05+00')",
+                (kr["id"], far["id"]),
+            )
+    assert partition_of(scratch, "key_results", kr["id"]) == "key_results_default"
+
+    maintain_partitions.ensure(scratch)
+
+    assert partition_of(scratch, "objectives", far["id"]) == "objectives_p2999q1"
+    assert partition_of(scratch, "key_results", kr["id"]) == "key_results_p2999q1"
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT tableoid::regclass::text AS part FROM key_result_progress"
+                " WHERE key_result_id = %s ORDER BY recorded_at",
+                (kr["id"],),
+            )
+            parts = [row["part"] for row in cur.fetchall()]
+    # moved, not written again
+    assert parts[0] == "key_result_progress_p200102" and len(parts) == 2
+    # the key results still cascade with their objective
+    db.create_objective_db(user["id"], "Later", date(2999, 2, 1))
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM objectives WHERE id = %s", (far["id"],))
+    assert db.list_key_results_for_objective_db(far["id"]) == []
+    maintain_partitions.ensure(scratch)
+
+
+def test_serial_user_ids_are_widened(scratch):
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE users (id SERIAL PRIMARY KEY, name TEXT NOT NULL)"
+            )
+    db.init_db()
+    db.init_db()
+
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT format_type(atttypid, NULL) AS t FROM pg_attribute "
+                "WHERE attrelid = 'users'::regclass AND attname = 'id' "
+                "UNION ALL SELECT format_type(seqtypid, NULL) FROM pg_sequence "
+                "WHERE seqrelid = pg_get_serial_sequence('users', 'id')::regclass"
+            )
+            assert [row["t"] for row in cur.fetchall()] == ["bigint", "bigint"]
+            cur.execute(
+                "SELECT setval(pg_get_serial_sequence('users', 'id'), 2147483648)"
+            )
+    assert db.create_user_db("Past int4")["id"] > 2**31
+
+
+def test_search_columns_are_added_offline(scratch):
+    db.init_db()
+    user = db.create_user_db("Unindexed")
+    db.create_objective_db(user["id"], "Findable", date.today())
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            for table in ("objectives", "key_results"):
+                cur.execute(f"ALTER TABLE {table} DROP COLUMN search")
+    with pytest.raises(RuntimeError, match="maintain_partitions migrate"):
+        db.init_db()
+
+    assert maintain_partitions.migrate(scratch)
+    assert not maintain_partitions.migrate(scratch)
+    db.init_db()
+    assert [row["title"] for row in db.search_db(user["id"], "findable", 5, 0)] == [
+        "Findable"
+    ]
+
+
+def test_legacy_tables_are_migrated_in_place(scratch):
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(LEGACY_SQL)
+    with pytest.raises(RuntimeError, match="maintain_partitions migrate"):
+        db.init_db()
+
+    assert maintain_partitions.migrate(scratch)
+    assert not maintain_partitions.migrate(scratch)
+    db.init_db()
+
+    assert partition_of(scratch, "objectives", 1) == "objectives_p2019q2"
+    assert partition_of(scratch, "key_results", 1) == "key_results_p2019q2"
+    assert [kr["title"] for kr in db.list_key_results_for_objective_db(1)] == ["KR"]
+    # sequences continue where the legacy tables left off
+    again = db.create_objective_db(1, "New", date(2025, 12, 1))
+    assert again["id"] == 3
+
+
+def test_archiving_detaches_a_closed_quarter(scratch):
+    db.init_db()
+    quarter = date(2001, 1, 1)
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            db.ensure_period_partitions(cur, [quarter])
+    user = db.create_user_db("Archivist")
+    old = db.create_objective_db(user["id"], "Old", date(2001, 2, 1))
+    db.create_key_result_db(old["id"], "KR", "%", 0.2)
+    live = db.create_objective_db(user["id"], "Live", date.today())
+    assert closed_quarters(scratch, db.quarter_start(date.today())) == [quarter]
+
+    archive_quarter(scratch, quarter)
+
+    assert db.get_objective_db(old["id"]) is None
+    assert [o["id"] for o in db.list_objectives_for_user_db(user["id"])] == [live["id"]]
+    assert closed_quarters(scratch, db.quarter_start(date.today())) == []
+    with db.get_conn(shard=scratch) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id FROM {ARCHIVE_SCHEMA}.objectives_p2001q1")
+            assert [row["id"] for row in cur.fetchall()] == [old["id"]]
+            cur.execute(
+                f"SELECT count(*) AS n FROM {ARCHIVE_SCHEMA}.key_results_p2001q1"
+            )
+            assert cur.fetchone()["n"] == 1
@@ -0,0 +1,133 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.db import get_conn
+from app.utils.progress import objective_points
+from tests.conftest import make_jwt
+
+client = TestClient(app)
+
+
+def db_today() -> date:
+    # rollup buckets follow the database clock (UTC days)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT (now() AT TIME ZONE 'UTC')::date AS today")
+            return cur.fetchone()["today"]
+
+
+@pytest.fixture
+def owned_key_result():
+    user = client.post("/users", params={"name": "Tracker"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    obj = client.post(
+        "/objectives",
+        params={"title": "Burn-up", "period": date.today() + timedelta(days=30)},
+        headers=headers,
+    ).json()
+    kr = client.post(
+        "/key-results",
+        params={
+            "objective_id": obj["id"],
+            "title": "KR",
+            "metric": "%",
+            "progress": 0.1,
+        },
+        headers=headers,
+    ).json()
+    return obj, kr, headers
+
+
+def test_progress_updates_roll_up_per_day_and_week(owned_key_result):
+    obj, kr, headers = owned_key_result
+    for value in (0.4, 0.6):
+        r = client.post(
+            f"/key-results/{kr['id']}/progress",
+            params={"progress": value},
+            headers=headers,
+        )
+        assert r.status_code == 200, r.text
+        assert r.json()["progress"] == value
+
+    today = db_today()
+    window = {"since": today.isoformat(), "until": today.isoformat()}
+    for grain in ("day", "week"):
+        r = client.get(
+            f"/key-results/{kr['id']}/progress", params={"grain": grain, **window}
+        )
+        assert r.status_code == 200, r.text
+        (point,) = r.json()["points"]
+        assert point["samples"] == 3
+        assert (point["min"], point["max"], point["last"]) == (0.1, 0.6, 0.6)
+
+    client.post(
+        "/key-results",
+        params={
+            "objective_id": obj["id"],
+            "title": "KR 2",
+            "metric": "%",
+            "progress": 0.2,
+        },
+        headers=headers,
+    )
+    r = client.get(f"/objectives/{obj['id']}/progress", params=window)
+    assert r.status_code == 200, r.text
+    assert r.json()["points"] == [
+        {"start": today.isoformat(), "progress": 0.4, "key_results": 2}
+    ]
+
+
+def test_progress_history_is_append_only(owned_key_result):
+    _, kr, _ = owned_key_result
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            with pytest.raises(psycopg2.errors.RaiseException):
+                cur.execute(
+                    "UPDATE key_result_progress SET progress = 1 WHERE key_result_id = %s",
+                    (kr["id"],),
+                )
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            with pytest.raises(psycopg2.errors.RaiseException):
+                cur.execute(
+                    "DELETE FROM key_result_progress WHERE key_result_id = %s",
+                    (kr["id"],),
+                )
+
+
+def test_progress_update_errors(owned_key_result):
+    _, kr, headers = owned_key_result
+    url = f"/key-results/{kr['id']}/progress"
+    assert client.post(url, params={"progress": 2}, headers=headers).status_code == 422
+    other = {"Authorization": f"Bearer {make_jwt(sub='999999')}"}
+    assert client.post(url, params={"progress": 0.5}, headers=other).status_code == 403
+    missing = client.post(
+        "/key-results/999999999/progress", params={"progress": 0.5}, headers=headers
+    )
+    assert missing.status_code == 404
+    assert client.get(url, params={"grain": "hour"}).status_code == 422
+    assert client.get("/key-results/999999999/progress").status_code == 404
+
+
+def test_objective_points_carry_progress_forward():
+    day = date(2026, 1, 5)
+    rows = [
+        {"key_result_id": 1, "bucket_start": day, "progress_last": Decimal("0.2")},
+        {"key_result_id": 2, "bucket_start": day, "progress_last": Decimal("0.4")},
+        {
+            "key_result_id": 1,
+            "bucket_start": day + timedelta(2),
+            "progress_last": Decimal("0.8"),
+        },
+    ]
+    starts = [day + timedelta(n) for n in range(3)]
+    assert [p["progress"] for p in objective_points(rows, starts)] == [
+        Decimal("0.30"),
+        Decimal("0.30"),
+        Decimal("0.60"),
+    ]
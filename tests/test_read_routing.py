@@ -0,0 +1,87 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import db
+from app.utils.metrics import metrics
+
+
+def routed(target: str, reason: str) -> float:
+    return metrics.value("db_read_routing_total", target=target, reason=reason)
+
+
+def fixed_lag(seconds: float) -> db.ReplicaLag:
+    lag = db.ReplicaLag(ttl=60)
+    lag._value = seconds
+    lag._checked_at = time.monotonic()
+    return lag
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # the primary doubles as a replica: routing is what is under test
+    replica = db.PgPool(db.DB_DSN)
+    monkeypatch.setattr(db.shards[0], "replica", replica)
+    monkeypatch.setattr(db.shards[0], "replica_lag", fixed_lag(0.0))
+    yield replica
+    replica.close()
+
+
+def test_reads_are_routed_to_replica(replica):
+    client = TestClient(app)
+    user = client.post("/users", params={"name": "Reader"}).json()
+    fresh = TestClient(app)
+
+    before = routed("replica", "replica")
+    assert fresh.get(f"/users/{user['id']}").status_code == 200
+    assert routed("replica", "replica") == before + 1
+
+
+def test_client_reads_its_writes_from_primary(replica, monkeypatch):
+    monkeypatch.setattr(db.shards[0], "replica_lag", fixed_lag(0.5))
+    client = TestClient(app)
+    user = client.post("/users", params={"name": "Writer"}).json()
+    assert "okr_rw" in client.cookies
+
+    before = routed("primary", "read_your_writes")
+    assert client.get(f"/users/{user['id']}").status_code == 200
+    assert routed("primary", "read_your_writes") == before + 1
+
+    before = routed("replica", "replica")
+    TestClient(app).get(f"/users/{user['id']}")
+    assert routed("replica", "replica") == before + 1
+
+
+def test_forged_write_cookie_is_ignored(replica, monkeypatch):
+    monkeypatch.setattr(db.shards[0], "replica_lag", fixed_lag(0.5))
+    user = TestClient(app).post("/users", params={"name": "Forger"}).json()
+    for stamp in (f"{time.time() + 10 * db.DB_RYW_WINDOW:.3f}", "inf", "nan"):
+        client = TestClient(app, cookies={"okr_rw": stamp})
+        before = routed("replica", "replica")
+        assert client.get(f"/users/{user['id']}").status_code == 200
+        assert routed("replica", "replica") == before + 1, stamp
+
+
+def test_lagging_or_failing_replica_falls_back_to_primary(replica, monkeypatch):
+    monkeypatch.setattr(
+        db.shards[0], "replica_lag", fixed_lag(db.DB_REPLICA_MAX_LAG + 1)
+    )
+    before = routed("primary", "replica_lag")
+    db.get_user_db(1)
+    assert routed("primary", "replica_lag") == before + 1
+
+    monkeypatch.setattr(db.shards[0], "replica_lag", fixed_lag(0.0))
+    monkeypatch.setattr(
+        db.shards[0], "replica", db.PgPool("postgresql://x@127.0.0.1:1/none")
+    )
+    before = routed("primary", "replica_error")
+    db.get_user_db(1)
+    assert routed("primary", "replica_error") == before + 1
+
+
+def test_metrics_endpoint_exposes_routing_counters():
+    r = TestClient(app).get("/metrics")
+    assert r.status_code == 200
+    assert "db_read_routing_total" in r.text
@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.utils import db
+from tests.conftest import schema_dsn
+from tools.rebalance_shards import adopt, move_bucket, plan_moves
+
+SHARD_SCHEMAS = ("shard_a", "shard_b")
+
+
+@pytest.fixture
+def two_shards(monkeypatch, tmp_path):
+    # two schemas of the test database stand in for two servers
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            for schema in SHARD_SCHEMAS:
+                cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                cur.execute(f"CREATE SCHEMA {schema}")
+    pair = [db.Shard(schema_dsn(schema)) for schema in SHARD_SCHEMAS]
+    monkeypatch.setattr(db, "shards", pair)
+    monkeypatch.setattr(db, "shard_map", {})
+    monkeypatch.setattr(db, "ID_BUCKETS", db.SHARD_BUCKETS)
+    db.init_db()
+    yield str(tmp_path / "shards.json")
+    for shard in pair:
+        shard.close()
+
+
+def rows_on(shard: db.Shard, table: str) -> set[int]:
+    with db.get_conn(shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id FROM {table}")
+            return {row["id"] for row in cur.fetchall()}
+
+
+def test_user_rows_live_on_the_users_shard(two_shards):
+    period = date.today() + timedelta(days=30)
+    users = [db.create_user_db(f"Sharded {i}") for i in range(40)]
+    placed = {db.shard_index(db.bucket_of(u["id"])) for u in users}
+    assert placed == {0, 1}
+
+    objectives = []
+    for user in users:
+        obj = db.create_objective_db(user["id"], "Grow", period)
+        owner, kr = db.create_owned_key_result_db(obj["id"], user["id"], "KR", "%", 10)
+        assert owner == user["id"] and kr is not None
+        home = db.shard_for(user["id"])
+        assert db.shard_for(obj["id"]) is home and db.shard_for(kr["id"]) is home
+        assert obj["id"] in rows_on(home, "objectives")
+        assert kr["id"] in rows_on(home, "key_results")
+        objectives.append(obj)
+
+    ids = [obj["id"] for obj in objectives]
+    assert len(set(ids)) == len(ids)
+    assert set(db.get_objectives_by_ids_db(ids)) == set(ids)
+    assert db.get_objective_db(ids[0])["user_id"] == users[0]["id"]
+
+
+def test_moved_bucket_keeps_ids_resolvable_and_unique(two_shards):
+    period = date.today() + timedelta(days=30)
+    user = db.create_user_db("Mover")
+    obj = db.create_objective_db(user["id"], "Move me", period)
+    # with progress history, which refuses deletes outside a move
+    db.create_owned_key_result_db(obj["id"], user["id"], "KR", "%", 10)
+    bucket = db.bucket_of(user["id"])
+    source = db.shard_index(bucket)
+    target = 1 - source
+
+    assert move_bucket(bucket, target, two_shards) == 6
+    assert db.shard_index(bucket) == target
+    assert user["id"] not in rows_on(db.shards[source], "users")
+    assert db.load_shard_map(two_shards)[bucket] == target
+
+    assert db.get_objective_db(obj["id"])["title"] == "Move me"
+    again = db.create_objective_db(user["id"], "After move", period)
+    assert again["id"] != obj["id"]
+    assert {o["id"] for o in db.list_objectives_for_user_db(user["id"])} == {
+        obj["id"],
+        again["id"],
+    }
+
+
+def test_adopted_unsharded_rows_stay_resolvable(two_shards):
+    # rows of a database that was unsharded until now: plain sequence ids
+    with db.get_conn(shard=db.shards[0]) as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name) VALUES (1, 'Old'), (2, 'Older')")
+    assert db.get_user_db(1) is None or db.get_user_db(2) is None
+
+    adopt(two_shards)
+
+    assert db.load_shard_map(two_shards) == dict.fromkeys(range(db.ID_BUCKETS), 0)
+    assert db.get_user_db(1)["name"] == "Old"
+    assert db.get_user_db(2)["name"] == "Older"
+    with pytest.raises(FileExistsError):
+        adopt(two_shards)
+
+
+def test_adopted_legacy_objectives_move_with_their_owner(two_shards):
+    period = date.today() + timedelta(days=30)
+    with db.get_conn(shard=db.shards[0]) as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name) VALUES (1, 'Old'), (2, 'Older')")
+            cur.execute(
+                "INSERT INTO objectives (id, user_id, title, period)"
+                " VALUES (1, 2, 'Theirs', %s), (2, 1, 'Mine', %s)",
+                (period, period),
+            )
+            cur.execute(
+                "INSERT INTO key_results (id, objective_id, period, title, metric)"
+                " VALUES (1, 1, %s, 'Their KR', '%%'), (2, 2, %s, 'My KR', '%%')",
+                (period, period),
+            )
+            for table in ("users", "objectives", "key_results"):
+                cur.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), 2)", (table,)
+                )
+
+    renumbered = adopt(two_shards)
+    assert set(renumbered["objectives"]) == {1, 2}
+    assert db.get_objective_db(1) is None or db.get_objective_db(2) is None
+    mine = renumbered["objectives"][2]
+    assert db.bucket_of(mine) == db.bucket_of(1)
+    [kr] = db.list_key_results_for_objective_db(mine)
+    assert kr.title == "My KR" and db.bucket_of(kr.id) == db.bucket_of(1)
+
+    assert move_bucket(db.bucket_of(1), 1, two_shards) > 0
+    assert rows_on(db.shards[1], "objectives") == {mine}
+    assert rows_on(db.shards[1], "key_results") == {kr.id}
+    with db.get_conn(shard=db.shards[1]) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT key_result_id, objective_id FROM key_result_progress")
+            assert cur.fetchall() == [{"key_result_id": kr.id, "objective_id": mine}]
+    assert db.get_objective_db(mine)["title"] == "Mine"
+    assert [p.progress for p in db.list_key_results_for_objective_db(mine)] == [0]
+    # the other owner's rows stay where they were
+    theirs = renumbered["objectives"][1]
+    assert rows_on(db.shards[0], "objectives") == {theirs}
+    assert db.get_objective_db(theirs)["title"] == "Theirs"
+    assert len(db.list_key_results_for_objective_db(theirs)) == 1
+
+
+def test_plan_moves_narrows_the_gap():
+    counts = [{1: 5, 2: 3, 3: 2}, {4: 1}]
+    moves = plan_moves(counts)
+    assert moves == [(1, 1)]
+    assert plan_moves([{1: 1}, {}]) == []
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.utils.profiling import TIME_TO_FIRST_REQUEST_BUDGET, StartupProfile
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def run_python(code: str, **env: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "JWT_SECRET": "startup-test-secret", **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def test_optional_heavy_imports_are_deferred():
+    out = run_python(
+        "import sys, app.main; "
+        "print(','.join(m for m in ('hvac', 'httpx') if m in sys.modules))"
+    )
+    assert out == ""
+
+
+def test_time_to_first_request_within_budget():
+    out = run_python(
+        "import time\n"
+        "from fastapi.testclient import TestClient\n"
+        "t0 = time.perf_counter()\n"
+        "from app.main import app\n"
+        "with TestClient(app) as c:\n"
+        "    assert c.get('/health').status_code == 200\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+    assert float(out.splitlines()[-1]) < TIME_TO_FIRST_REQUEST_BUDGET
+
+
+def test_profile_records_steps_and_imports():
+    profile = StartupProfile()
+    profile.install_import_timer()
+    try:
+        import_name = "colorsys"
+        sys.modules.pop(import_name, None)
+        __import__(import_name)
+        with profile.step("init_db"):
+            pass
+    finally:
+        profile.uninstall_import_timer()
+
+    report = profile.report()
+    assert "colorsys" in report["imports_ms"]
+    assert "init_db" in report["steps_ms"]
+    assert "within_budget" in report
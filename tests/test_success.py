@@ -1,8 +1,13 @@
-from datetime import date
+import csv
+import io
+import json
+from datetime import date, timedelta
 
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.utils.db import iter_objective_tree_db
+from app.utils.export import ndjson_stream
 from tests.conftest import make_jwt
 
 client = TestClient(app)
@@ -73,3 +78,109 @@ def test_create_key_result_success():
     body = r.json()
     assert body["title"] == "some key result"
     assert body["objective_id"] == obj["id"]
+
+
+def test_get_objectives_batch_keeps_order_and_reports_missing():
+    user = client.post("/users", params={"name": "Portfolio"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    period = date.today() + timedelta(days=30)
+    ids = [
+        client.post(
+            "/objectives",
+            params={"title": f"objective {i}", "period": period},
+            headers=headers,
+        ).json()["id"]
+        for i in range(3)
+    ]
+
+    requested = [ids[2], 999999, ids[0], ids[1], ids[0]]
+    r = client.get("/objectives", params={"ids": ",".join(map(str, requested))})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert [o["id"] for o in body["items"]] == [ids[2], ids[0], ids[1]]
+    assert body["missing"] == [999999]
+
+
+def test_list_objectives_of_user_without_objectives_is_empty():
+    user = client.post("/users", params={"name": "Idle"}).json()
+    r = client.get(f"/users/{user['id']}/objectives")
+    assert r.status_code == 200
+    assert r.json() == []
+
+
+def test_export_streams_objective_tree_as_ndjson_and_csv():
+    user = client.post("/users", params={"name": "Exporter"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    period = date.today() + timedelta(days=30)
+    first, second = (
+        client.post(
+            "/objectives",
+            params={"title": title, "period": period},
+            headers=headers,
+        ).json()
+        for title in ("=first", "second")
+    )
+    for title in ("kr a", "kr b"):
+        client.post(
+            "/key-results",
+            params={"objective_id": first["id"], "title": title, "metric": "%"},
+            headers=headers,
+        )
+
+    r = client.get(f"/users/{user['id']}/objectives/export")
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [o["id"] for o in lines] == [first["id"], second["id"]]
+    assert [kr["title"] for kr in lines[0]["key_results"]] == ["kr a", "kr b"]
+    assert lines[1]["key_results"] == []
+
+    r = client.get(f"/users/{user['id']}/objectives/export", params={"format": "csv"})
+    assert r.status_code == 200, r.text
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert rows[0][0] == "objective_id"
+    assert len(rows) == 1 + 3
+    # formula-looking titles are neutralised for spreadsheet apps
+    assert rows[1][1] == "'=first"
+
+    # an objective split across server-side cursor batches comes out whole
+    one_by_one = b"".join(ndjson_stream(iter_objective_tree_db(user["id"], 1)))
+    assert [json.loads(line) for line in one_by_one.splitlines()] == lines
+
+
+def test_search_ranks_and_pages_the_callers_okrs():
+    user = client.post("/users", params={"name": "Seeker"}).json()
+    other = client.post("/users", params={"name": "Stranger"}).json()
+    headers = {"Authorization": f"Bearer {make_jwt(sub=str(user['id']))}"}
+    period = date.today() + timedelta(days=30)
+    obj = client.post(
+        "/objectives",
+        params={"title": "Grow revenue revenue", "period": period},
+        headers=headers,
+    ).json()
+    kr = client.post(
+        "/key-results",
+        params={"objective_id": obj["id"], "title": "Revenue", "metric": "EUR"},
+        headers=headers,
+    ).json()
+    client.post(
+        "/objectives",
+        params={"title": "Revenue elsewhere", "period": period},
+        headers={"Authorization": f"Bearer {make_jwt(sub=str(other['id']))}"},
+    )
+
+    r = client.get("/search", params={"q": "revenue", "limit": 1}, headers=headers)
+    assert r.status_code == 200, r.text
+    page = r.json()
+    assert [(i["type"], i["id"]) for i in page["items"]] == [("objective", obj["id"])]
+    assert page["next_offset"] == 1
+
+    r = client.get(
+        "/search", params={"q": "revenue", "offset": 1}, headers=headers
+    ).json()
+    assert [(i["type"], i["id"]) for i in r["items"]] == [("key_result", kr["id"])]
+    assert r["items"][0]["objective_id"] == obj["id"]
+    assert r["next_offset"] is None
+
+    r = client.get("/search", params={"q": "eur"}, headers=headers).json()
+    assert [i["id"] for i in r["items"]] == [kr["id"]]
@@ -0,0 +1,103 @@
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import tracing
+from app.utils.http_client import SafeHttpClient, SafeHttpClientConfig
+
+client = TestClient(app)
+
+
+class Collector:
+    def __init__(self) -> None:
+        self.rows: list[dict] = []
+
+    def export(self, rows: list[dict]) -> None:
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    collector = Collector()
+    monkeypatch.setattr(tracing, "exporter", collector)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    return collector
+
+
+def test_problem_carries_the_request_correlation_id():
+    cid = str(uuid.uuid4())
+    r = client.get("/objectives/0", headers={"x-correlation-id": cid})
+    assert r.status_code == 404
+    assert r.headers["x-correlation-id"] == cid
+    assert r.json()["correlation_id"] == cid
+
+    r = client.get("/search", params={"q": "x"})
+    assert r.status_code == 401
+    assert r.json()["correlation_id"] == r.headers["x-correlation-id"]
+
+
+def test_request_spans_nest_under_the_root(exported):
+    cid = str(uuid.uuid4())
+    user = client.post("/users", params={"name": "Traced"}).json()
+    exported.rows.clear()
+
+    r = client.get(f"/users/{user['id']}", headers={"x-correlation-id": cid})
+    assert r.status_code == 200
+
+    spans = {row["name"]: row for row in exported.rows}
+    assert {row["trace_id"] for row in exported.rows} == {uuid.UUID(cid).hex}
+    root = spans["GET /users/{user_id}"]
+    assert root["parent_span_id"] is None
+    assert root["attributes"]["status_code"] == 200
+
+    # root > middlewares > handler > db call
+    chain = [
+        "middleware CompressionMiddleware",
+        "middleware AdmissionControlMiddleware",
+        "middleware SlowAPIMiddleware",
+        "middleware ReadYourWritesMiddleware",
+        "handler get_user",
+        "db.get_user_db",
+    ]
+    parent = root
+    for name in chain:
+        assert spans[name]["parent_span_id"] == parent["span_id"], name
+        assert spans[name]["duration_ms"] <= parent["duration_ms"]
+        parent = spans[name]
+    assert spans["db.get_user_db"]["attributes"]["read_target"] == "primary"
+
+
+def test_only_sampled_or_slow_requests_are_exported(exported, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    client.get("/")
+    assert exported.rows == []
+
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 0.0)
+    client.get("/")
+    assert [row["name"] for row in exported.rows][-1] == "GET /"
+
+
+def test_upstream_attempts_are_spans_and_carry_the_trace(exported):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers)
+        return httpx.Response(503 if len(seen) == 1 else 200, json={})
+
+    upstream = SafeHttpClient(
+        SafeHttpClientConfig(base_url="http://upstream.local", retries=1),
+        transport=httpx.MockTransport(handler),
+    )
+    with tracing.request_trace("req-7"):
+        upstream.get_json("/api", headers={"accept": "application/json"})
+
+    attempts = [row for row in exported.rows if row["name"] == "upstream GET"]
+    assert [a["attributes"]["status_code"] for a in attempts] == [503, 200]
+    trace_id = tracing.trace_id_for("req-7")
+    for headers, attempt in zip(seen, attempts):
+        assert headers["x-correlation-id"] == "req-7"
+        assert headers["accept"] == "application/json"
+        assert headers["traceparent"] == f"00-{trace_id}-{attempt['span_id']}-01"
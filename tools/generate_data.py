@@ -0,0 +1,247 @@
+"""Synthetic users, objectives and key results for scale testing.
+
+Rows go straight in through COPY, one transaction per chunk of users and
+shard, with chunks spread over worker processes. The content of every
+chunk follows from --seed alone, so a run is reproducible whatever the
+worker count; on an empty database the ids are too when run with a single
+worker.
+
+Row triggers (change feed, progress history) are disabled for the load, so
+do not point this at a database that is serving traffic.
+
+    python -m tools.generate_data --users 100000 --seed 7 --workers 8
+"""
+
+import argparse
+import io
+import multiprocessing
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from psycopg2 import sql
+
+from app.utils import db
+
+TABLES = ("users", "objectives", "key_results")
+VERBS = ("Grow", "Reduce", "Launch", "Improve", "Ship", "Cut", "Expand", "Retain")
+NOUNS = (
+    "revenue",
+    "churn",
+    "onboarding",
+    "latency",
+    "NPS",
+    "activation",
+    "support backlog",
+    "test coverage",
+    "partner network",
+    "mobile app",
+)
+METRICS = ("%", "EUR", "users", "ms", "points", "tickets")
+FIRST_NAMES = ("Alex", "Maria", "Ivan", "Olga", "Sam", "Nina", "Omar", "Li", "Ada")
+
+
+@dataclass(frozen=True)
+class Options:
+    seed: int
+    skew: float
+    max_objectives: int
+    max_key_results: int
+    first_period: date
+    last_period: date
+
+
+def objective_count(rng: random.Random, opts: Options) -> int:
+    # Pareto: most users have a handful, a few have very long histories;
+    # a smaller --skew means a heavier tail
+    return min(opts.max_objectives, int(rng.paretovariate(opts.skew)))
+
+
+def generate_chunk(
+    index: int, users: int, opts: Options
+) -> list[tuple[int, str, list[tuple[str, date, list[tuple[str, str, float]]]]]]:
+    # (bucket, name, [(title, period, [(title, metric, progress)])]) per user
+    rng = random.Random(f"{opts.seed}:{index}")
+    span = (opts.last_period - opts.first_period).days
+    chunk = []
+    for _ in range(users):
+        objectives = []
+        for _ in range(objective_count(rng, opts)):
+            title = f"{rng.choice(VERBS)} {rng.choice(NOUNS)}"
+            period = opts.first_period + timedelta(days=rng.randint(0, span))
+            key_results = [
+                (
+                    f"{rng.choice(VERBS)} {rng.choice(NOUNS)} by {rng.randint(2, 50)}%",
+                    rng.choice(METRICS),
+                    # most key results are early on, few are done
+                    round(rng.betavariate(1.5, 3), 2),
+                )
+                for _ in range(rng.randint(1, opts.max_key_results))
+            ]
+            objectives.append((title, period, key_results))
+        name = f"{rng.choice(FIRST_NAMES)} {rng.randint(1, 99999)}"
+        chunk.append((rng.randrange(db.ID_BUCKETS), name, objectives))
+    return chunk
+
+
+def _reserve(cur, table: str, count: int) -> list[int]:
+    if not count:
+        return []
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) AS v "
+        "FROM generate_series(1, %s) ORDER BY 1",
+        (table, count),
+    )
+    return [row["v"] for row in cur.fetchall()]
+
+
+def _copy(cur, table: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(str(value) for value in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(
+        sql.SQL("COPY {} ({}) FROM STDIN")
+        .format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        )
+        .as_string(cur),
+        buf,
+    )
+
+
+def load_chunk(args: tuple[int, int, Options]) -> tuple[int, int, int]:
+    index, users, opts = args
+    by_shard: dict[int, list] = {}
+    for user in generate_chunk(index, users, opts):
+        by_shard.setdefault(db.shard_index(user[0]), []).append(user)
+
+    counts = [0, 0, 0]
+    for shard, chunk in sorted(by_shard.items()):
+        with db.get_conn(transaction=True, shard=db.shards[shard]) as conn:
+            with conn.cursor() as cur:
+                objectives = sum(len(u[2]) for u in chunk)
+                key_results = sum(len(o[2]) for u in chunk for o in u[2])
+                user_seq = iter(_reserve(cur, "users", len(chunk)))
+                obj_seq = iter(_reserve(cur, "objectives", objectives))
+                kr_seq = iter(_reserve(cur, "key_results", key_results))
+                user_rows, obj_rows, kr_rows = [], [], []
+                # ids carry their bucket exactly as the app's own inserts do
+                for bucket, name, user_objectives in chunk:
+                    user_id = next(user_seq) * db.ID_BUCKETS + bucket
+                    user_rows.append((user_id, name))
+                    for title, period, krs in user_objectives:
+                        obj_id = next(obj_seq) * db.ID_BUCKETS + bucket
+                        obj_rows.append((obj_id, user_id, title, period))
+                        for kr_title, metric, progress in krs:
+                            kr_id = next(kr_seq) * db.ID_BUCKETS + bucket
+                            kr_rows.append(
+                                (kr_id, obj_id, period, kr_title, metric, progress)
+                            )
+                _copy(cur, "users", ("id", "name"), user_rows)
+                _copy(cur, "objectives", ("id", "user_id", "title", "period"), obj_rows)
+                _copy(
+                    cur,
+                    "key_results",
+                    ("id", "objective_id", "period", "title", "metric", "progress"),
+                    kr_rows,
+                )
+        counts[0] += len(user_rows)
+        counts[1] += len(obj_rows)
+        counts[2] += len(kr_rows)
+    return counts[0], counts[1], counts[2]
+
+
+def _set_triggers(enabled: bool) -> None:
+    action = sql.SQL("ENABLE" if enabled else "DISABLE")
+    for shard in db.shards:
+        with db.get_conn(shard=shard) as conn:
+            with conn.cursor() as cur:
+                for table in TABLES:
+                    cur.execute(
+                        sql.SQL("ALTER TABLE {} {} TRIGGER USER").format(
+                            sql.Identifier(table), action
+                        )
+                    )
+
+
+def generate(
+    users: int, opts: Options, workers: int = 1, chunk_size: int = 1000
+) -> tuple[int, int, int]:
+    for shard in db.shards:
+        with db.get_conn(transaction=True, shard=shard) as conn:
+            with conn.cursor() as cur:
+                quarter = db.quarter_start(opts.first_period)
+                quarters = []
+                while quarter <= opts.last_period:
+                    quarters.append(quarter)
+                    quarter = db.add_months(quarter, 3)
+                db.ensure_period_partitions(cur, quarters)
+
+    jobs = [
+        (index, min(chunk_size, users - start), opts)
+        for index, start in enumerate(range(0, users, chunk_size))
+    ]
+    totals = [0, 0, 0]
+    _set_triggers(False)
+    try:
+        if workers <= 1:
+            results = [load_chunk(job) for job in jobs]
+        else:
+            # spawned, not forked: children must not share the parent's
+            # pooled connections
+            with multiprocessing.get_context("spawn").Pool(workers) as pool:
+                results = pool.map(load_chunk, jobs)
+        for result in results:
+            totals = [t + r for t, r in zip(totals, result)]
+    finally:
+        _set_triggers(True)
+    return totals[0], totals[1], totals[2]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="generate_data")
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.2)
+    parser.add_argument("--max-objectives", type=int, default=5000)
+    parser.add_argument("--max-key-results", type=int, default=5)
+    parser.add_argument(
+        "--quarters",
+        type=int,
+        default=db.PERIOD_PARTITIONS_AHEAD,
+        help="periods fall between today and the end of this many quarters ahead",
+    )
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    if args.skew <= 0:
+        parser.error("--skew must be positive")
+
+    today = date.today()
+    end = db.add_months(db.quarter_start(today), 3 * (args.quarters + 1))
+    opts = Options(
+        seed=args.seed,
+        skew=args.skew,
+        max_objectives=args.max_objectives,
+        max_key_results=args.max_key_results,
+        first_period=today,
+        last_period=end - timedelta(days=1),
+    )
+    started = time.perf_counter()
+    users, objectives, key_results = generate(
+        args.users, opts, args.workers, args.chunk_size
+    )
+    print(
+        f"{users} users, {objectives} objectives, {key_results} key results "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""Partition upkeep for objectives, key results and progress history.
+
+Run `ensure` regularly (e.g. daily from cron) so the upcoming quarters and
+months have their own partitions before rows arrive (it also drops expired
+idempotency keys). Rows that arrived first, e.g. of an objective set far
+ahead, sit in a default partition: `ensure` moves each such quarter or
+month into a partition of its own, briefly locking the table while it
+does. `archive` detaches the
+partitions of closed quarters into the okr_archive schema, on every shard.
+
+A database from before partitioning or search is upgraded once with
+`migrate`, with the application stopped: it copies every objective and key
+result into the partitioned tables and adds the search columns (rewriting
+every partition), and the application refuses to start until then.
+
+    python -m tools.maintain_partitions migrate
+    python -m tools.maintain_partitions ensure
+    python -m tools.maintain_partitions archive --keep-quarters 4 [--dry-run]
+"""
+
+import argparse
+import re
+import sys
+from datetime import date
+
+from psycopg2 import sql
+
+from app.utils import db
+
+ARCHIVE_SCHEMA = "okr_archive"
+PARTITION_NAME = re.compile(r"^objectives_p(\d{4})q([1-4])$")
+
+ATTACHED_PARTITIONS_SQL = """
+SELECT c.relname AS name
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'objectives'::regclass
+"""
+
+FOREIGN_KEYS_SQL = """
+SELECT conname AS name FROM pg_constraint
+WHERE conrelid = %s::regclass AND contype = 'f'
+"""
+
+
+def ensure(shard: db.Shard) -> None:
+    with db.get_conn(transaction=True, shard=shard) as conn:
+        with conn.cursor() as cur:
+            db.split_default_partitions(cur)
+            db.ensure_period_partitions(cur, db.upcoming_quarters())
+            db.ensure_progress_partitions(cur)
+        conn.commit()
+
+
+def migrate(shard: db.Shard) -> bool:
+    with db.get_conn(transaction=True, shard=shard) as conn:
+        with conn.cursor() as cur:
+            migrated = db.migrate_to_partitioned(cur)
+            searchable = db.add_search_columns(cur)
+        conn.commit()
+    return migrated or searchable
+
+
+def closed_quarters(shard: db.Shard, before: date) -> list[date]:
+    with db.get_conn(shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(ATTACHED_PARTITIONS_SQL)
+            names = [row["name"] for row in cur.fetchall()]
+    quarters = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            quarter = date(int(match[1]), (int(match[2]) - 1) * 3 + 1, 1)
+            if quarter < before:
+                quarters.append(quarter)
+    return sorted(quarters)
+
+
+def _detach(cur, parent: str, quarter: date) -> None:
+    name = db.period_partition_name(parent, quarter)
+    cur.execute(
+        sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+            sql.Identifier(parent), sql.Identifier(name)
+        )
+    )
+    # an archived table stands on its own: it neither blocks deletes of
+    # live rows nor is emptied by them
+    cur.execute(FOREIGN_KEYS_SQL, (name,))
+    for row in cur.fetchall():
+        cur.execute(
+            sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                sql.Identifier(name), sql.Identifier(row["name"])
+            )
+        )
+    cur.execute(
+        sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(
+            sql.Identifier(name), sql.Identifier(ARCHIVE_SCHEMA)
+        )
+    )
+
+
+def archive_quarter(shard: db.Shard, quarter: date) -> None:
+    objectives = db.period_partition_name("objectives", quarter)
+    with db.get_conn(transaction=True, shard=shard) as conn:
+        with conn.cursor() as cur:
+            # the owners' objective lists change: cached ETags must not match
+            cur.execute(
+                sql.SQL(
+                    "UPDATE users SET objectives_version = objectives_version + 1 "
+                    "WHERE id IN (SELECT user_id FROM {})"
+                ).format(sql.Identifier(objectives))
+            )
+            cur.execute(
+                sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(
+                    sql.Identifier(ARCHIVE_SCHEMA)
+                )
+            )
+            # children first: the key results reference the objectives
+            _detach(cur, "key_results", quarter)
+            _detach(cur, "objectives", quarter)
+        conn.commit()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="maintain_partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate")
+    sub.add_parser("ensure")
+    archive = sub.add_parser("archive")
+    archive.add_argument("--keep-quarters", type=int, required=True)
+    archive.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        for index, shard in enumerate(db.shards):
+            done = "migrated" if migrate(shard) else "already up to date"
+            print(f"shard {index}: {done}")
+        return 0
+    if args.command == "ensure":
+        for shard in db.shards:
+            ensure(shard)
+        print(f"{db.purge_idempotency_keys_db()} expired idempotency keys dropped")
+        return 0
+    if args.keep_quarters < 0:
+        parser.error("--keep-quarters must not be negative")
+    before = db.add_months(db.quarter_start(date.today()), -3 * args.keep_quarters)
+    for index, shard in enumerate(db.shards):
+        for quarter in closed_quarters(shard, before):
+            label = db.period_partition_name("objectives", quarter)
+            if not args.dry_run:
+                archive_quarter(shard, quarter)
+            print(
+                f"shard {index}: {label} {'would be ' if args.dry_run else ''}archived"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
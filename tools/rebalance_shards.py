@@ -0,0 +1,309 @@
+"""Offline rebalancing of user buckets between shards.
+
+Stop the application first, then run with the same DB_SHARD_DSNS and
+DB_SHARD_MAP_FILE it uses; restart it afterwards to pick up the new map.
+
+Sharding a populated, until now unsharded database: list it first in
+DB_SHARD_DSNS and run `adopt` before the application starts with the new
+setting. Its existing ids are plain sequence values and are read as bucket
+id % 1024 like any other; by default those buckets would be looked for on
+every shard, so adopt writes a map placing all of them on shard 0. User ids
+are kept. An objective or key result whose bucket is not its owner's would
+be left behind when the owner's bucket moves, so adopt renumbers those the
+way new rows are numbered (above every old id) and writes the old -> new
+ids next to the map, for redirects; stored idempotent responses keep
+quoting the old ones. Then `rebalance` spreads the buckets out.
+
+    python -m tools.rebalance_shards adopt
+    python -m tools.rebalance_shards status
+    python -m tools.rebalance_shards move --to 2 17 18
+    python -m tools.rebalance_shards rebalance [--dry-run]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+
+from psycopg2 import sql
+
+from app.utils import db
+
+# table -> column carrying the bucket; parents first on copy, children
+# first on delete
+TABLES = {
+    "users": "id",
+    "idempotency_keys": "user_id",
+    "objectives": "id",
+    "key_results": "id",
+    "key_result_progress": "key_result_id",
+    "progress_rollups": "key_result_id",
+}
+# generated columns (the search vectors) are recomputed on insert
+COPY_COLUMNS_SQL = """
+SELECT attname AS name FROM pg_attribute
+WHERE attrelid = %s::regclass AND attnum > 0
+    AND NOT attisdropped AND attgenerated = ''
+ORDER BY attnum
+"""
+# rows of an unsharded database numbered apart from their owner, given the
+# id a new row would get; with their history, rollups and key results
+RENUMBER_OBJECTIVES_SQL = """
+CREATE TEMP TABLE renumbered (old BIGINT PRIMARY KEY, new BIGINT NOT NULL)
+    ON COMMIT DROP;
+
+INSERT INTO renumbered
+SELECT id, nextval(pg_get_serial_sequence('objectives', 'id')) * %(buckets)s
+           + mod(user_id, %(buckets)s)
+FROM objectives WHERE mod(id, %(buckets)s) <> mod(user_id, %(buckets)s);
+
+-- copied rather than updated: the key results' foreign key does not follow
+INSERT INTO objectives (id, user_id, title, period)
+SELECT r.new, o.user_id, o.title, o.period
+FROM objectives o JOIN renumbered r ON r.old = o.id;
+UPDATE key_results t SET objective_id = r.new
+FROM renumbered r WHERE t.objective_id = r.old;
+UPDATE key_result_progress t SET objective_id = r.new
+FROM renumbered r WHERE t.objective_id = r.old;
+UPDATE progress_rollups t SET objective_id = r.new
+FROM renumbered r WHERE t.objective_id = r.old;
+DELETE FROM objectives o USING renumbered r WHERE o.id = r.old;
+"""
+RENUMBER_KEY_RESULTS_SQL = """
+CREATE TEMP TABLE renumbered (old BIGINT PRIMARY KEY, new BIGINT NOT NULL)
+    ON COMMIT DROP;
+
+INSERT INTO renumbered
+SELECT id, nextval(pg_get_serial_sequence('key_results', 'id')) * %(buckets)s
+           + mod(objective_id, %(buckets)s)
+FROM key_results WHERE mod(id, %(buckets)s) <> mod(objective_id, %(buckets)s);
+
+UPDATE key_results t SET id = r.new FROM renumbered r WHERE t.id = r.old;
+UPDATE key_result_progress t SET key_result_id = r.new
+FROM renumbered r WHERE t.key_result_id = r.old;
+UPDATE progress_rollups t SET key_result_id = r.new
+FROM renumbered r WHERE t.key_result_id = r.old;
+"""
+# tables whose BIGSERIAL ids embed a shard's sequence value
+ID_TABLES = ("users", "objectives", "key_results")
+
+
+def users_per_bucket(shard: db.Shard) -> dict[int, int]:
+    with db.get_conn(shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT mod(id, %s) AS bucket, count(*) AS n FROM users GROUP BY 1",
+                (db.ID_BUCKETS,),
+            )
+            return {row["bucket"]: row["n"] for row in cur.fetchall()}
+
+
+def save_map(path: str) -> None:
+    # every bucket is written out so that changing DB_SHARD_DSNS later does
+    # not silently move buckets whose default placement would change
+    placement = {str(b): db.shard_index(b) for b in range(db.ID_BUCKETS)}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(placement, fh)
+    os.replace(tmp, path)
+
+
+def renumber_path(path: str) -> str:
+    return f"{path}.renumbered.json"
+
+
+def renumber_legacy_ids(shard: db.Shard) -> dict[str, dict[int, int]]:
+    # idempotent: rows already in their owner's bucket are left alone
+    renumbered = {}
+    with db.get_conn(transaction=True, shard=shard) as conn:
+        with conn.cursor() as cur:
+            # a copied objective is not a new one, and history is not
+            # rewritten by anything but this
+            for table in ("objectives", "key_result_progress"):
+                cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+            for table, statements in (
+                ("objectives", RENUMBER_OBJECTIVES_SQL),
+                ("key_results", RENUMBER_KEY_RESULTS_SQL),
+            ):
+                cur.execute(statements, {"buckets": db.ID_BUCKETS})
+                cur.execute("SELECT old, new FROM renumbered")
+                renumbered[table] = {row["old"]: row["new"] for row in cur.fetchall()}
+                cur.execute("DROP TABLE renumbered")
+            for table in ("objectives", "key_result_progress"):
+                cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+    return renumbered
+
+
+def adopt(path: str) -> dict[str, dict[int, int]]:
+    # every bucket on shard 0, where the data of the unsharded database is
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    renumbered = renumber_legacy_ids(db.shards[0])
+    tmp = f"{renumber_path(path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(renumbered, fh)
+    os.replace(tmp, renumber_path(path))
+    db.shard_map.update({bucket: 0 for bucket in range(db.ID_BUCKETS)})
+    save_map(path)
+    return renumbered
+
+
+def align_sequences() -> None:
+    # ids embed their shard's sequence value, so after a move every shard
+    # must draw above anything any other shard has handed out
+    for table in ID_TABLES:
+        tops = []
+        for shard in db.shards:
+            with db.get_conn(shard=shard) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT coalesce(last_value, 0) AS top FROM pg_sequences
+                        WHERE format('%%I.%%I', schemaname, sequencename)
+                            = pg_get_serial_sequence(%s, 'id')
+                        """,
+                        (table,),
+                    )
+                    tops.append(cur.fetchone()["top"])
+        for shard in db.shards:
+            with db.get_conn(shard=shard) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                        (table, max(max(tops), 1)),
+                    )
+
+
+def _in_bucket(column: str, bucket: int) -> sql.Composable:
+    return sql.SQL("mod({}, {}) = {}").format(
+        sql.Identifier(column), sql.Literal(db.ID_BUCKETS), sql.Literal(bucket)
+    )
+
+
+def move_bucket(bucket: int, target: int, map_path: str) -> int:
+    source = db.shard_index(bucket)
+    if source == target:
+        return 0
+    moved = 0
+    with db.get_conn(transaction=True, shard=db.shards[source]) as src:
+        with db.get_conn(transaction=True, shard=db.shards[target]) as dst:
+            with src.cursor() as out, dst.cursor() as into:
+                for table, column in TABLES.items():
+                    name = sql.Identifier(table)
+                    out.execute(COPY_COLUMNS_SQL, (table,))
+                    columns = sql.SQL(", ").join(
+                        sql.Identifier(row["name"]) for row in out.fetchall()
+                    )
+                    buf = io.StringIO()
+                    out.copy_expert(
+                        sql.SQL("COPY (SELECT {} FROM {} WHERE {}) TO STDOUT")
+                        .format(columns, name, _in_bucket(column, bucket))
+                        .as_string(src),
+                        buf,
+                    )
+                    buf.seek(0)
+                    # rows are moved, not written: no change events, no
+                    # second copy of their progress history
+                    into.execute(
+                        sql.SQL("ALTER TABLE {} DISABLE TRIGGER USER").format(name)
+                    )
+                    into.copy_expert(
+                        sql.SQL("COPY {} ({}) FROM STDIN")
+                        .format(name, columns)
+                        .as_string(dst),
+                        buf,
+                    )
+                    moved += into.rowcount
+                    into.execute(
+                        sql.SQL("ALTER TABLE {} ENABLE TRIGGER USER").format(name)
+                    )
+        # the copy is committed before the map points at it, and the map is
+        # written before the source rows go: a crash leaves duplicates
+        # (re-run the move), never a bucket without rows
+        db.shard_map[bucket] = target
+        save_map(map_path)
+        with src.cursor() as cur:
+            for table, column in reversed(TABLES.items()):
+                name = sql.Identifier(table)
+                # the progress history refuses deletes; these rows live on
+                cur.execute(sql.SQL("ALTER TABLE {} DISABLE TRIGGER USER").format(name))
+                cur.execute(
+                    sql.SQL("DELETE FROM {} WHERE {}").format(
+                        name, _in_bucket(column, bucket)
+                    )
+                )
+                cur.execute(sql.SQL("ALTER TABLE {} ENABLE TRIGGER USER").format(name))
+    align_sequences()
+    return moved
+
+
+def plan_moves(counts: list[dict[int, int]]) -> list[tuple[int, int]]:
+    # greedy: repeatedly move the largest bucket that still narrows the gap
+    # between the fullest and the emptiest shard
+    counts = [dict(c) for c in counts]
+    load = [sum(c.values()) for c in counts]
+    moves: list[tuple[int, int]] = []
+    while True:
+        hi = max(range(len(load)), key=load.__getitem__)
+        lo = min(range(len(load)), key=load.__getitem__)
+        gap = load[hi] - load[lo]
+        fits = [(n, b) for b, n in counts[hi].items() if 0 < n < gap]
+        if not fits:
+            return moves
+        n, bucket = max(fits)
+        counts[lo][bucket] = counts[hi].pop(bucket)
+        load[hi] -= n
+        load[lo] += n
+        moves.append((bucket, lo))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="rebalance_shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    sub.add_parser("adopt")
+    move = sub.add_parser("move")
+    move.add_argument("--to", type=int, required=True)
+    move.add_argument("buckets", type=int, nargs="+")
+    rebalance = sub.add_parser("rebalance")
+    rebalance.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if db.ID_BUCKETS == 1:
+        parser.error("DB_SHARD_DSNS is not set")
+    counts = [users_per_bucket(shard) for shard in db.shards]
+    if args.command == "status":
+        for index, per_bucket in enumerate(counts):
+            print(
+                f"shard {index}: {len(per_bucket)} buckets, {sum(per_bucket.values())} users"
+            )
+        return 0
+    if not db.DB_SHARD_MAP_FILE:
+        parser.error("DB_SHARD_MAP_FILE is not set")
+    if args.command == "adopt":
+        try:
+            renumbered = adopt(db.DB_SHARD_MAP_FILE)
+        except FileExistsError as exc:
+            parser.error(str(exc))
+        for table, ids in renumbered.items():
+            print(f"{table}: {len(ids)} renumbered")
+        print(f"all {db.ID_BUCKETS} buckets placed on shard 0")
+        return 0
+    if args.command == "move":
+        if not 0 <= args.to < len(db.shards):
+            parser.error(f"--to must be below {len(db.shards)}")
+        moves = [(bucket, args.to) for bucket in args.buckets]
+    else:
+        moves = plan_moves(counts)
+    for bucket, target in moves:
+        if args.command == "rebalance" and args.dry_run:
+            print(f"bucket {bucket}: shard {db.shard_index(bucket)} -> {target}")
+            continue
+        rows = move_bucket(bucket, target, db.DB_SHARD_MAP_FILE)
+        print(f"bucket {bucket}: moved {rows} rows to shard {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))